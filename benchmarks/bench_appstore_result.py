@@ -0,0 +1,68 @@
+"""Memory and active subscription lookups, raw verifyReceipt dicts vs AppStoreValidationResult.
+
+Usage: python -m benchmarks.bench_appstore_result [transactions] [lookups]
+"""
+import json
+import sys
+import time
+import tracemalloc
+
+from inapppy.appstore import AppStoreValidationResult
+
+from .bench_appstore_streaming import make_response_body
+
+
+def retained_memory(build) -> tuple:
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def active_subscription_dicts(response: dict, product_id: str, at_ms: int):
+    # what callers do with the raw response
+    active = None
+    for transaction in response["latest_receipt_info"]:
+        if transaction["product_id"] != product_id or transaction.get("cancellation_date_ms"):
+            continue
+        if int(transaction["purchase_date_ms"]) <= at_ms < int(transaction["expires_date_ms"]):
+            if active is None or int(transaction["expires_date_ms"]) > int(active["expires_date_ms"]):
+                active = transaction
+    return active
+
+
+def main(transactions: int = 5000, lookups: int = 1000) -> None:
+    body = make_response_body(transactions)
+    product_id = "com.example.app.subscription.monthly"
+    now_ms = int(time.time() * 1000)
+
+    def parse():
+        response = json.loads(body)
+        # the raw dict keeps the history twice, the typed result keeps latest_receipt_info only
+        del response["latest_receipt"], response["receipt"]["in_app"]
+        return response
+
+    response, dict_size = retained_memory(parse)
+    result, result_size = retained_memory(lambda: AppStoreValidationResult.from_response(parse()))
+    print(f"{transactions} transactions")
+    print(f"{'dicts':>8}: {dict_size / 2 ** 20:8.2f} MiB retained")
+    print(f"{'typed':>8}: {result_size / 2 ** 20:8.2f} MiB retained")
+
+    started = time.perf_counter()
+    for _ in range(lookups):
+        active_subscription_dicts(response, product_id, now_ms)
+    print(f"{'dicts':>8}: {(time.perf_counter() - started) / lookups * 1e6:10.1f} us/lookup")
+
+    started = time.perf_counter()
+    for _ in range(lookups):
+        result.active_subscription(product_id, now_ms)
+    print(f"{'typed':>8}: {(time.perf_counter() - started) / lookups * 1e6:10.1f} us/lookup")
+
+    started = time.perf_counter()
+    AppStoreValidationResult.from_response(response)
+    print(f"conversion: {(time.perf_counter() - started) * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
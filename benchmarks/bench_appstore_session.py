@@ -0,0 +1,38 @@
+"""AppStoreValidator latency with a new connection per receipt vs a reused pooled session.
+
+Usage: python -m benchmarks.bench_appstore_session [requests] [latency_seconds]
+"""
+import sys
+import time
+
+import requests
+
+from inapppy import AppStoreValidator
+
+from .stubs import StubServer, VerifyReceiptHandler
+
+
+def run(validator: AppStoreValidator, total: int) -> float:
+    started = time.perf_counter()
+    for _ in range(total):
+        validator.validate("receipt")
+    return (time.perf_counter() - started) / total
+
+
+def main(total: int = 500, latency: float = 0.0) -> None:
+    with StubServer(VerifyReceiptHandler, latency=latency) as server:
+        # The requests module itself posts on a fresh connection each call, like post_json used to.
+        validators = {
+            "connection per call": AppStoreValidator(http_session=requests),
+            "pooled session": AppStoreValidator(),
+        }
+        for name, validator in validators.items():
+            with validator:
+                validator.PRODUCTION_URL = server.url
+                validator._change_url_by_sandbox()
+                print(f"{name:>20}: {run(validator, total) * 1e3:8.3f} ms/receipt")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:3]
+    main(*(cast(arg) for cast, arg in zip((int, float), args)))
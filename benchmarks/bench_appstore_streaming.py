@@ -0,0 +1,89 @@
+"""Peak memory of AppStoreValidator.validate on long receipt histories, full decode vs streaming decode.
+
+Usage: python -m benchmarks.bench_appstore_streaming [transactions ...]
+"""
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+
+from inapppy import AppStoreValidator
+from inapppy.asyncio import AppStoreValidator as AsyncAppStoreValidator
+
+from .stubs import StubServer, VerifyReceiptHandler
+
+
+def make_response_body(transactions: int) -> bytes:
+    now_ms = int(time.time() * 1000)
+    history = [
+        {
+            "quantity": "1",
+            "product_id": "com.example.app.subscription.monthly",
+            "transaction_id": str(100000000000000 + i),
+            "original_transaction_id": str(100000000000000 + i % 3),
+            "purchase_date_ms": str(now_ms - (transactions - i) * 3600 * 1000),
+            "expires_date_ms": str(now_ms - (transactions - i - 24 * 30) * 3600 * 1000),
+            "web_order_line_item_id": str(200000000000000 + i),
+            "is_trial_period": "false",
+            "is_in_intro_offer_period": "false",
+        }
+        for i in range(transactions)
+    ]
+    response = {
+        "status": 0,
+        "environment": "Production",
+        "receipt": {"bundle_id": "com.example.app", "in_app": history},
+        "latest_receipt_info": history,
+        # the base64 receipt grows with the history as well
+        "latest_receipt": "M" * (transactions * 600),
+    }
+    return json.dumps(response).encode()
+
+
+def peak_memory(validate) -> int:
+    tracemalloc.start()
+    validate()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def measure_sync(url: str, **options) -> int:
+    with AppStoreValidator(**options) as validator:
+        validator.PRODUCTION_URL = url
+        validator.validate("receipt")  # warm up the connection
+        return peak_memory(lambda: validator.validate("receipt"))
+
+
+def measure_async(url: str, **options) -> int:
+    async def measure():
+        async with AsyncAppStoreValidator(**options) as validator:
+            validator.PRODUCTION_URL = url
+            await validator.validate("receipt")
+
+            tracemalloc.start()
+            await validator.validate("receipt")
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return peak
+
+    return asyncio.run(measure())
+
+
+def main(*sizes: int) -> None:
+    streaming = {"stream_response": True, "keep_transactions": 1, "drop_latest_receipt": True}
+
+    for transactions in sizes or (1000, 10000, 50000):
+        body = make_response_body(transactions)
+        with StubServer(VerifyReceiptHandler, response_body=body) as server:
+            url = server.url + "verifyReceipt"
+            print(f"{transactions} transactions, {len(body) / 2 ** 20:.1f} MiB response")
+            for name, measure in (("requests", measure_sync), ("aiohttp", measure_async)):
+                full = measure(url)
+                streamed = measure(url, **streaming)
+                print(f"  {name:>8}: full {full / 2 ** 20:8.2f} MiB peak, streaming {streamed / 2 ** 20:8.2f} MiB peak")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,77 @@
+"""Latency of a new GooglePlayVerifier's first verification, with and without the shared token cache.
+
+Every run builds a verifier from a keyfile on disk, like a short-lived worker or a per-request verifier.
+Usage: python -m benchmarks.bench_google_cold_start [runs] [latency_seconds]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+import rsa
+
+from inapppy import GooglePlayVerifier, credentials
+from inapppy.credentials import FileTokenCache, TokenCache
+
+from .stubs import OAuthAndroidPublisherHandler, StubServer, androidpublisher_document
+
+
+def forget_credentials() -> None:
+    """Drops the parsed keyfiles and private keys, like a new process."""
+    credentials._keyfiles.clear()
+    credentials._service_accounts.clear()
+
+
+def run(keyfile: str, document: dict, runs: int, token_cache_factory, new_process: bool) -> float:
+    elapsed = 0.0
+    for _ in range(runs):
+        if new_process:
+            forget_credentials()
+
+        started = time.perf_counter()
+        verifier = GooglePlayVerifier(
+            "com.example.app", keyfile, discovery_document=document, token_cache=token_cache_factory()
+        )
+        verifier.verify("purchase-token", "product-sku")
+        elapsed += time.perf_counter() - started
+        verifier.http.close()
+    return elapsed / runs
+
+
+def main(runs: int = 50, latency: float = 0.02) -> None:
+    _, private_key = rsa.newkeys(2048)
+
+    with StubServer(OAuthAndroidPublisherHandler, latency=latency) as server, tempfile.TemporaryDirectory() as tmp:
+        keyfile = os.path.join(tmp, "credentials.json")
+        with open(keyfile, "w") as file:
+            json.dump(
+                {
+                    "type": "service_account",
+                    "client_email": "verifier@example.iam.gserviceaccount.com",
+                    "private_key_id": "1",
+                    "private_key": private_key.save_pkcs1().decode(),
+                    "token_uri": server.url + "token",
+                },
+                file,
+            )
+        document = androidpublisher_document(server.url)
+
+        shared = TokenCache()
+        file_cache_dir = os.path.join(tmp, "tokens")
+        cases = {
+            # nothing cached: keyfile read, private key parsed and a token minted per verifier.
+            "uncached": (TokenCache, True),
+            "shared in memory": (lambda: shared, False),
+            "file backed, new process": (lambda: FileTokenCache(file_cache_dir), True),
+        }
+        for name, (factory, new_process) in cases.items():
+            before = server.httpd.token_requests
+            latency_ms = run(keyfile, document, runs, factory, new_process) * 1e3
+            tokens = server.httpd.token_requests - before
+            print(f"{name:>26}: {latency_ms:8.2f} ms to first verification, {tokens} token requests")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:3]
+    main(*(cast(arg) for cast, arg in zip((int, float), args)))
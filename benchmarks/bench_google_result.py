@@ -0,0 +1,57 @@
+"""GoogleVerificationResult creation cost and memory, eager datetime evaluation vs lazy slotted results.
+
+Usage: python -m benchmarks.bench_google_result [results]
+"""
+import datetime
+import sys
+import time
+import tracemalloc
+
+from inapppy.googleplay import GooglePlayVerifier
+
+
+class EagerResult:
+    """The previous result class, evaluated with datetimes when created."""
+
+    def __init__(self, raw_response: dict, is_expired: bool, is_canceled: bool):
+        self.raw_response = raw_response
+        self.is_expired = is_expired
+        self.is_canceled = is_canceled
+
+
+def eager_result(response: dict) -> EagerResult:
+    now = datetime.datetime.utcnow()
+    expiry = int(response.get("expiryTimeMillis", 0)) / 1000
+    is_expired = not expiry or datetime.datetime.utcfromtimestamp(expiry) < now
+    return EagerResult(response, is_expired, int(response.get("cancelReason", 0)) != 0)
+
+
+def measure(name: str, make, responses: list) -> None:
+    tracemalloc.start()
+    results = [make(response) for response in responses]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    results = [make(response) for response in responses]
+    elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    expired = sum(result.is_expired for result in results)
+    read = time.perf_counter() - started
+    print(
+        f"{name:>6}: create {elapsed / len(results) * 1e9:8.1f} ns, "
+        f"is_expired {read / len(results) * 1e9:8.1f} ns, {size / len(results):6.1f} bytes/result ({expired} expired)"
+    )
+
+
+def main(count: int = 1000000) -> None:
+    now_ms = int(time.time() * 1000)
+    responses = [{"expiryTimeMillis": str(now_ms + (i % 7 - 3) * 86400000), "autoRenewing": True} for i in range(count)]
+
+    measure("eager", eager_result, responses)
+    measure("lazy", lambda response: GooglePlayVerifier._verification_result(response, True), responses)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,28 @@
+"""Per-call overhead of building the androidpublisher service vs reusing the cached one.
+
+Usage: python -m benchmarks.bench_google_service [iterations]
+"""
+import sys
+import timeit
+from unittest.mock import patch
+
+import httplib2
+
+from inapppy import GooglePlayVerifier, googleplay
+
+
+def main(iterations: int = 200) -> None:
+    http = httplib2.Http()
+    with patch.object(GooglePlayVerifier, "_authorize", return_value=http):
+        verifier = GooglePlayVerifier("com.example.app", "unused")
+
+    per_call = timeit.timeit(lambda: googleplay.build("androidpublisher", "v3", http=http), number=iterations)
+    verifier.service  # warm up
+    cached = timeit.timeit(lambda: verifier.service, number=iterations)
+
+    print(f"build per call: {per_call / iterations * 1e6:10.1f} us/call")
+    print(f"cached service: {cached / iterations * 1e6:10.1f} us/call")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
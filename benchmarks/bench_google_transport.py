@@ -0,0 +1,55 @@
+"""Multi-threaded GooglePlayVerifier throughput: shared httplib2 (serialized) vs pooled transport.
+
+Usage: python -m benchmarks.bench_google_transport [requests] [threads] [latency_seconds]
+"""
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
+
+from inapppy import GooglePlayVerifier
+from inapppy.googleplay import PooledHttp
+
+from .stubs import AndroidPublisherHandler, StubServer, androidpublisher_document
+
+
+class LockedHttp:
+    """httplib2.Http is not thread-safe, so sharing it means serializing every call."""
+
+    def __init__(self) -> None:
+        self.http = httplib2.Http()
+        self.lock = threading.Lock()
+
+    def request(self, *args, **kwargs):
+        with self.lock:
+            return self.http.request(*args, **kwargs)
+
+
+def run(verifier: GooglePlayVerifier, total: int, threads: int) -> float:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda i: verifier.verify(f"token-{i}", "sku"), range(total)))
+    return total / (time.perf_counter() - started)
+
+
+def main(total: int = 2000, threads: int = 16, latency: float = 0.005) -> None:
+    with StubServer(AndroidPublisherHandler, latency=latency) as server:
+        document = androidpublisher_document(server.url)
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(pool_maxsize=threads))
+        transports = {
+            "httplib2 (serialized)": LockedHttp(),
+            "pooled": PooledHttp(session),
+        }
+        for name, http in transports.items():
+            verifier = GooglePlayVerifier("com.example.app", {}, discovery_document=document, http=http)
+            print(f"{name:>22}: {run(verifier, total, threads):10.1f} verifications/sec")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:4]
+    main(*(cast(arg) for cast, arg in zip((int, int, float), args)))
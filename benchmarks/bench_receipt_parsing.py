@@ -0,0 +1,67 @@
+"""GooglePlayValidator.validate throughput on large receipts, by input type and json parser.
+
+Usage: python -m benchmarks.bench_receipt_parsing [seconds_per_case] [items_per_receipt]
+"""
+import base64
+import json
+import sys
+import time
+
+import rsa
+
+from inapppy import GooglePlayValidator, fastjson
+
+from .bench_signature import public_api_key
+
+
+def make_large_receipt(private_key: rsa.PrivateKey, items: int) -> tuple:
+    receipt = json.dumps(
+        {
+            "orderId": "GPA.3312-5178-9012-34567",
+            "packageName": "com.example.app",
+            "productId": "com.example.app.bundle",
+            "purchaseTime": 1553000000000,
+            "purchaseState": 0,
+            "purchaseToken": "opaque-token-" + "x" * 140,
+            "developerPayload": json.dumps(
+                [{"sku": f"com.example.app.item{i}", "quantity": 1, "price_micros": 990000} for i in range(items)]
+            ),
+            "lineItems": [{"productId": f"com.example.app.item{i}", "quantity": 1} for i in range(items)],
+        }
+    ).encode()
+    signature = base64.standard_b64encode(rsa.sign(receipt, private_key, "SHA-256")).decode()
+    return receipt, signature
+
+
+def run(validator: GooglePlayValidator, receipt, signature: str, seconds: float) -> float:
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        validator.validate(receipt, signature)
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main(seconds: float = 1.0, items: int = 200) -> None:
+    public_key, private_key = rsa.newkeys(2048)
+    api_key = public_api_key(public_key)
+    receipt, signature = make_large_receipt(private_key, items)
+    print(f"receipt size: {len(receipt)} bytes")
+
+    orjson = fastjson.orjson
+    for parser in ("json", "orjson"):
+        if parser == "orjson" and orjson is None:
+            print("orjson is not installed")
+            continue
+        fastjson.orjson = orjson if parser == "orjson" else None
+
+        validator = GooglePlayValidator("com.example.app", api_key)
+        for name, data in (("str", receipt.decode()), ("bytes", receipt), ("memoryview", memoryview(receipt))):
+            rate = run(validator, data, signature, seconds)
+            print(f"{parser:>6} {name:>10}: {rate:10.1f} validations/sec")
+
+    fastjson.orjson = orjson
+
+
+if __name__ == "__main__":
+    main(*(float(arg) for arg in sys.argv[1:2]), *(int(arg) for arg in sys.argv[2:3]))
@@ -0,0 +1,65 @@
+"""GooglePlayValidator signature verifications per second for each signature backend.
+
+Usage: python -m benchmarks.bench_signature [seconds_per_backend]
+"""
+import base64
+import json
+import sys
+import time
+
+import rsa
+
+from inapppy import GooglePlayValidator
+from inapppy.signature import CryptographySignatureBackend, RsaSignatureBackend, load_pem_public_key
+
+
+def make_receipt(private_key: rsa.PrivateKey) -> tuple:
+    receipt = json.dumps(
+        {
+            "orderId": "GPA.3312-5178-9012-34567",
+            "packageName": "com.example.app",
+            "productId": "com.example.app.subscription.monthly",
+            "purchaseTime": 1553000000000,
+            "purchaseState": 0,
+            "purchaseToken": "opaque-token-" + "x" * 140,
+            "autoRenewing": True,
+            "acknowledged": False,
+        }
+    )
+    signature = base64.standard_b64encode(rsa.sign(receipt.encode(), private_key, "SHA-1")).decode()
+    return receipt, signature
+
+
+def public_api_key(public_key: rsa.PublicKey) -> str:
+    """Google Play style api key: base64 encoded X.509 SubjectPublicKeyInfo."""
+    from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicNumbers
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+    key = RSAPublicNumbers(public_key.e, public_key.n).public_key()
+    return base64.standard_b64encode(key.public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo)).decode()
+
+
+def run(validator: GooglePlayValidator, receipt: str, signature: str, seconds: float) -> float:
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        validator.validate(receipt, signature)
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main(seconds: float = 2.0) -> None:
+    if load_pem_public_key is None:
+        sys.exit("cryptography is required to compare backends")
+
+    public_key, private_key = rsa.newkeys(2048)
+    api_key = public_api_key(public_key)
+    receipt, signature = make_receipt(private_key)
+
+    for backend in (RsaSignatureBackend, CryptographySignatureBackend):
+        validator = GooglePlayValidator("com.example.app", api_key, signature_backend=backend)
+        print(f"{backend.name:>12}: {run(validator, receipt, signature, seconds):10.1f} verifications/sec")
+
+
+if __name__ == "__main__":
+    main(*(float(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,38 @@
+"""GooglePlayValidator.validate_batch throughput, serial vs a growing number of worker processes.
+
+Usage: python -m benchmarks.bench_validate_batch [receipts]
+"""
+import sys
+import time
+
+import rsa
+
+from inapppy import GooglePlayValidator
+from inapppy.signature import RsaSignatureBackend
+
+from .bench_signature import make_receipt, public_api_key
+
+
+def main(count: int = 20000) -> None:
+    public_key, private_key = rsa.newkeys(2048)
+    receipt, signature = make_receipt(private_key)
+    receipts = [(receipt, signature)] * count
+
+    # the pure python backend is where cpu bound verification hurts the most.
+    api_key = public_api_key(public_key)
+    validator = GooglePlayValidator("com.example.app", api_key, signature_backend=RsaSignatureBackend)
+
+    started = time.perf_counter()
+    for item in receipts:
+        validator.validate(*item)
+    print(f"{'serial':>10}: {count / (time.perf_counter() - started):10.1f} verifications/sec")
+
+    for workers in (1, 2, 4):
+        started = time.perf_counter()
+        for result in validator.validate_batch(iter(receipts), workers=workers):
+            assert result.ok
+        print(f"{workers:>2} workers: {count / (time.perf_counter() - started):10.1f} verifications/sec")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
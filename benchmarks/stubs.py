@@ -0,0 +1,207 @@
+"""Local stub servers used by the benchmarks."""
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+ANDROIDPUBLISHER_PATH = re.compile(
+    r"^/androidpublisher/v3/applications/(?P<package>[^/]+)/purchases/"
+    r"(?P<kind>products|subscriptions)/(?P<sku>[^/]+)/tokens/(?P<token>[^/?]+)"
+)
+
+
+class ErrorMix:
+    """Picks the outcome of each stub response: None for success, or the name of an error.
+
+    errors maps names to the fraction of responses failing that way, e.g. {"21005": 0.01, "http_503": 0.02}.
+    Numeric names are verifyReceipt statuses, http_<code> are HTTP errors. Picks are seeded, so reproducible.
+    """
+
+    def __init__(self, errors: Dict[str, float] = None, seed: int = 0) -> None:
+        self.errors = dict(errors or {})
+        if sum(self.errors.values()) > 1:
+            raise ValueError("error fractions add up to more than 1")
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def pick(self) -> Optional[str]:
+        if not self.errors:
+            return None
+
+        with self._lock:
+            value = self._random.random()
+        for name, fraction in self.errors.items():
+            if value < fraction:
+                return name
+            value -= fraction
+        return None
+
+
+def http_status(error: str) -> Optional[int]:
+    return int(error[5:]) if error.startswith("http_") else None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes, avoid delayed-ACK stalls on keep-alive.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+    def send_json(self, status: int, payload: dict) -> None:
+        self.send_body(status, json.dumps(payload).encode())
+
+    def send_body(self, status: int, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class AndroidPublisherHandler(StubHandler):
+    def do_GET(self):  # noqa: N802
+        time.sleep(self.server.latency)
+
+        match = ANDROIDPUBLISHER_PATH.match(self.path)
+        error = self.server.error_mix.pick()
+        status = http_status(error) if error is not None else None
+        if match is None:
+            self.send_json(404, {"error": {"code": 404, "message": "Not found"}})
+        elif status is not None:
+            self.send_json(status, {"error": {"code": status, "message": error}})
+        elif match.group("kind") == "subscriptions":
+            expiry = int(time.time() * 1000) + 3600 * 1000
+            self.send_json(
+                200,
+                {
+                    "kind": "androidpublisher#subscriptionPurchase",
+                    "expiryTimeMillis": str(expiry),
+                    "developerPayload": self.server.padding,
+                },
+            )
+        else:
+            self.send_json(
+                200,
+                {
+                    "kind": "androidpublisher#productPurchase",
+                    "purchaseState": 0,
+                    "developerPayload": self.server.padding,
+                },
+            )
+
+
+class OAuthAndroidPublisherHandler(AndroidPublisherHandler):
+    """androidpublisher plus an oauth2 token endpoint at /token, tokens cost token_latency seconds."""
+
+    def do_POST(self):  # noqa: N802
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.token_latency)
+        self.server.token_requests += 1
+        self.send_json(200, {"access_token": f"token-{self.server.token_requests}", "expires_in": 3600})
+
+
+class VerifyReceiptHandler(StubHandler):
+    def do_POST(self):  # noqa: N802
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.latency)
+        error = self.server.error_mix.pick()
+        if self.server.response_body is not None:
+            self.send_body(200, self.server.response_body)
+        elif error is None:
+            self.send_json(
+                200,
+                {
+                    "status": 0,
+                    "environment": "Production",
+                    "receipt": {"in_app": []},
+                    "latest_receipt": self.server.padding,
+                },
+            )
+        elif http_status(error) is not None:
+            self.send_json(http_status(error), {})
+        else:
+            self.send_json(200, {"status": int(error)})
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    # the default listen backlog of 5 overflows with concurrent clients, dropped connections are
+    # retried after a second and the results would measure that instead of the validators.
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class StubServer:
+    """Runs a threaded HTTP server in a background thread."""
+
+    def __init__(
+        self,
+        handler,
+        latency: float = 0.0,
+        response_body: bytes = None,
+        payload_size: int = 0,
+        errors: Dict[str, float] = None,
+    ) -> None:
+        self.httpd = StubHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.latency = latency
+        # Pre-encoded response of handlers that support it, sent as is.
+        self.httpd.response_body = response_body
+        # Filler added to successful responses, e.g. latest_receipt, to grow them by payload_size bytes.
+        self.httpd.padding = "x" * payload_size
+        self.httpd.error_mix = ErrorMix(errors)
+        self.httpd.token_latency = latency
+        self.httpd.token_requests = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _serve(handler, options: dict, urls, stop) -> None:
+    with StubServer(handler, **options) as server:
+        urls.put(server.url)
+        stop.wait()
+
+
+class StubProcess:
+    """A StubServer in a child process, so the server's CPU time and memory are not the client's."""
+
+    def __init__(self, handler, **options) -> None:
+        context = multiprocessing.get_context("spawn")
+        self._urls = context.Queue()
+        self._stop = context.Event()
+        self.process = context.Process(target=_serve, args=(handler, options, self._urls, self._stop), daemon=True)
+        self.url = None
+
+    def __enter__(self):
+        self.process.start()
+        self.url = self._urls.get(timeout=30)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self.process.join(timeout=10)
+
+
+def androidpublisher_document(root_url: str) -> dict:
+    """androidpublisher v3 discovery document pointed at the given root url."""
+    from googleapiclient.discovery_cache import get_static_doc
+
+    document = json.loads(get_static_doc("androidpublisher", "v3"))
+    document["rootUrl"] = root_url
+    return document
@@ -0,0 +1,378 @@
+"""Throughput, latency, CPU and memory of every validator, against local stub servers.
+
+Each target runs in sync (one call at a time), threaded (a thread pool sharing the validator) and
+asyncio (the inapppy.asyncio validators) modes. Every run happens in a fresh process, so peak memory
+and CPU time are those of the run alone, stub servers run in processes of their own.
+
+    appstore              AppStoreValidator against a verifyReceipt stub
+    googleplay-verifier   GooglePlayVerifier against an androidpublisher + oauth2 token stub
+    googleplay-validator  GooglePlayValidator, local signature verification (no asyncio version)
+
+Results are written as JSON, --compare prints the change against an earlier results file and
+exits with status 1 when throughput or p99 latency regressed past --tolerance.
+
+Usage: python -m benchmarks.suite [--requests 2000] [--latency 0.005] [--errors 21005=0.01,http_503=0.01]
+                                  [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from typing import Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+TARGETS = ("appstore", "googleplay-verifier", "googleplay-validator")
+MODES = ("sync", "threaded", "asyncio")
+# distinct receipts or purchase tokens, cycled through by the runs.
+DISTINCT_ITEMS = 64
+
+
+def parse_errors(value: str) -> Dict[str, float]:
+    """'21005=0.01,http_503=0.02' -> {'21005': 0.01, 'http_503': 0.02}"""
+    errors = {}
+    for part in filter(None, value.split(",")):
+        name, _, fraction = part.partition("=")
+        errors[name.strip()] = float(fraction)
+    return errors
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def peak_rss_mib() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def timed(call: Callable, latencies: list) -> Callable:
+    def run(item) -> bool:
+        started = time.perf_counter()
+        try:
+            call(item)
+            return True
+        except Exception:
+            return False
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    return run
+
+
+def run_blocking(call: Callable, items: list, mode: str, concurrency: int) -> dict:
+    latencies = []
+    run = timed(call, latencies)
+    wall_started, cpu_started = time.perf_counter(), time.process_time()
+    if mode == "sync":
+        outcomes = [run(item) for item in items]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(run, items))
+    wall, cpu = time.perf_counter() - wall_started, time.process_time() - cpu_started
+    return summarize(latencies, outcomes.count(False), wall, cpu)
+
+
+async def run_async(call: Callable, items: list, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await call(item)
+            except Exception:
+                errors += 1
+            finally:
+                latencies.append(time.perf_counter() - started)
+
+    wall_started, cpu_started = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(run(item) for item in items))
+    wall, cpu = time.perf_counter() - wall_started, time.process_time() - cpu_started
+    return summarize(latencies, errors, wall, cpu)
+
+
+def summarize(latencies: List[float], errors: int, wall: float, cpu: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": wall,
+        "rps": len(latencies) / wall if wall else None,
+        "latency_ms": {
+            "mean": sum(ordered) / len(ordered) * 1e3 if ordered else None,
+            "p50": percentile(ordered, 0.5) * 1e3 if ordered else None,
+            "p90": percentile(ordered, 0.9) * 1e3 if ordered else None,
+            "p99": percentile(ordered, 0.99) * 1e3 if ordered else None,
+            "max": ordered[-1] * 1e3 if ordered else None,
+        },
+        "cpu_seconds": cpu,
+        "cpu_percent": cpu / wall * 100 if wall else None,
+        "peak_rss_mib": peak_rss_mib(),
+    }
+
+
+# Scenarios return the items to validate and their blocking and asyncio runs. Validators are set up
+# and warmed up (connections, access token, discovery document) before the measured run starts.
+
+
+def appstore(config: dict) -> tuple:
+    from inapppy import AppStoreValidator
+    from inapppy.asyncio import AppStoreValidator as AsyncAppStoreValidator
+
+    url = config["urls"]["appstore"]
+    items = [f"receipt-{i % DISTINCT_ITEMS}" for i in range(config["requests"])]
+
+    def blocking(items: list, mode: str, concurrency: int) -> dict:
+        with AppStoreValidator(pool_maxsize=concurrency) as validator:
+            validator.PRODUCTION_URL = url
+            validator._change_url_by_sandbox()
+            with suppress(Exception):  # the stub may answer with an error from the mix
+                validator.validate("warm-up")
+            return run_blocking(validator.validate, items, mode, concurrency)
+
+    async def asynchronous(items: list, concurrency: int) -> dict:
+        async with AsyncAppStoreValidator(connection_limit=concurrency) as validator:
+            validator.PRODUCTION_URL = url
+            validator._change_url_by_sandbox()
+            with suppress(Exception):
+                await validator.validate("warm-up")
+            return await run_async(validator.validate, items, concurrency)
+
+    return items, blocking, asynchronous
+
+
+def googleplay_verifier(config: dict) -> tuple:
+    from inapppy import GooglePlayVerifier
+    from inapppy.asyncio import GooglePlayVerifier as AsyncGooglePlayVerifier
+    from inapppy.credentials import TokenCache
+
+    from .stubs import androidpublisher_document
+
+    url = config["urls"]["googleplay"]
+    credentials = {
+        "type": "service_account",
+        "client_email": "verifier@example.iam.gserviceaccount.com",
+        "private_key_id": "1",
+        "private_key": config["private_key"],
+        "token_uri": url + "token",
+    }
+    # every third purchase is a subscription.
+    items = [(f"token-{i % DISTINCT_ITEMS}", "sku", i % 3 == 0) for i in range(config["requests"])]
+
+    def blocking(items: list, mode: str, concurrency: int) -> dict:
+        verifier = GooglePlayVerifier(
+            "com.example.app",
+            credentials,
+            discovery_document=androidpublisher_document(url),
+            pool_maxsize=concurrency,
+            token_cache=TokenCache(),
+        )
+        with suppress(Exception):
+            verifier.verify("warm-up", "sku")
+        try:
+            return run_blocking(lambda item: verifier.verify(*item), items, mode, concurrency)
+        finally:
+            verifier.http.close()
+
+    async def asynchronous(items: list, concurrency: int) -> dict:
+        async with AsyncGooglePlayVerifier(
+            "com.example.app", credentials, api_root=url, connection_limit=concurrency, token_cache=TokenCache()
+        ) as verifier:
+            with suppress(Exception):
+                await verifier.verify("warm-up", "sku")
+            return await run_async(lambda item: verifier.verify(*item), items, concurrency)
+
+    return items, blocking, asynchronous
+
+
+def googleplay_validator(config: dict) -> tuple:
+    import rsa
+
+    from inapppy import GooglePlayValidator
+
+    from .bench_signature import public_api_key
+
+    private_key = rsa.PrivateKey.load_pkcs1(config["private_key"].encode())
+    public_key = rsa.PublicKey(private_key.n, private_key.e)
+    error_rate = sum(config["errors"].values())
+
+    receipts = []
+    for i in range(DISTINCT_ITEMS):
+        receipt = json.dumps(
+            {
+                "orderId": f"GPA.3312-5178-9012-{i:05}",
+                "packageName": "com.example.app",
+                "productId": "com.example.app.coins",
+                "purchaseTime": 1553000000000,
+                "purchaseState": 0,
+                "purchaseToken": f"token-{i}",
+                "developerPayload": "x" * config["payload_size"],
+            }
+        )
+        signature = base64.standard_b64encode(rsa.sign(receipt.encode(), private_key, "SHA-1")).decode()
+        receipts.append((receipt, signature))
+    # the error mix fraction of the receipts carries a bad signature.
+    bad = int(DISTINCT_ITEMS * error_rate)
+    receipts[:bad] = [(receipt, base64.standard_b64encode(b"\0" * 256).decode()) for receipt, _ in receipts[:bad]]
+    items = [receipts[i % DISTINCT_ITEMS] for i in range(config["requests"])]
+
+    def blocking(items: list, mode: str, concurrency: int) -> dict:
+        validator = GooglePlayValidator("com.example.app", public_api_key(public_key))
+        return run_blocking(lambda item: validator.validate(*item), items, mode, concurrency)
+
+    return items, blocking, None
+
+
+SCENARIOS = {
+    "appstore": appstore,
+    "googleplay-verifier": googleplay_verifier,
+    "googleplay-validator": googleplay_validator,
+}
+
+
+def run_one(config: dict) -> dict:
+    items, blocking, asynchronous = SCENARIOS[config["target"]](config)
+    if config["mode"] == "asyncio":
+        if asynchronous is None:
+            return {"skipped": "no asyncio version"}
+        return asyncio.run(asynchronous(items, config["concurrency"]))
+    return blocking(items, config["mode"], config["concurrency"])
+
+
+def run_in_process(config: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.suite", "--run-one", json.dumps(config)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output)
+
+
+def environment() -> dict:
+    try:
+        from importlib.metadata import version
+
+        inapppy_version = version("inapppy")
+    except Exception:
+        inapppy_version = None
+
+    return {
+        "inapppy": inapppy_version,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """Prints throughput and p99 changes per run, returns whether any regressed past tolerance."""
+    previous = {(run["target"], run["mode"]): run for run in baseline["runs"] if "rps" in run}
+    regressed = False
+    for run in results["runs"]:
+        before = previous.get((run["target"], run["mode"]))
+        if before is None or "rps" not in run:
+            continue
+
+        rps_change = run["rps"] / before["rps"] - 1
+        p99_change = run["latency_ms"]["p99"] / before["latency_ms"]["p99"] - 1
+        worse = rps_change < -tolerance or p99_change > tolerance
+        regressed = regressed or worse
+        print(
+            f"{run['target']:>21} {run['mode']:>8}: rps {rps_change:+7.1%}  p99 {p99_change:+7.1%}"
+            f"{'  REGRESSION' if worse else ''}"
+        )
+    return regressed
+
+
+def print_run(run: dict) -> None:
+    prefix = f"{run['target']:>21} {run['mode']:>8}:"
+    if "skipped" in run:
+        print(f"{prefix} skipped, {run['skipped']}")
+        return
+    latency = run["latency_ms"]
+    print(
+        f"{prefix} {run['rps']:9.1f} req/s  p50 {latency['p50']:8.2f} ms  p99 {latency['p99']:8.2f} ms  "
+        f"cpu {run['cpu_percent']:5.1f}%  peak {run['peak_rss_mib'] or 0:6.1f} MiB  errors {run['errors']}"
+    )
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--targets", default=",".join(TARGETS), help="comma separated, default: all")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma separated, default: all")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per run")
+    parser.add_argument("--concurrency", type=int, default=16, help="threads or concurrent tasks")
+    parser.add_argument("--latency", type=float, default=0.005, help="stub response latency, seconds")
+    parser.add_argument("--payload-size", type=int, default=0, help="bytes added to every stub response")
+    parser.add_argument("--errors", type=parse_errors, default={}, help="stub error mix, e.g. 21005=0.01,http_503=0.01")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative regression")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one:
+        print(json.dumps(run_one(json.loads(args.run_one))))
+        return 0
+
+    import rsa
+
+    from .stubs import OAuthAndroidPublisherHandler, StubProcess, VerifyReceiptHandler
+
+    options = {"latency": args.latency, "payload_size": args.payload_size, "errors": args.errors}
+    config = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "latency": args.latency,
+        "payload_size": args.payload_size,
+        "errors": args.errors,
+        "private_key": rsa.newkeys(2048)[1].save_pkcs1().decode(),
+    }
+    results = {"environment": environment(), "config": {k: v for k, v in config.items() if k != "private_key"}}
+    results["runs"] = runs = []
+
+    with StubProcess(VerifyReceiptHandler, **options) as appstore_stub, StubProcess(
+        OAuthAndroidPublisherHandler, **options
+    ) as googleplay_stub:
+        config["urls"] = {"appstore": appstore_stub.url, "googleplay": googleplay_stub.url}
+        for target in args.targets.split(","):
+            for mode in args.modes.split(","):
+                run = {"target": target, "mode": mode}
+                run.update(run_in_process(dict(config, target=target, mode=mode)))
+                runs.append(run)
+                print_run(run)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            return 1 if compare(results, json.load(file), args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
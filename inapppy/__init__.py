@@ -1,5 +1,32 @@
-from .appstore import AppStoreValidator
 from .errors import InAppPyValidationError
-from .googleplay import GooglePlayValidator, GooglePlayVerifier
 
-__all__ = ["AppStoreValidator", "InAppPyValidationError", "GooglePlayValidator", "GooglePlayVerifier"]
+__all__ = [
+    "AppStoreValidator",
+    "InAppPyValidationError",
+    "GooglePlayValidator",
+    "GooglePlayValidatorRegistry",
+    "GooglePlayVerifier",
+]
+
+# Validators are imported on first access, so e.g. App Store only users never load the google client.
+_lazy_attributes = {
+    "AppStoreValidator": ".appstore",
+    "GooglePlayValidator": ".googleplay",
+    "GooglePlayValidatorRegistry": ".googleplay",
+    "GooglePlayVerifier": ".googleplay",
+}
+
+
+def __getattr__(name: str):
+    if name not in _lazy_attributes:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    from importlib import import_module
+
+    value = getattr(import_module(_lazy_attributes[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,9 +1,27 @@
+import hashlib
+import sys
+import time
 import warnings
+from bisect import bisect_right
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple, Union
 
-import requests
-from requests.exceptions import RequestException
+from inapppy.cache import CacheBackend, LRUCache
+from inapppy.errors import (
+    AppStoreHTTPError,
+    CircuitOpenError,
+    DeadlineExceededError,
+    InAppPyValidationError,
+    ReceiptError,
+)
+from inapppy.instrumentation import Instrumentation, null_instrumentation
+from inapppy.retry import TRANSIENT_STATUSES, CircuitBreaker, RetryPolicy
+from inapppy.singleflight import SingleFlight
 
-from inapppy.errors import InAppPyValidationError
+if TYPE_CHECKING:  # pragma: no cover
+    import requests
+    from urllib3.util.retry import Retry
+
+    from inapppy.receipt import AppStoreReceipt
 
 # https://developer.apple.com/library/content/releasenotes/General/ValidateAppStoreReceipt/Chapters/ValidateRemotely.html
 # `Table 2-1  Status codes`
@@ -21,21 +39,246 @@ api_result_errors = {
     21009: InAppPyValidationError("Internal data access error"),
     21010: InAppPyValidationError("The user account cannot be found or has been deleted"),
 }
+api_result_wrong_env = (21007, 21008)
+
+
+def _intern(value):
+    # product ids and original transaction ids repeat across a receipt history.
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _int_or_none(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class AppStoreTransaction:
+    """A single in_app / latest_receipt_info entry, with dates converted to int milliseconds."""
+
+    __slots__ = (
+        "product_id",
+        "transaction_id",
+        "original_transaction_id",
+        "quantity",
+        "purchase_date_ms",
+        "original_purchase_date_ms",
+        "expires_date_ms",
+        "cancellation_date_ms",
+        "is_trial_period",
+        "is_in_intro_offer_period",
+    )
+
+    def __init__(
+        self,
+        product_id: str,
+        transaction_id: str,
+        original_transaction_id: str,
+        quantity: int = 1,
+        purchase_date_ms: int = None,
+        original_purchase_date_ms: int = None,
+        expires_date_ms: int = None,
+        cancellation_date_ms: int = None,
+        is_trial_period: bool = False,
+        is_in_intro_offer_period: bool = False,
+    ):
+        self.product_id = product_id
+        self.transaction_id = transaction_id
+        self.original_transaction_id = original_transaction_id
+        self.quantity = quantity
+        self.purchase_date_ms = purchase_date_ms
+        self.original_purchase_date_ms = original_purchase_date_ms
+        self.expires_date_ms = expires_date_ms
+        self.cancellation_date_ms = cancellation_date_ms
+        self.is_trial_period = is_trial_period
+        self.is_in_intro_offer_period = is_in_intro_offer_period
+
+    @classmethod
+    def from_dict(cls, transaction: dict) -> "AppStoreTransaction":
+        return cls(
+            _intern(transaction.get("product_id")),
+            transaction.get("transaction_id"),
+            _intern(transaction.get("original_transaction_id")),
+            _int_or_none(transaction.get("quantity")) or 1,
+            _int_or_none(transaction.get("purchase_date_ms")),
+            _int_or_none(transaction.get("original_purchase_date_ms")),
+            _int_or_none(transaction.get("expires_date_ms")),
+            _int_or_none(transaction.get("cancellation_date_ms")),
+            transaction.get("is_trial_period") == "true",
+            transaction.get("is_in_intro_offer_period") == "true",
+        )
+
+    def is_active(self, at_ms: int) -> bool:
+        """Subscription period covers at_ms and it was not refunded before."""
+        if self.expires_date_ms is None or self.purchase_date_ms is None:
+            return False
+        if self.cancellation_date_ms is not None and self.cancellation_date_ms <= at_ms:
+            return False
+        return self.purchase_date_ms <= at_ms < self.expires_date_ms
+
+    def __repr__(self):
+        return (
+            f"AppStoreTransaction("
+            f"product_id={self.product_id!r}, "
+            f"transaction_id={self.transaction_id!r}, "
+            f"original_transaction_id={self.original_transaction_id!r}, "
+            f"expires_date_ms={self.expires_date_ms})"
+        )
+
+
+class AppStoreValidationResult:
+    """Typed view of a successful verifyReceipt response.
+
+    Transactions are converted once and indexed by product_id and original_transaction_id,
+    subscription lookups do not rescan the receipt. Transactions come from latest_receipt_info
+    when the response has it, from receipt.in_app otherwise.
+    """
+
+    __slots__ = (
+        "status",
+        "environment",
+        "bundle_id",
+        "transactions",
+        "pending_renewal_info",
+        "_by_product",
+        "_by_original_transaction",
+        "_expiries",
+    )
+
+    def __init__(
+        self,
+        status: int,
+        environment: str,
+        bundle_id: str,
+        transactions: Tuple[AppStoreTransaction, ...],
+        pending_renewal_info: List[dict] = None,
+    ):
+        self.status = status
+        self.environment = environment
+        self.bundle_id = bundle_id
+        self.transactions = transactions
+        self.pending_renewal_info = pending_renewal_info or []
+
+        by_product: Dict[str, List[AppStoreTransaction]] = {}
+        by_original_transaction: Dict[str, List[AppStoreTransaction]] = {}
+        for transaction in transactions:
+            by_product.setdefault(transaction.product_id, []).append(transaction)
+            by_original_transaction.setdefault(transaction.original_transaction_id, []).append(transaction)
+
+        # product transactions are sorted by expiry, with a parallel list of expiries for bisection.
+        self._by_product = {}
+        self._expiries = {}
+        for product_id, product_transactions in by_product.items():
+            product_transactions.sort(key=lambda transaction: transaction.expires_date_ms or 0)
+            self._by_product[product_id] = tuple(product_transactions)
+            self._expiries[product_id] = [transaction.expires_date_ms or 0 for transaction in product_transactions]
+        self._by_original_transaction = {key: tuple(value) for key, value in by_original_transaction.items()}
+
+    @classmethod
+    def from_response(cls, api_response: dict) -> "AppStoreValidationResult":
+        receipt = api_response.get("receipt") or {}
+        transactions = api_response.get("latest_receipt_info")
+        if not isinstance(transactions, list):
+            transactions = receipt.get("in_app") or []
+
+        return cls(
+            api_response.get("status"),
+            api_response.get("environment"),
+            receipt.get("bundle_id"),
+            tuple(AppStoreTransaction.from_dict(transaction) for transaction in transactions),
+            api_response.get("pending_renewal_info"),
+        )
+
+    def product_transactions(self, product_id: str) -> Tuple[AppStoreTransaction, ...]:
+        """Transactions of a product, in expiry order."""
+        return self._by_product.get(product_id, ())
+
+    def original_transactions(self, original_transaction_id: str) -> Tuple[AppStoreTransaction, ...]:
+        """Transactions (renewals) of a subscription, in response order."""
+        return self._by_original_transaction.get(original_transaction_id, ())
+
+    def active_subscription(self, product_id: str, at_ms: int = None) -> Optional[AppStoreTransaction]:
+        """The transaction of product_id that is active at at_ms (default now), latest expiry first."""
+        if at_ms is None:
+            at_ms = int(time.time() * 1000)
+
+        transactions = self._by_product.get(product_id, ())
+        first = bisect_right(self._expiries.get(product_id, ()), at_ms)
+        for index in range(len(transactions) - 1, first - 1, -1):
+            if transactions[index].is_active(at_ms):
+                return transactions[index]
+        return None
+
+    def __repr__(self):
+        return (
+            f"AppStoreValidationResult("
+            f"status={self.status}, "
+            f"environment={self.environment!r}, "
+            f"bundle_id={self.bundle_id!r}, "
+            f"transactions={len(self.transactions)})"
+        )
 
 
 class AppStoreValidator:
+    PRODUCTION_URL = "https://buy.itunes.apple.com/verifyReceipt"
+    SANDBOX_URL = "https://sandbox.itunes.apple.com/verifyReceipt"
+
     def __init__(
         self,
         bundle_id: str = "",
         sandbox: bool = False,
         auto_retry_wrong_env_request: bool = False,
         http_timeout: int = None,
+        http_session: "requests.Session" = None,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        max_retries: Union[int, "Retry"] = 0,
+        environment_cache_size: int = 0,
+        cache: CacheBackend = None,
+        cache_ttl: int = 300,
+        stream_response: bool = False,
+        keep_transactions: int = 1,
+        drop_latest_receipt: bool = False,
+        instrumentation: Instrumentation = None,
+        prevalidate: bool = False,
+        bundle_ids: Iterable[str] = None,
+        route_by_environment: bool = False,
+        retry_policy: RetryPolicy = None,
+        circuit_breaker: CircuitBreaker = None,
     ):
         """Constructor for AppStoreValidator
 
         :param bundle_id: apple bundle id (no longer required).
         :param sandbox: sandbox mode ?
         :param auto_retry_wrong_env_request: auto retry on wrong env ?
+        :param http_timeout: optional http timeout in seconds.
+        :param http_session: optional requests session to use, it is not closed by the validator.
+        :param pool_connections: number of per-host connection pools of the owned session.
+        :param pool_maxsize: maximum number of kept-alive connections per host of the owned session.
+        :param max_retries: connection retries (or urllib3 Retry) of the owned session.
+        :param environment_cache_size: remember up to this many receipts that resolved to the other
+            environment, so they skip the wrong environment round trip next time. 0 disables it.
+        :param cache: optional cache backend for successful validation results, may be shared
+            between validators (e.g. the sync and asyncio ones).
+        :param cache_ttl: maximum seconds a result is cached, it never outlives the soonest
+            subscription expiry in latest_receipt_info.
+        :param stream_response: decode responses incrementally (requires ijson) and keep only the
+            newest keep_transactions transactions of each original_transaction_id in in_app and
+            latest_receipt_info, so memory stays bounded for long receipt histories.
+        :param keep_transactions: transactions kept per original_transaction_id in streaming mode.
+        :param drop_latest_receipt: empty latest_receipt, before it is decoded, in streaming mode.
+        :param instrumentation: receives request timings, statuses, retries and cache hits,
+            e.g. a MetricsRecorder. See inapppy.instrumentation for the reported metrics.
+        :param prevalidate: decode receipts locally first (see inapppy.receipt), receipts that are not
+            well formed are rejected with a ReceiptError without a request to Apple.
+        :param bundle_ids: accepted receipt bundle ids, others are rejected locally. Implies prevalidate.
+        :param route_by_environment: send receipts to the environment written in the receipt, instead
+            of trying the default environment first. Implies prevalidate.
+        :param retry_policy: retries HTTP errors and 21005/21009 statuses with backoff, within its
+            deadline. Without it every failure is raised straight away.
+        :param circuit_breaker: fails validations fast with a CircuitOpenError after repeated transient
+            failures, may be shared between validators.
         """
         if bundle_id:
             warnings.warn(
@@ -47,15 +290,145 @@ class AppStoreValidator:
         self.sandbox = sandbox
         self.http_timeout = http_timeout
         self.auto_retry_wrong_env_request = auto_retry_wrong_env_request
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.environment_cache = LRUCache(environment_cache_size) if environment_cache_size else None
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        if stream_response:
+            from inapppy import streaming
+
+            streaming.require_ijson()
+        self.stream_response = stream_response
+        self.keep_transactions = keep_transactions
+        self.drop_latest_receipt = drop_latest_receipt
+        self.instrumentation = instrumentation if instrumentation is not None else null_instrumentation
+        self.bundle_ids = frozenset(bundle_ids) if bundle_ids is not None else None
+        self.route_by_environment = route_by_environment
+        self.prevalidate = prevalidate or self.bundle_ids is not None or route_by_environment
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        # concurrent validations of the same uncached receipt make a single upstream call.
+        self._single_flight = SingleFlight()
+
+        # Session is created lazily, so the asyncio subclass never builds one.
+        self._http_session = http_session
+        self._owns_http_session = http_session is None
 
         self._change_url_by_sandbox()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Closes the owned http session, an injected session is left to its owner."""
+        if self._owns_http_session and self._http_session is not None:
+            self._http_session.close()
+            self._http_session = None
+
+    @property
+    def http_session(self) -> "requests.Session":
+        if self._http_session is None:
+            self._http_session = self._create_http_session()
+        return self._http_session
+
+    def _create_http_session(self) -> "requests.Session":
+        # requests is imported with the first session, not with inapppy.
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize, max_retries=self.max_retries
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
     def _change_url_by_sandbox(self):
-        self.url = (
-            "https://sandbox.itunes.apple.com/verifyReceipt"
-            if self.sandbox
-            else "https://buy.itunes.apple.com/verifyReceipt"
+        self.url = self._url(self.sandbox)
+
+    def _url(self, sandbox: bool) -> str:
+        return self.SANDBOX_URL if sandbox else self.PRODUCTION_URL
+
+    @staticmethod
+    def _environment(sandbox: bool) -> str:
+        return "sandbox" if sandbox else "production"
+
+    @staticmethod
+    def _environment_key(receipt: str) -> bytes:
+        return hashlib.sha256(receipt.encode()).digest()
+
+    def _prevalidate(self, receipt: str) -> Optional["AppStoreReceipt"]:
+        """Decodes the receipt locally when prevalidation is on, raises ReceiptError if Apple would reject it."""
+        if not self.prevalidate:
+            return None
+
+        from inapppy.receipt import decode_receipt
+
+        try:
+            local_receipt = decode_receipt(receipt, in_app=False)
+            if self.bundle_ids is not None and local_receipt.bundle_id not in self.bundle_ids:
+                raise ReceiptError("Bundle ID mismatch")
+        except ReceiptError as e:
+            self.instrumentation.increment("appstore.rejected", reason=e.message)
+            raise
+        return local_receipt
+
+    def _resolve_sandbox(self, receipt: str, local_receipt: "AppStoreReceipt" = None) -> bool:
+        """Environment to send the receipt to first, environment is chosen per request."""
+        if self.route_by_environment and local_receipt is not None and local_receipt.environment is not None:
+            return local_receipt.sandbox
+        if self.environment_cache is None:
+            return self.sandbox
+        return self.environment_cache.get(self._environment_key(receipt), self.sandbox)
+
+    def _learn_environment(self, receipt: str, sandbox: bool, status) -> None:
+        if self.environment_cache is None or status in api_result_wrong_env:
+            return
+
+        key = self._environment_key(receipt)
+        if sandbox != self.sandbox:
+            self.environment_cache.set(key, sandbox)
+        else:
+            self.environment_cache.delete(key)
+
+    @staticmethod
+    def _cache_key(receipt: str, shared_secret: str, exclude_old_transactions: bool) -> str:
+        digest = hashlib.sha256()
+        for part in (receipt, shared_secret or "", "1" if exclude_old_transactions else "0"):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return f"inapppy:appstore:{digest.hexdigest()}"
+
+    def _result_ttl(self, api_response: dict) -> float:
+        now_ms = time.time() * 1000
+        latest_receipt_info = api_response.get("latest_receipt_info")
+        if not isinstance(latest_receipt_info, list):
+            return self.cache_ttl
+
+        # entries without a usable expiry date do not bound the ttl.
+        expires = (
+            _int_or_none(transaction.get("expires_date_ms"))
+            for transaction in latest_receipt_info
+            if isinstance(transaction, dict)
         )
+        soonest_expiry = min(
+            (expires_ms for expires_ms in expires if expires_ms is not None and expires_ms > now_ms), default=None
+        )
+        if soonest_expiry is None:
+            return self.cache_ttl
+        return min(self.cache_ttl, (soonest_expiry - now_ms) / 1000)
+
+    @staticmethod
+    def _api_error(status, api_response: dict) -> InAppPyValidationError:
+        # api_result_errors are shared templates, never attach a response to them.
+        error = api_result_errors.get(status, InAppPyValidationError("Unknown API status"))
+        return InAppPyValidationError(error.message, api_response)
 
     def _prepare_receipt(self, receipt: str, shared_secret: str, exclude_old_transactions: bool) -> dict:
         receipt_json = {"receipt-data": receipt}
@@ -68,13 +441,126 @@ class AppStoreValidator:
 
         return receipt_json
 
-    def post_json(self, request_json: dict) -> dict:
-        self._change_url_by_sandbox()
+    def post_json(self, request_json: dict, sandbox: bool = None, timeout: float = None) -> dict:
+        from requests.exceptions import RequestException
+        from urllib3.exceptions import HTTPError
+
+        sandbox = self.sandbox if sandbox is None else sandbox
+        timeout = self.http_timeout if timeout is None else timeout
+        url = self._url(sandbox)
+        instrumentation = self.instrumentation
+        environment = self._environment(sandbox)
+        started = time.perf_counter()
 
         try:
-            return requests.post(self.url, json=request_json, timeout=self.http_timeout).json()
-        except (ValueError, RequestException):
-            raise InAppPyValidationError("HTTP error")
+            if self.stream_response:
+                # the response is decoded while it is read, decoding is part of the request timing.
+                api_response = self._post_json_stream(url, request_json, timeout)
+                instrumentation.timing("appstore.request", time.perf_counter() - started, environment=environment)
+                return api_response
+
+            resp = self.http_session.post(url, json=request_json, timeout=timeout)
+            received = time.perf_counter()
+            instrumentation.timing("appstore.request", received - started, environment=environment)
+            api_response = resp.json()
+            instrumentation.timing("appstore.decode", time.perf_counter() - received)
+            return api_response
+        except (ValueError, RequestException, HTTPError) as e:
+            instrumentation.increment("appstore.error", error=type(e).__name__)
+            raise AppStoreHTTPError("HTTP error")
+
+    def _post_json_stream(self, url: str, request_json: dict, timeout: float = None) -> dict:
+        from inapppy import streaming
+
+        with self.http_session.post(url, json=request_json, timeout=timeout, stream=True) as resp:
+            resp.raw.decode_content = True
+            try:
+                return streaming.compact_response(resp.raw, self.keep_transactions, self.drop_latest_receipt)
+            except streaming.JSONError as e:
+                self.instrumentation.increment("appstore.error", error=type(e).__name__)
+                raise AppStoreHTTPError("HTTP error")
+
+    def _deadline(self) -> Optional[float]:
+        """time.monotonic() deadline of a validation, None without one."""
+        if self.retry_policy is None or self.retry_policy.deadline is None:
+            return None
+        return time.monotonic() + self.retry_policy.deadline
+
+    def _before_attempt(self, deadline: Optional[float]) -> Optional[float]:
+        """http timeout of the next request, shortened to what is left of the deadline.
+
+        Raises DeadlineExceededError when nothing is left and CircuitOpenError while the circuit is open.
+        """
+        timeout = self.http_timeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.instrumentation.increment("appstore.deadline")
+                raise DeadlineExceededError("Deadline exceeded")
+            timeout = remaining if timeout is None else min(timeout, remaining)
+
+        if self.circuit_breaker is not None and not self.circuit_breaker.allow():
+            self.instrumentation.increment("appstore.circuit")
+            raise CircuitOpenError("Circuit open")
+        return timeout
+
+    def _is_transient(self, api_response: dict) -> bool:
+        statuses = TRANSIENT_STATUSES if self.retry_policy is None else self.retry_policy.retry_statuses
+        return api_response.get("status") in statuses
+
+    def _attempt_succeeded(self) -> None:
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_success()
+
+    def _attempt_failed(
+        self, attempt: int, deadline: Optional[float], reason, api_response: dict = None
+    ) -> Optional[float]:
+        """Records a transient failure, returns the delay before the next attempt or None to give up."""
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_failure()
+
+        policy = self.retry_policy
+        if deadline is not None and time.monotonic() >= deadline:
+            # the request was most likely cut short by the deadline.
+            self.instrumentation.increment("appstore.deadline")
+            raise DeadlineExceededError("Deadline exceeded", api_response)
+        if policy is None or attempt + 1 >= policy.attempts:
+            return None
+
+        delay = policy.delay(attempt)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            self.instrumentation.increment("appstore.deadline")
+            raise DeadlineExceededError("Deadline exceeded", api_response)
+        self.instrumentation.increment("appstore.retry", reason=reason)
+        return delay
+
+    def _post_json_with_retry(self, receipt_json: dict, sandbox: bool, deadline: Optional[float]) -> dict:
+        """post_json, retried per the retry policy and guarded by the circuit breaker.
+
+        Transient statuses are returned once retries are exhausted, HTTP errors are raised.
+        """
+        if self.retry_policy is None and self.circuit_breaker is None:
+            return self.post_json(receipt_json, sandbox)
+
+        attempt = 0
+        while True:
+            timeout = self._before_attempt(deadline)
+            try:
+                api_response = self.post_json(receipt_json, sandbox, timeout)
+            except AppStoreHTTPError:
+                delay = self._attempt_failed(attempt, deadline, "http")
+                if delay is None:
+                    raise
+            else:
+                if not self._is_transient(api_response):
+                    self._attempt_succeeded()
+                    return api_response
+                delay = self._attempt_failed(attempt, deadline, api_response.get("status"), api_response)
+                if delay is None:
+                    return api_response
+
+            time.sleep(delay)
+            attempt += 1
 
     def validate(
         self,
@@ -89,23 +575,50 @@ class AppStoreValidator:
         :param exclude_old_transactions: optional to include only the latest renewal transaction
         :return: validation result or exception.
         """
+        if self.cache is None:
+            return self._validate(receipt, shared_secret, exclude_old_transactions)
+
+        key = self._cache_key(receipt, shared_secret, exclude_old_transactions)
+        api_response = self.cache.get(key)
+        self.instrumentation.increment("appstore.cache", result="miss" if api_response is None else "hit")
+        if api_response is None:
+            api_response = self._single_flight.do(
+                key, self._validate_and_cache, key, receipt, shared_secret, exclude_old_transactions
+            )
+        return api_response
+
+    def _validate_and_cache(self, key: str, receipt: str, shared_secret: str, exclude_old_transactions: bool) -> dict:
+        # a call that finished while we were waiting for the flight may have filled the cache.
+        api_response = self.cache.get(key)
+        if api_response is None:
+            api_response = self._validate(receipt, shared_secret, exclude_old_transactions)
+            self.cache.set(key, api_response, self._result_ttl(api_response))
+        return api_response
+
+    def _validate(self, receipt: str, shared_secret: str, exclude_old_transactions: bool) -> dict:
+        local_receipt = self._prevalidate(receipt)
         receipt_json = self._prepare_receipt(receipt, shared_secret, exclude_old_transactions)
+        sandbox = self._resolve_sandbox(receipt, local_receipt)
+        # the deadline covers both environments.
+        deadline = self._deadline()
 
-        api_response = self.post_json(receipt_json)
+        api_response = self._post_json_with_retry(receipt_json, sandbox, deadline)
         status = api_response.get("status", "unknown")
+        self.instrumentation.increment("appstore.status", status=status)
 
         # Check retry case.
-        if self.auto_retry_wrong_env_request and status in [21007, 21008]:
-            # switch environment
-            self.sandbox = not self.sandbox
+        if self.auto_retry_wrong_env_request and status in api_result_wrong_env:
+            # switch environment for this request only
+            sandbox = not sandbox
+            self.instrumentation.increment("appstore.env_retry")
 
-            api_response = self.post_json(receipt_json)
+            api_response = self._post_json_with_retry(receipt_json, sandbox, deadline)
             status = api_response["status"]
+            self.instrumentation.increment("appstore.status", status=status)
 
-        if status != api_result_ok:
-            error = api_result_errors.get(status, InAppPyValidationError("Unknown API status"))
-            error.raw_response = api_response
+        self._learn_environment(receipt, sandbox, status)
 
-            raise error
+        if status != api_result_ok:
+            raise self._api_error(status, api_response)
 
         return api_response
@@ -1,3 +1,22 @@
-from .appstore import AppStoreValidator
+__all__ = ["AppStoreValidator", "GooglePlayVerifier"]
 
-__all__ = ["AppStoreValidator"]
+# See inapppy/__init__.py, validators are imported on first access.
+_lazy_attributes = {
+    "AppStoreValidator": ".appstore",
+    "GooglePlayVerifier": ".googleplay",
+}
+
+
+def __getattr__(name: str):
+    if name not in _lazy_attributes:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    from importlib import import_module
+
+    value = getattr(import_module(_lazy_attributes[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,7 +1,19 @@
-from aiohttp import ClientError, ClientSession, ClientTimeout
+import asyncio
+import json
+import time
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Optional, Union
 
-from ..appstore import AppStoreValidator, api_result_errors, api_result_ok
-from ..errors import InAppPyValidationError
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+
+from ..appstore import AppStoreValidator, api_result_ok, api_result_wrong_env
+from ..bulk import BulkResult
+from ..cache import CacheBackend
+from ..errors import AppStoreHTTPError
+from ..instrumentation import Instrumentation
+from ..retry import CircuitBreaker, RetryPolicy
+from .bulk import bounded_as_completed
+from .instrumentation import trace_configs
+from .singleflight import SingleFlight
 
 
 class AppStoreValidator(AppStoreValidator):
@@ -13,26 +25,117 @@ class AppStoreValidator(AppStoreValidator):
         sandbox: bool = False,
         auto_retry_wrong_env_request: bool = False,
         http_timeout: int = None,
+        connection_limit: int = 100,
+        connection_limit_per_host: int = 0,
+        environment_cache_size: int = 0,
+        cache: CacheBackend = None,
+        cache_ttl: int = 300,
+        stream_response: bool = False,
+        keep_transactions: int = 1,
+        drop_latest_receipt: bool = False,
+        instrumentation: Instrumentation = None,
+        prevalidate: bool = False,
+        bundle_ids: Iterable[str] = None,
+        route_by_environment: bool = False,
+        retry_policy: RetryPolicy = None,
+        circuit_breaker: CircuitBreaker = None,
     ):
-        super().__init__(bundle_id, sandbox, auto_retry_wrong_env_request, http_timeout)
+        """
+        :param connection_limit: total number of simultaneous connections of the session.
+        :param connection_limit_per_host: simultaneous connections per host, 0 means no limit.
+        :param instrumentation: also receives appstore.connect timings of new connections.
+        """
+        super().__init__(
+            bundle_id,
+            sandbox,
+            auto_retry_wrong_env_request,
+            http_timeout,
+            environment_cache_size=environment_cache_size,
+            cache=cache,
+            cache_ttl=cache_ttl,
+            stream_response=stream_response,
+            keep_transactions=keep_transactions,
+            drop_latest_receipt=drop_latest_receipt,
+            instrumentation=instrumentation,
+            prevalidate=prevalidate,
+            bundle_ids=bundle_ids,
+            route_by_environment=route_by_environment,
+            retry_policy=retry_policy,
+            circuit_breaker=circuit_breaker,
+        )
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self._single_flight = SingleFlight()
         self._session = None
 
     async def __aenter__(self):
-        self._session = ClientSession()
+        connector = TCPConnector(limit=self.connection_limit, limit_per_host=self.connection_limit_per_host)
+        self._session = ClientSession(
+            connector=connector, trace_configs=trace_configs(self.instrumentation, "appstore")
+        )
+        return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self._session.close()
         self._session = None
 
-    async def post_json(self, request_json: dict) -> dict:
-        self._change_url_by_sandbox()
+    async def post_json(self, request_json: dict, sandbox: bool = None, timeout: float = None) -> dict:
+        sandbox = self.sandbox if sandbox is None else sandbox
+        timeout = self.http_timeout if timeout is None else timeout
+        url = self._url(sandbox)
+        instrumentation = self.instrumentation
+        environment = self._environment(sandbox)
+        started = time.perf_counter()
+
+        try:
+            async with self._session.post(url, json=request_json, timeout=ClientTimeout(total=timeout)) as resp:
+                if self.stream_response:
+                    api_response = await self._compact_response(resp.content)
+                    instrumentation.timing("appstore.request", time.perf_counter() - started, environment=environment)
+                    return api_response
+
+                content = await resp.read()
+            received = time.perf_counter()
+            instrumentation.timing("appstore.request", received - started, environment=environment)
+            api_response = json.loads(content)
+            instrumentation.timing("appstore.decode", time.perf_counter() - received)
+            return api_response
+        except (ValueError, ClientError, asyncio.TimeoutError) as e:
+            instrumentation.increment("appstore.error", error=type(e).__name__)
+            raise AppStoreHTTPError("HTTP error")
+
+    async def _compact_response(self, stream) -> dict:
+        from .. import streaming
+
         try:
-            async with self._session.post(
-                self.url, json=request_json, timeout=ClientTimeout(total=self.http_timeout)
-            ) as resp:
-                return await resp.json(content_type=None)
-        except (ValueError, ClientError):
-            raise InAppPyValidationError("HTTP error")
+            return await streaming.compact_response_async(stream, self.keep_transactions, self.drop_latest_receipt)
+        except streaming.JSONError as e:
+            self.instrumentation.increment("appstore.error", error=type(e).__name__)
+            raise AppStoreHTTPError("HTTP error")
+
+    async def _post_json_with_retry(self, receipt_json: dict, sandbox: bool, deadline: Optional[float]) -> dict:
+        if self.retry_policy is None and self.circuit_breaker is None:
+            return await self.post_json(receipt_json, sandbox)
+
+        attempt = 0
+        while True:
+            timeout = self._before_attempt(deadline)
+            try:
+                api_response = await self.post_json(receipt_json, sandbox, timeout)
+            except AppStoreHTTPError:
+                delay = self._attempt_failed(attempt, deadline, "http")
+                if delay is None:
+                    raise
+            else:
+                if not self._is_transient(api_response):
+                    self._attempt_succeeded()
+                    return api_response
+                delay = self._attempt_failed(attempt, deadline, api_response.get("status"), api_response)
+                if delay is None:
+                    return api_response
+
+            await asyncio.sleep(delay)
+            attempt += 1
 
     async def validate(self, receipt: str, shared_secret: str = None, exclude_old_transactions: bool = False) -> dict:
         """Validates receipt against apple services.
@@ -42,23 +145,86 @@ class AppStoreValidator(AppStoreValidator):
         :param exclude_old_transactions: optional to include only the latest renewal transaction
         :return: validation result or exception.
         """
+        if self.cache is None:
+            return await self._validate(receipt, shared_secret, exclude_old_transactions)
+
+        key = self._cache_key(receipt, shared_secret, exclude_old_transactions)
+        api_response = self.cache.get(key)
+        self.instrumentation.increment("appstore.cache", result="miss" if api_response is None else "hit")
+        if api_response is None:
+            api_response = await self._single_flight.do(
+                key, self._validate_and_cache, key, receipt, shared_secret, exclude_old_transactions
+            )
+        return api_response
+
+    async def _validate_and_cache(
+        self, key: str, receipt: str, shared_secret: str, exclude_old_transactions: bool
+    ) -> dict:
+        api_response = self.cache.get(key)
+        if api_response is None:
+            api_response = await self._validate(receipt, shared_secret, exclude_old_transactions)
+            self.cache.set(key, api_response, self._result_ttl(api_response))
+        return api_response
+
+    async def _validate(self, receipt: str, shared_secret: str, exclude_old_transactions: bool) -> dict:
+        local_receipt = self._prevalidate(receipt)
         receipt_json = self._prepare_receipt(receipt, shared_secret, exclude_old_transactions)
+        sandbox = self._resolve_sandbox(receipt, local_receipt)
+        deadline = self._deadline()
 
-        api_response = await self.post_json(receipt_json)
+        api_response = await self._post_json_with_retry(receipt_json, sandbox, deadline)
         status = api_response["status"]
+        self.instrumentation.increment("appstore.status", status=status)
 
         # Check retry case.
-        if self.auto_retry_wrong_env_request and status in [21007, 21008]:
-            # switch environment
-            self.sandbox = not self.sandbox
+        if self.auto_retry_wrong_env_request and status in api_result_wrong_env:
+            # switch environment for this request only
+            sandbox = not sandbox
+            self.instrumentation.increment("appstore.env_retry")
 
-            api_response = await self.post_json(receipt_json)
+            api_response = await self._post_json_with_retry(receipt_json, sandbox, deadline)
             status = api_response["status"]
+            self.instrumentation.increment("appstore.status", status=status)
 
-        if status != api_result_ok:
-            error = api_result_errors.get(status, InAppPyValidationError("Unknown API status"))
-            error.raw_response = api_response
+        self._learn_environment(receipt, sandbox, status)
 
-            raise error
+        if status != api_result_ok:
+            raise self._api_error(status, api_response)
 
         return api_response
+
+    async def validate_stream(
+        self,
+        receipts: Union[Iterable[str], AsyncIterable[str]],
+        shared_secret: str = None,
+        exclude_old_transactions: bool = False,
+        concurrency: int = 10,
+    ) -> AsyncIterator[BulkResult]:
+        """Validates many receipts, yielding a BulkResult per receipt as soon as it completes.
+
+        :param receipts: iterable or async iterable of receipts, consumed lazily.
+        :param shared_secret: optional shared secret.
+        :param exclude_old_transactions: optional to include only the latest renewal transaction
+        :param concurrency: maximum number of receipts validated at the same time.
+        :return: async iterator of results, failed receipts carry the error instead of raising.
+        """
+
+        def validate(receipt: str):
+            return self.validate(receipt, shared_secret, exclude_old_transactions)
+
+        async for result in bounded_as_completed(validate, receipts, concurrency):
+            yield result
+
+    async def validate_many(
+        self,
+        receipts: Union[Iterable[str], AsyncIterable[str]],
+        shared_secret: str = None,
+        exclude_old_transactions: bool = False,
+        concurrency: int = 10,
+    ) -> List[BulkResult]:
+        """Validates many receipts, returns a BulkResult per receipt in input order."""
+        results = [
+            result
+            async for result in self.validate_stream(receipts, shared_secret, exclude_old_transactions, concurrency)
+        ]
+        return sorted(results, key=lambda result: result.index)
@@ -0,0 +1,101 @@
+import asyncio
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Union
+
+from ..bulk import BulkResult
+
+
+async def _iterate(items: Union[Iterable, AsyncIterable]) -> AsyncIterator:
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+_EXHAUSTED = object()
+
+
+async def _next(iterator: AsyncIterator):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _EXHAUSTED
+
+
+async def _run(func: Callable[..., Awaitable], index: int, item) -> BulkResult:
+    try:
+        return BulkResult(index, item, result=await func(item))
+    except Exception as error:
+        return BulkResult(index, item, error=error)
+
+
+async def bounded_as_completed(
+    func: Callable[..., Awaitable], items: Union[Iterable, AsyncIterable], concurrency: int
+) -> AsyncIterator[BulkResult]:
+    """Runs ``func`` over ``items`` with at most ``concurrency`` calls in flight.
+
+    Items are pulled from the input only when a slot frees up, so memory stays flat regardless
+    of the input size. Results are yielded as they complete, errors are yielded, not raised.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    iterator = _iterate(items).__aiter__()
+    pending = set()
+    index = 0
+    exhausted = False
+
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                item = await _next(iterator)
+                exhausted = item is _EXHAUSTED
+                if not exhausted:
+                    pending.add(asyncio.ensure_future(_run(func, index, item)))
+                    index += 1
+
+            if not pending:
+                break
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def bounded_in_order(
+    func: Callable[..., Awaitable], items: Union[Iterable, AsyncIterable], concurrency: int, window: int = None
+) -> AsyncIterator[BulkResult]:
+    """Runs ``func`` over ``items`` with at most ``concurrency`` calls in flight, yielding results in input order.
+
+    Up to ``window`` items (default 4 * concurrency) are started ahead of the oldest unfinished one,
+    a slow item holds back the output rather than the calls, and memory stays bounded by the window.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    window = window or 4 * concurrency
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(index: int, item) -> BulkResult:
+        async with semaphore:
+            return await _run(func, index, item)
+
+    started = deque()
+    index = 0
+    try:
+        async for item in _iterate(items):
+            if len(started) >= window:
+                yield await started.popleft()
+            started.append(asyncio.ensure_future(run(index, item)))
+            index += 1
+
+        while started:
+            yield await started.popleft()
+    finally:
+        for task in started:
+            task.cancel()
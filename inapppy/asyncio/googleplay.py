@@ -0,0 +1,343 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Union
+from urllib.parse import quote
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from ..bulk import BulkResult
+from ..cache import CacheBackend
+from ..credentials import (
+    MIN_VALIDITY,
+    REFRESH_MARGIN,
+    TokenCache,
+    default_token_cache,
+    load_service_account_info,
+    service_account_credentials,
+    token_key,
+)
+from ..errors import GoogleError, InAppPyError
+from ..googleplay import MAX_BATCH_SIZE, GooglePlayVerifier, GoogleVerificationResult, Purchase
+from ..instrumentation import Instrumentation
+from ..ratelimit import TokenBucket
+from .bulk import bounded_as_completed, bounded_in_order
+from .instrumentation import trace_configs
+from .singleflight import SingleFlight
+
+
+class ServiceAccountTokenSource:
+    """Mints OAuth2 access tokens for a service account over aiohttp.
+
+    Tokens are shared through a TokenCache, with the sync verifiers as well. Tokens within
+    REFRESH_MARGIN of expiry keep being used while a background task refreshes them.
+    """
+
+    JWT_GRANT_TYPE = "urn:ietf:params:oauth:grant-type:jwt-bearer"
+    TOKEN_LIFETIME = 3600
+    REFRESH_MARGIN = REFRESH_MARGIN
+
+    def __init__(self, service_account_info: dict, scope: str, token_cache: TokenCache = None) -> None:
+        try:
+            self.service_account_email = service_account_info["client_email"]
+            self.token_uri = service_account_info["token_uri"]
+        except KeyError as e:
+            raise InAppPyError(f"Bad play console credentials: {e!r}")
+
+        self.service_account_info = service_account_info
+        self.scope = scope
+        self.key = token_key(service_account_info, scope)
+        self.token_cache = token_cache if token_cache is not None else default_token_cache
+        self._lock = None
+        self._refresh_task = None
+
+    async def get_token(self, session: ClientSession) -> str:
+        cached = self.token_cache.get(self.key)
+        if cached is not None:
+            token, expiry = cached
+            now = time.time()
+            if now < expiry - self.REFRESH_MARGIN:
+                return token
+            if now < expiry - MIN_VALIDITY:
+                if self._refresh_task is None or self._refresh_task.done():
+                    self._refresh_task = asyncio.ensure_future(self._refresh_in_background(session))
+                return token
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            # another coroutine may have refreshed the token while we were waiting.
+            cached = self.token_cache.get(self.key)
+            if cached is not None and time.time() < cached[1] - MIN_VALIDITY:
+                return cached[0]
+            return await self.refresh(session)
+
+    async def _refresh_in_background(self, session: ClientSession) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        try:
+            async with self._lock:
+                await self.refresh(session)
+        except Exception:
+            # the token is still valid, the next call past the margin retries.
+            pass
+
+    async def refresh_rejected(self, session: ClientSession, token: str) -> str:
+        """Replaces a token the API rejected (401), e.g. revoked, unless another coroutine already did."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            cached = self.token_cache.get(self.key)
+            if cached is not None and cached[0] != token:
+                return cached[0]
+            return await self.refresh(session)
+
+    async def refresh(self, session: ClientSession) -> str:
+        now = int(time.time())
+        payload = {
+            "iss": self.service_account_email,
+            "scope": self.scope,
+            "aud": self.token_uri,
+            "iat": now,
+            "exp": now + self.TOKEN_LIFETIME,
+        }
+        from google.auth import jwt
+
+        # the private key is only parsed when a token has to be minted.
+        signer = service_account_credentials(self.service_account_info, self.scope).signer
+        assertion = jwt.encode(signer, payload).decode()
+
+        async with session.post(
+            self.token_uri, data={"grant_type": self.JWT_GRANT_TYPE, "assertion": assertion}
+        ) as resp:
+            response = await resp.json(content_type=None)
+
+        if resp.status != 200 or "access_token" not in response:
+            raise GoogleError("Access token request failed", response)
+
+        token = response["access_token"]
+        self.token_cache.set(self.key, token, now + int(response.get("expires_in", self.TOKEN_LIFETIME)))
+        return token
+
+
+class GooglePlayVerifier(GooglePlayVerifier):
+    """The asyncio version of the google play verifier.
+
+    Calls androidpublisher REST endpoints directly over a shared aiohttp session.
+    """
+
+    DEFAULT_API_ROOT = "https://androidpublisher.googleapis.com/"
+
+    def __init__(
+        self,
+        bundle_id: str,
+        play_console_credentials: Union[str, dict],
+        http_timeout: int = 15,
+        api_root: str = DEFAULT_API_ROOT,
+        connection_limit: int = 100,
+        connection_limit_per_host: int = 0,
+        coalesce_requests: bool = False,
+        cache: CacheBackend = None,
+        cache_max_staleness: int = 3600,
+        token_cache: TokenCache = None,
+        instrumentation: Instrumentation = None,
+        rate_limiter: TokenBucket = None,
+        rate_limit_retries: int = 2,
+    ) -> None:
+        """
+        Arguments:
+            bundle_id: str - Also known as Android app's package name.
+            play_console_credentials - Path or dict contents of Google's Service Credentials
+            http_timeout: int - HTTP connection timeout.
+            api_root: str - Root url of the androidpublisher API.
+            connection_limit: int - Total number of simultaneous connections of the session.
+            connection_limit_per_host: int - Simultaneous connections per host, 0 means no limit.
+            coalesce_requests: bool - Concurrent checks of the same purchase share one upstream call.
+            cache: CacheBackend - Optional cache of raw purchase responses.
+            cache_max_staleness: int - Maximum seconds a response is cached.
+            token_cache: TokenCache - Where access tokens are shared, by service account and scope.
+            instrumentation: Instrumentation - Also receives googleplay.connect and googleplay.decode timings.
+            rate_limiter: TokenBucket - Optional client-side rate limit, may be shared with sync verifiers.
+            rate_limit_retries: int - Retries of calls answered with 429.
+        """
+        super().__init__(
+            bundle_id,
+            play_console_credentials,
+            http_timeout,
+            cache=cache,
+            cache_max_staleness=cache_max_staleness,
+            token_cache=token_cache,
+            instrumentation=instrumentation,
+            rate_limiter=rate_limiter,
+            rate_limit_retries=rate_limit_retries,
+        )
+        self.single_flight = SingleFlight() if coalesce_requests else None
+        self.api_root = api_root
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.token_source = ServiceAccountTokenSource(
+            load_service_account_info(play_console_credentials), self.DEFAULT_AUTH_SCOPE, token_cache
+        )
+        self._session = None
+
+    async def __aenter__(self):
+        connector = TCPConnector(limit=self.connection_limit, limit_per_host=self.connection_limit_per_host)
+        self._session = ClientSession(
+            connector=connector, trace_configs=trace_configs(self.instrumentation, "googleplay")
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._session.close()
+        self._session = None
+
+    def _authorize(self):
+        # Requests are authorized with tokens minted by the token source, there is no sync transport.
+        return None
+
+    def _purchase_url(self, kind: str, product_sku: str, purchase_token: str) -> str:
+        return (
+            f"{self.api_root}androidpublisher/v3/applications/{quote(self.bundle_id, safe='')}"
+            f"/purchases/{kind}/{quote(product_sku, safe='')}/tokens/{quote(purchase_token, safe='')}"
+        )
+
+    async def _get_json(self, url: str, kind: str) -> dict:
+        from googleapiclient.errors import HttpError
+
+        attempt = 0
+        refreshed = False
+        while True:
+            wait = self._reserve_quota(kind)
+            if wait:
+                await asyncio.sleep(wait)
+            token = await self.token_source.get_token(self._session)
+            try:
+                return await self._get_json_once(url, kind, token)
+            except HttpError as e:
+                if e.resp.status == 401 and not refreshed:
+                    # the token was revoked or rotated before its expiry, retry once with a new one.
+                    refreshed = True
+                    await self.token_source.refresh_rejected(self._session, token)
+                    continue
+                if e.resp.status != 429:
+                    raise
+                delay = self._rate_limited(e, attempt, kind)
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _get_json_once(self, url: str, kind: str, token: str) -> dict:
+        instrumentation = self.instrumentation
+        headers = {"Authorization": f"Bearer {token}"}
+
+        started = time.perf_counter()
+        try:
+            async with self._session.get(url, headers=headers, timeout=ClientTimeout(total=self.http_timeout)) as resp:
+                content = await resp.read()
+        except Exception as e:
+            instrumentation.increment("googleplay.error", kind=kind, error=type(e).__name__)
+            raise
+        finally:
+            instrumentation.timing("googleplay.request", time.perf_counter() - started, kind=kind)
+        instrumentation.increment("googleplay.status", kind=kind, status=resp.status)
+
+        if resp.status == 200:
+            received = time.perf_counter()
+            result = json.loads(content)
+            instrumentation.timing("googleplay.decode", time.perf_counter() - received)
+            return result
+
+        import httplib2
+        from googleapiclient.errors import HttpError
+
+        info = {key.lower(): value for key, value in resp.headers.items()}
+        info["status"] = str(resp.status)
+        response = httplib2.Response(info)
+        response.reason = resp.reason
+        e = HttpError(response, content, uri=url)
+        if e.resp.status == 400:
+            raise GoogleError(e.resp.reason, repr(e))
+        else:
+            raise e
+
+    async def check_purchase_subscription(self, purchase_token: str, product_sku: str) -> dict:
+        return await self._get_json(self._purchase_url("subscriptions", product_sku, purchase_token), "subscriptions")
+
+    async def check_purchase_product(self, purchase_token: str, product_sku: str) -> dict:
+        return await self._get_json(self._purchase_url("products", product_sku, purchase_token), "products")
+
+    async def _check_purchase(self, purchase_token: str, product_sku: str, is_subscription: bool) -> dict:
+        result = self._cached_response(purchase_token, product_sku, is_subscription)
+        if result is not None:
+            return result
+
+        check = self.check_purchase_subscription if is_subscription else self.check_purchase_product
+
+        if self.single_flight is None:
+            result = await check(purchase_token, product_sku)
+        else:
+            result = await self.single_flight.do(
+                (purchase_token, product_sku, is_subscription), check, purchase_token, product_sku
+            )
+
+        self._cache_response(purchase_token, product_sku, is_subscription, result)
+        return result
+
+    async def verify(self, purchase_token: str, product_sku: str, is_subscription: bool = False) -> dict:
+        result = await self._check_purchase(purchase_token, product_sku, is_subscription)
+        return self._check_response(result, is_subscription)
+
+    async def verify_with_result(
+        self, purchase_token: str, product_sku: str, is_subscription: bool = False
+    ) -> GoogleVerificationResult:
+        """Verifies by returning verification result instead of raising an error."""
+        result = await self._check_purchase(purchase_token, product_sku, is_subscription)
+        return self._verification_result(result, is_subscription)
+
+    def verify_batch(
+        self,
+        purchases: Union[Iterable[Purchase], AsyncIterable[Purchase]],
+        with_result: bool = False,
+        batch_size: int = 100,
+    ) -> AsyncIterator[BulkResult]:
+        """Convenience wrapper for code shared with the sync verifier, not a batch API.
+
+        Same as verify_stream with ordered=True and batch_size as the concurrency, nothing is batched.
+        """
+        if not 0 < batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+        return self.verify_stream(purchases, batch_size, with_result, ordered=True)
+
+    async def verify_stream(
+        self,
+        purchases: Union[Iterable[Purchase], AsyncIterable[Purchase]],
+        concurrency: int = 10,
+        with_result: bool = False,
+        ordered: bool = False,
+    ) -> AsyncIterator[BulkResult]:
+        """Verifies many purchases, yielding a BulkResult per purchase as soon as it completes.
+
+        Each purchase is its own request, there are no batched HTTP requests in the asyncio verifier.
+
+        :param purchases: (purchase_token, product_sku[, is_subscription]) tuples, consumed lazily.
+        :param concurrency: maximum number of purchases verified at the same time.
+        :param with_result: use verify_with_result instead of verify for each purchase.
+        :param ordered: yield results in input order, a slow purchase holds back the ones after it.
+        """
+        verify = self.verify_with_result if with_result else self.verify
+        bounded = bounded_in_order if ordered else bounded_as_completed
+
+        async for result in bounded(lambda purchase: verify(*purchase), purchases, concurrency):
+            yield result
+
+    async def verify_many(
+        self,
+        purchases: Union[Iterable[Purchase], AsyncIterable[Purchase]],
+        concurrency: int = 10,
+        with_result: bool = False,
+    ) -> List[BulkResult]:
+        """Verifies many purchases, returns a BulkResult per purchase in input order."""
+        results = [result async for result in self.verify_stream(purchases, concurrency, with_result)]
+        return sorted(results, key=lambda result: result.index)
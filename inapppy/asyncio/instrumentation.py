@@ -0,0 +1,26 @@
+import time
+from typing import List
+
+from aiohttp import TraceConfig
+
+from ..instrumentation import Instrumentation
+
+
+def trace_configs(instrumentation: Instrumentation, prefix: str) -> List[TraceConfig]:
+    """aiohttp trace configs reporting ``<prefix>.connect`` timings of new connections.
+
+    Nothing is traced when the instrumentation is not enabled.
+    """
+    if not instrumentation.enabled:
+        return []
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_started = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        instrumentation.timing(f"{prefix}.connect", time.perf_counter() - context.connect_started)
+
+    trace_config = TraceConfig()
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return [trace_config]
@@ -0,0 +1,39 @@
+import asyncio
+
+
+class SingleFlight:
+    """The asyncio version of the single flight call coalescing.
+
+    The call runs in a task of its own that every caller awaits through ``asyncio.shield``, so a
+    cancelled caller, the first one included, neither cancels the call nor the other callers.
+    """
+
+    def __init__(self) -> None:
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+        self._calls = {}
+
+    def stats(self) -> dict:
+        return {"upstream_calls": self.upstream_calls, "coalesced_calls": self.coalesced_calls}
+
+    async def do(self, key, func, *args, **kwargs):
+        call = self._calls.get(key)
+        if call is None:
+            self.upstream_calls += 1
+            call = self._calls[key] = asyncio.ensure_future(self._fly(key, func, *args, **kwargs))
+            call.add_done_callback(_retrieve)
+        else:
+            self.coalesced_calls += 1
+        return await asyncio.shield(call)
+
+    async def _fly(self, key, func, *args, **kwargs):
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            del self._calls[key]
+
+
+def _retrieve(call: asyncio.Future) -> None:
+    # mark the exception as retrieved, every caller may have been cancelled.
+    if not call.cancelled():
+        call.exception()
@@ -0,0 +1,79 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+
+class BulkResult:
+    """Outcome of a single item processed by a bulk validation call.
+
+    Exactly one of ``result`` and ``error`` is set, ``index`` is the item position in the input.
+    """
+
+    __slots__ = ("index", "item", "result", "error")
+
+    def __init__(self, index: int, item, result=None, error: Exception = None):
+        self.index = index
+        self.item = item
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        return f"BulkResult(index={self.index}, result={self.result!r}, error={self.error!r})"
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _completed(pending: list, ordered: bool) -> list:
+    if ordered:
+        return [pending.pop(0)]
+
+    done, _ = wait([future for future, _ in pending], return_when=FIRST_COMPLETED)
+    completed = [entry for entry in pending if entry[0] in done]
+    for entry in completed:
+        pending.remove(entry)
+    return completed
+
+
+def process_pool_stream(
+    func: Callable[[list], List[Tuple]],
+    items: Iterable,
+    workers: int = None,
+    chunksize: int = 256,
+    ordered: bool = True,
+    initializer: Callable = None,
+    initargs: tuple = (),
+) -> Iterator[BulkResult]:
+    """Fans ``items`` out to a process pool in chunks, yielding a BulkResult per item.
+
+    ``func`` runs in the workers, it takes a list of items and returns a ``(result, error)`` pair
+    per item. At most two chunks per worker are in flight, so the input is consumed lazily.
+    Results are yielded in input order, or as chunks complete when ``ordered`` is false.
+    """
+    workers = workers or os.cpu_count() or 1
+    pending = []
+
+    def results(entries: list) -> Iterator[BulkResult]:
+        for future, chunk in entries:
+            for (index, item), (result, error) in zip(chunk, future.result()):
+                yield BulkResult(index, item, result=result, error=error)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        for chunk in _chunks(enumerate(items), chunksize):
+            pending.append((executor.submit(func, [item for _, item in chunk]), chunk))
+            while len(pending) >= workers * 2:
+                yield from results(_completed(pending, ordered))
+
+        while pending:
+            yield from results(_completed(pending, ordered))
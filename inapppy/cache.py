@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe, size bounded mapping evicting the least recently used entries."""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+
+class CacheBackend:
+    """Interface of validation result caches.
+
+    Implement it to keep results in an external store, values are plain json-serializable dicts.
+    """
+
+    def get(self, key: str):
+        """Returns the cached value or None when missing or expired."""
+        raise NotImplementedError
+
+    def set(self, key: str, value, ttl: float) -> None:
+        """Stores the value for ttl seconds."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """In-process cache backend with per-entry TTL and LRU eviction.
+
+    Cached values are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, maxsize: int = 1024, clock=time.monotonic) -> None:
+        self.clock = clock
+        self._entries = LRUCache(maxsize)
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        value, expires_at = entry
+        if expires_at <= self.clock():
+            self._entries.delete(key)
+            return None
+        return value
+
+    def set(self, key: str, value, ttl: float) -> None:
+        if ttl <= 0:
+            self._entries.delete(key)
+        else:
+            self._entries.set(key, (value, self.clock() + ttl))
+
+    def delete(self, key: str) -> None:
+        self._entries.delete(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
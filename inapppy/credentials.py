@@ -0,0 +1,267 @@
+"""Service account credentials and access tokens shared between verifiers, threads and processes."""
+import calendar
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from google.auth.credentials import Credentials
+from google.oauth2 import service_account
+
+from inapppy.errors import InAppPyError
+
+# Tokens are refreshed in the background once they are this many seconds from expiry.
+REFRESH_MARGIN = 300
+# Tokens closer than this to expiry are not used anymore, callers wait for a new one.
+MIN_VALIDITY = 30
+
+# keyfile path -> ((mtime, size), service account info)
+_keyfiles: Dict[str, Tuple[tuple, dict]] = {}
+
+
+def load_service_account_info(play_console_credentials: Union[str, dict]) -> dict:
+    """Service account info from a keyfile path or a dict, keyfiles are read once until they change."""
+    # If str, assume it's a filepath
+    if isinstance(play_console_credentials, str):
+        try:
+            stat = os.stat(play_console_credentials)
+        except OSError:
+            raise InAppPyError(f"Google play console credentials file does not exist: {play_console_credentials}")
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = _keyfiles.get(play_console_credentials)
+        if cached is None or cached[0] != signature:
+            with open(play_console_credentials) as credentials:
+                cached = (signature, json.load(credentials))
+            _keyfiles[play_console_credentials] = cached
+        return cached[1]
+    # If dict, assume parsed json
+    if isinstance(play_console_credentials, dict):
+        return play_console_credentials
+    raise InAppPyError(
+        f"Unknown play console credentials format: {repr(play_console_credentials)}, expected 'dict' or 'str' types"
+    )
+
+
+def token_key(service_account_info: dict, scope: str) -> str:
+    return " ".join((service_account_info["client_email"], scope, service_account_info.get("token_uri", "")))
+
+
+class TokenCache:
+    """Thread-safe in-memory cache of access tokens and their expiry, as epoch seconds."""
+
+    def __init__(self) -> None:
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        return self._tokens.get(key)
+
+    def set(self, key: str, token: str, expiry: float) -> None:
+        with self._lock:
+            self._tokens[key] = (token, expiry)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._tokens.pop(key, None)
+
+
+class FileTokenCache(TokenCache):
+    """Token cache persisted in a directory, so forked or separate worker processes reuse tokens.
+
+    Token files are only readable by their owner, even in an existing shared directory, and replaced atomically.
+    """
+
+    def __init__(self, directory: str) -> None:
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"inapppy-token-{hashlib.sha256(key.encode()).hexdigest()}.json")
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        cached = super().get(key)
+        if cached is not None and cached[1] - REFRESH_MARGIN > time.time():
+            return cached
+
+        try:
+            with open(self._path(key)) as file:
+                stored = json.load(file)
+            stored = (stored["token"], float(stored["expiry"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            return cached
+
+        if cached is None or stored[1] > cached[1]:
+            super().set(key, *stored)
+            return stored
+        return cached
+
+    def set(self, key: str, token: str, expiry: float) -> None:
+        super().set(key, token, expiry)
+
+        descriptor, path = tempfile.mkstemp(dir=self.directory, prefix=".inapppy-token-")
+        try:
+            with os.fdopen(descriptor, "w") as file:
+                json.dump({"token": token, "expiry": expiry}, file)
+            # the directory may be shared, never rely on its permissions or on the umask.
+            os.chmod(path, 0o600)
+            os.replace(path, self._path(key))
+        except OSError:
+            # the file cache is best effort, the token is cached in memory anyway.
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def delete(self, key: str) -> None:
+        super().delete(key)
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+
+default_token_cache = TokenCache()
+
+
+class SharedTokenCredentials(Credentials):
+    """google-auth credentials whose access tokens are shared through a TokenCache.
+
+    The wrapped credentials are only loaded, by load_credentials, when a token has to be minted.
+    Tokens within REFRESH_MARGIN of expiry keep being used while a background thread refreshes them.
+    """
+
+    def __init__(self, load_credentials: Callable[[], Credentials], key: str, token_cache: TokenCache) -> None:
+        super().__init__()
+        self.load_credentials = load_credentials
+        self._credentials = None
+        self.key = key
+        self.token_cache = token_cache
+        self._lock = threading.Lock()
+        # guards _refreshing only, so checking it never waits for a refresh in progress.
+        self._refreshing_lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def credentials(self) -> Credentials:
+        if self._credentials is None:
+            self._credentials = self.load_credentials()
+        return self._credentials
+
+    def refresh(self, request) -> None:
+        # called by AuthorizedSession when a token was rejected, always mint a new one.
+        with self._lock:
+            self._refresh(request)
+
+    @property
+    def valid(self) -> bool:
+        # the token lives in the token cache, it may have been minted by another verifier or process.
+        cached = self.token_cache.get(self.key)
+        return cached is not None and time.time() < cached[1] - MIN_VALIDITY
+
+    def before_request(self, request, method, url, headers) -> None:
+        self.apply(headers, self.get_token(request))
+
+    def apply(self, headers, token=None) -> None:
+        if token is None:
+            cached = self.token_cache.get(self.key)
+            token = cached[0] if cached is not None else self.token
+        headers["authorization"] = f"Bearer {token}"
+
+    def get_token(self, request) -> str:
+        cached = self.token_cache.get(self.key)
+        if cached is not None:
+            token, expiry = cached
+            now = time.time()
+            if now < expiry - REFRESH_MARGIN:
+                return token
+            if now < expiry - MIN_VALIDITY:
+                self._refresh_in_background(request)
+                return token
+
+        with self._lock:
+            cached = self.token_cache.get(self.key)
+            if cached is not None and time.time() < cached[1] - MIN_VALIDITY:
+                return cached[0]
+            return self._refresh(request)
+
+    def _refresh(self, request) -> str:
+        credentials = self.credentials
+        credentials.refresh(request)
+        expiry = credentials.expiry
+        expiry = calendar.timegm(expiry.utctimetuple()) if expiry is not None else time.time() + 3600
+
+        self.token = credentials.token
+        self.expiry = credentials.expiry
+        self.token_cache.set(self.key, self.token, expiry)
+        return self.token
+
+    def _refresh_in_background(self, request) -> None:
+        with self._refreshing_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                with self._lock:
+                    self._refresh(request)
+            except Exception:
+                # the token is still valid, the next call past the margin retries.
+                pass
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+# Private keys are slow to load, parsed credentials are kept per service account key and scope.
+_service_accounts: Dict[tuple, service_account.Credentials] = {}
+_shared_credentials: "weakref.WeakKeyDictionary[TokenCache, dict]" = weakref.WeakKeyDictionary()
+_credentials_lock = threading.Lock()
+
+
+def _account_key(service_account_info: dict, scope: str) -> tuple:
+    try:
+        return token_key(service_account_info, scope), service_account_info["private_key"]
+    except KeyError as e:
+        raise InAppPyError(f"Bad play console credentials: {e!r}")
+
+
+def service_account_credentials(service_account_info: dict, scope: str) -> service_account.Credentials:
+    """google-auth service account credentials, the private key is parsed once per process."""
+    account_key = _account_key(service_account_info, scope)
+
+    credentials = _service_accounts.get(account_key)
+    if credentials is None:
+        try:
+            credentials = service_account.Credentials.from_service_account_info(service_account_info, scopes=[scope])
+        except ValueError as e:
+            raise InAppPyError(f"Bad play console credentials: {e!r}")
+        with _credentials_lock:
+            credentials = _service_accounts.setdefault(account_key, credentials)
+    return credentials
+
+
+def shared_credentials(
+    service_account_info: dict, scope: str, token_cache: TokenCache = None
+) -> SharedTokenCredentials:
+    """Credentials of a service account and scope, shared by all verifiers using the same token cache.
+
+    The private key is parsed on the first token refresh, never when the token cache has a valid token.
+    """
+    token_cache = token_cache if token_cache is not None else default_token_cache
+    account_key = _account_key(service_account_info, scope)
+
+    with _credentials_lock:
+        by_account = _shared_credentials.setdefault(token_cache, {})
+        credentials = by_account.get(account_key)
+        if credentials is None:
+            credentials = SharedTokenCredentials(
+                lambda: service_account_credentials(service_account_info, scope), account_key[0], token_cache
+            )
+            by_account[account_key] = credentials
+    return credentials
@@ -25,3 +25,33 @@ class InAppPyValidationError(InAppPyError):
 
 class GoogleError(InAppPyValidationError):
     pass
+
+
+class ReceiptError(InAppPyValidationError):
+    """App Store receipt rejected by local decoding, before it was sent to Apple."""
+
+    pass
+
+
+class AppStoreHTTPError(InAppPyValidationError):
+    """verifyReceipt could not be reached or did not answer with JSON, a transient failure."""
+
+    pass
+
+
+class CircuitOpenError(InAppPyValidationError):
+    """Failed fast without a request, the circuit breaker saw too many transient failures."""
+
+    pass
+
+
+class DeadlineExceededError(InAppPyValidationError):
+    """The validation deadline passed before a final response, raw_response is the last transient one."""
+
+    pass
+
+
+class GoogleRateLimitError(GoogleError):
+    """androidpublisher quota exceeded (429) after retries, or call shed by the client-side rate limiter."""
+
+    pass
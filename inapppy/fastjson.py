@@ -0,0 +1,21 @@
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+JSONInput = Union[str, bytes, bytearray, memoryview]
+
+
+def loads(data: JSONInput) -> Any:
+    """Parses JSON with orjson when installed, json otherwise.
+
+    orjson reads str, bytes, bytearray and memoryview in place. Raises ValueError on bad input.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
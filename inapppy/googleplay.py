@@ -1,16 +1,50 @@
 import base64
-import datetime
 import json
 import os
-from typing import Union
+import re
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type, Union
 
-import httplib2
-import rsa
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from oauth2client.service_account import ServiceAccountCredentials
+from inapppy import fastjson
+from inapppy.bulk import BulkResult, _chunks, process_pool_stream
+from inapppy.cache import CacheBackend
+from inapppy.errors import GoogleError, GoogleRateLimitError, InAppPyError, InAppPyValidationError
+from inapppy.fastjson import JSONInput
+from inapppy.instrumentation import Instrumentation, null_instrumentation
+from inapppy.ratelimit import TokenBucket, parse_retry_after
+from inapppy.singleflight import SingleFlight
 
-from inapppy.errors import GoogleError, InAppPyError, InAppPyValidationError
+if TYPE_CHECKING:  # pragma: no cover
+    from inapppy.credentials import TokenCache
+    from inapppy.signature import SignatureBackend
+
+# The google client libraries, requests and the crypto backends are imported on first use,
+# so importing inapppy (e.g. for the App Store validator only) stays cheap.
+DEFAULT_MAX_REDIRECTS = 5  # httplib2.DEFAULT_MAX_REDIRECTS
+
+# Most calls a batched HTTP request may carry, googleapiclient.http.MAX_BATCH_LIMIT.
+MAX_BATCH_SIZE = 1000
+
+# (purchase_token, product_sku[, is_subscription]) of the bulk verification methods.
+Purchase = Union[Tuple[str, str], Tuple[str, str, bool]]
+
+# Fast path to the packageName of a flat receipt, escaped names fall back to a full parse.
+_PACKAGE_NAME = re.compile(rb'"packageName"\s*:\s*"([^"\\]*)"')
+
+
+def build(*args, **kwargs):
+    """googleapiclient.discovery.build, imported on first use."""
+    from googleapiclient.discovery import build
+
+    return build(*args, **kwargs)
+
+
+def build_from_document(*args, **kwargs):
+    """googleapiclient.discovery.build_from_document, imported on first use."""
+    from googleapiclient.discovery import build_from_document
+
+    return build_from_document(*args, **kwargs)
 
 
 def make_pem(public_key: str) -> str:
@@ -18,10 +52,21 @@ def make_pem(public_key: str) -> str:
     return "\n".join(("-----BEGIN PUBLIC KEY-----", "\n".join(value), "-----END PUBLIC KEY-----"))
 
 
+def _receipt_bytes(receipt: JSONInput) -> Union[bytes, bytearray, memoryview]:
+    return receipt.encode() if isinstance(receipt, str) else receipt
+
+
 class GooglePlayValidator:
     purchase_state_ok = 0
 
-    def __init__(self, bundle_id: str, api_key: str, default_valid_purchase_state: int = 0) -> None:
+    def __init__(
+        self,
+        bundle_id: str,
+        api_key: str,
+        default_valid_purchase_state: int = 0,
+        signature_backend: Type["SignatureBackend"] = None,
+        instrumentation: Instrumentation = None,
+    ) -> None:
         """
         Arguments:
             bundle_id: str - Also known as Android app's package name. E.g.:
@@ -32,6 +77,12 @@ class GooglePlayValidator:
                 Services & APIs.
 
             default_valid_purchase_state: int - Accepted purchase state.
+
+            signature_backend: SignatureBackend subclass used to verify signatures.
+                Defaults to the cryptography (OpenSSL) backend when installed,
+                falls back to the pure python rsa backend.
+
+            instrumentation: Instrumentation - Receives googleplay.signature timings.
         """
         if not bundle_id:
             raise InAppPyValidationError("bundle_id cannot be empty.")
@@ -40,21 +91,38 @@ class GooglePlayValidator:
             raise InAppPyValidationError("api_key cannot be empty.")
 
         self.bundle_id = bundle_id
+        self.api_key = api_key
         self.purchase_state_ok = default_valid_purchase_state
+        self.instrumentation = instrumentation if instrumentation is not None else null_instrumentation
+
+        if signature_backend is None:
+            from inapppy.signature import default_signature_backend
+
+            signature_backend = default_signature_backend()
+        import rsa
 
         pem = make_pem(api_key)
+        self._signature_backend = signature_backend(pem)
+        # public_key is an rsa.PublicKey whatever the backend verifying signatures.
+        public_key = self._signature_backend.public_key
+        if not isinstance(public_key, rsa.PublicKey):
+            public_key = rsa.PublicKey.load_pkcs1_openssl_pem(pem)
+        self.public_key = public_key
 
-        try:
-            self.public_key = rsa.PublicKey.load_pkcs1_openssl_pem(pem)
-        except TypeError:
-            raise InAppPyValidationError("Bad API key")
+    def validate(self, receipt: JSONInput, signature: str) -> dict:
+        """Validates a receipt given as str, or as bytes, bytearray or memoryview without copying it.
 
-    def validate(self, receipt: str, signature: str) -> dict:
+        The receipt is parsed only after its signature is verified.
+        """
+        receipt = _receipt_bytes(receipt)
         if not self._validate_signature(receipt, signature):
             raise InAppPyValidationError("Bad signature")
 
+        return self._parse_receipt(receipt)
+
+    def _parse_receipt(self, receipt: JSONInput) -> dict:
         try:
-            receipt_json = json.loads(receipt)
+            receipt_json = fastjson.loads(receipt)
 
             if receipt_json["packageName"] != self.bundle_id:
                 raise InAppPyValidationError("Bundle ID  mismatch")
@@ -62,29 +130,264 @@ class GooglePlayValidator:
             elif receipt_json["purchaseState"] != self.purchase_state_ok:
                 raise InAppPyValidationError("Item is not purchased")
 
-            return receipt_json
-        except (KeyError, ValueError):
+        except (KeyError, TypeError, ValueError):
             raise InAppPyValidationError("Bad receipt")
 
-    def _validate_signature(self, receipt: str, signature: str) -> bool:
+        return receipt_json
+
+    def validate_batch(
+        self,
+        receipts: Iterable[Tuple[str, str]],
+        workers: int = None,
+        chunksize: int = 256,
+        ordered: bool = True,
+    ) -> Iterator[BulkResult]:
+        """Validates (receipt, signature) pairs on a pool of worker processes.
+
+        Each worker loads the public key once. Yields a BulkResult per pair, failed pairs carry
+        the validation error instead of raising.
+
+        :param receipts: iterable of (receipt, signature) pairs, consumed lazily.
+        :param workers: number of worker processes, defaults to the number of CPUs.
+        :param chunksize: number of pairs sent to a worker at once.
+        :param ordered: yield results in input order, otherwise as chunks complete.
+        """
+        return process_pool_stream(
+            _validate_batch_chunk,
+            receipts,
+            workers=workers,
+            chunksize=chunksize,
+            ordered=ordered,
+            initializer=_init_batch_worker,
+            initargs=(type(self), self._batch_worker_args()),
+        )
+
+    def _batch_worker_args(self) -> tuple:
+        return self.bundle_id, self.api_key, self.purchase_state_ok, type(self._signature_backend)
+
+    def _validate_signature(self, receipt: JSONInput, signature: str) -> bool:
+        started = time.perf_counter()
         try:
             sig = base64.standard_b64decode(signature)
-            return rsa.verify(receipt.encode(), sig, self.public_key)
+            valid = self._signature_backend.verify(_receipt_bytes(receipt), sig)
         except BaseException:
-            return False
+            valid = False
+        self.instrumentation.timing("googleplay.signature", time.perf_counter() - started, valid=valid)
+        return valid
 
 
-class GoogleVerificationResult:
-    """Google verification result class."""
+class GooglePlayValidatorRegistry:
+    """Validates receipts of many Android apps, routing each receipt by its packageName.
+
+    Public keys are parsed once when they are added. Keys can be added, replaced or removed
+    while receipts are being validated.
+    """
+
+    def __init__(
+        self,
+        api_keys: Dict[str, str] = None,
+        default_valid_purchase_state: int = 0,
+        signature_backend: Type["SignatureBackend"] = None,
+        instrumentation: Instrumentation = None,
+    ) -> None:
+        """
+        Arguments:
+            api_keys: dict - Application's Base64-encoded RSA public key by bundle id.
+            default_valid_purchase_state: int - Accepted purchase state.
+            signature_backend: SignatureBackend subclass used to verify signatures.
+            instrumentation: Instrumentation - Shared by the validators of all apps.
+        """
+        self.purchase_state_ok = default_valid_purchase_state
+        self.signature_backend = signature_backend
+        self.instrumentation = instrumentation
+        self._validators = {}
+        self._lock = threading.Lock()
+
+        for bundle_id, api_key in (api_keys or {}).items():
+            self.add_key(bundle_id, api_key)
 
-    raw_response: dict = {}
-    is_expired: bool = False
-    is_canceled: bool = False
+    def __contains__(self, bundle_id: str) -> bool:
+        return bundle_id in self._validators
 
-    def __init__(self, raw_response: dict, is_expired: bool, is_canceled: bool):
+    def __len__(self) -> int:
+        return len(self._validators)
+
+    @property
+    def api_keys(self) -> Dict[str, str]:
+        return {bundle_id: validator.api_key for bundle_id, validator in self._validators.items()}
+
+    def add_key(self, bundle_id: str, api_key: str) -> None:
+        """Adds the public key of an app, replacing its current key if there is one."""
+        validator = GooglePlayValidator(
+            bundle_id, api_key, self.purchase_state_ok, self.signature_backend, self.instrumentation
+        )
+        # Copy on write, readers always see a complete mapping without taking the lock.
+        with self._lock:
+            validators = dict(self._validators)
+            validators[bundle_id] = validator
+            self._validators = validators
+
+    def remove_key(self, bundle_id: str) -> None:
+        with self._lock:
+            validators = dict(self._validators)
+            validators.pop(bundle_id, None)
+            self._validators = validators
+
+    def validator(self, bundle_id: str) -> GooglePlayValidator:
+        try:
+            return self._validators[bundle_id]
+        except KeyError:
+            raise InAppPyValidationError(f"Unknown bundle ID: {bundle_id}")
+
+    def validate(self, receipt: JSONInput, signature: str) -> dict:
+        receipt = _receipt_bytes(receipt)
+        validator = self.validator(self._package_name(receipt))
+
+        if not validator._validate_signature(receipt, signature):
+            raise InAppPyValidationError("Bad signature")
+
+        # the validator checks the parsed packageName again.
+        return validator._parse_receipt(receipt)
+
+    @staticmethod
+    def _package_name(receipt: Union[bytes, bytearray, memoryview]) -> str:
+        match = _PACKAGE_NAME.search(receipt)
+        if match is not None:
+            return match.group(1).decode()
+
+        try:
+            return fastjson.loads(receipt)["packageName"]
+        except (KeyError, TypeError, ValueError):
+            raise InAppPyValidationError("Bad receipt")
+
+    def validate_batch(
+        self,
+        receipts: Iterable[Tuple[str, str]],
+        workers: int = None,
+        chunksize: int = 256,
+        ordered: bool = True,
+    ) -> Iterator[BulkResult]:
+        """Validates (receipt, signature) pairs of any registered app on a pool of worker processes.
+
+        See GooglePlayValidator.validate_batch.
+        """
+        return process_pool_stream(
+            _validate_batch_chunk,
+            receipts,
+            workers=workers,
+            chunksize=chunksize,
+            ordered=ordered,
+            initializer=_init_batch_worker,
+            initargs=(type(self), self._batch_worker_args()),
+        )
+
+    def _batch_worker_args(self) -> tuple:
+        return self.api_keys, self.purchase_state_ok, self.signature_backend
+
+
+# Validator of a validate_batch worker process, created once by the pool initializer.
+_batch_validator = None
+
+
+def _init_batch_worker(validator_class: type, args: tuple) -> None:
+    global _batch_validator
+    _batch_validator = validator_class(*args)
+
+
+def _validate_batch_chunk(receipts: List[Tuple[str, str]]) -> List[tuple]:
+    results = []
+    for receipt, signature in receipts:
+        try:
+            results.append((_batch_validator.validate(receipt, signature), None))
+        except Exception as e:
+            # one bad item must not fail the whole chunk, it gets its error like the asyncio bulk helpers.
+            results.append((None, e))
+    return results
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _int_or_none(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class GoogleVerificationResult:
+    """Google verification result class.
+
+    Unless given, is_expired and is_canceled are evaluated from the raw response when read,
+    expiry against clock, a callable returning the current time in milliseconds.
+    """
+
+    __slots__ = ("raw_response", "is_subscription", "clock", "_is_expired", "_is_canceled")
+
+    def __init__(
+        self,
+        raw_response: dict,
+        is_expired: bool = None,
+        is_canceled: bool = None,
+        is_subscription: bool = False,
+        clock: Callable[[], int] = _now_ms,
+    ):
         self.raw_response = raw_response
-        self.is_expired = is_expired
-        self.is_canceled = is_canceled
+        self.is_subscription = is_subscription
+        self.clock = clock
+        self._is_expired = is_expired
+        self._is_canceled = is_canceled
+
+    @property
+    def expiry_time_ms(self) -> Optional[int]:
+        return _int_or_none(self.raw_response.get("expiryTimeMillis"))
+
+    @property
+    def auto_renewing(self) -> Optional[bool]:
+        return self.raw_response.get("autoRenewing")
+
+    @property
+    def payment_state(self) -> Optional[int]:
+        return _int_or_none(self.raw_response.get("paymentState"))
+
+    @property
+    def cancel_reason(self) -> Optional[int]:
+        return _int_or_none(self.raw_response.get("cancelReason"))
+
+    @property
+    def purchase_state(self) -> Optional[int]:
+        return _int_or_none(self.raw_response.get("purchaseState"))
+
+    @property
+    def is_expired(self) -> bool:
+        if self._is_expired is not None:
+            return self._is_expired
+        if not self.is_subscription:
+            return False
+
+        # a missing, 0 or malformed expiry is expired.
+        try:
+            expiry_time_ms = int(self.raw_response.get("expiryTimeMillis") or 0)
+        except (TypeError, ValueError):
+            return True
+        return not expiry_time_ms or expiry_time_ms < self.clock()
+
+    @is_expired.setter
+    def is_expired(self, value: bool) -> None:
+        self._is_expired = value
+
+    @property
+    def is_canceled(self) -> bool:
+        if self._is_canceled is not None:
+            return self._is_canceled
+        if self.is_subscription:
+            return bool(self.cancel_reason)
+        return self.purchase_state != 0
+
+    @is_canceled.setter
+    def is_canceled(self, value: bool) -> None:
+        self._is_canceled = value
 
     def __repr__(self):
         return (
@@ -95,134 +398,456 @@ class GoogleVerificationResult:
         )
 
 
+def _http_error() -> type:
+    from googleapiclient.errors import HttpError
+
+    return HttpError
+
+
+class PooledHttp:
+    """httplib2 compatible transport backed by a pooled, keep-alive requests session.
+
+    googleapiclient only calls ``request()`` on its http object, so any requests session
+    (e.g. google-auth's ``AuthorizedSession``) can be used in place of ``httplib2.Http``.
+    Unlike ``httplib2.Http`` it is safe to share between threads.
+    """
+
+    def __init__(self, session, timeout: int = None) -> None:
+        self.session = session
+        self.timeout = timeout
+
+    @property
+    def credentials(self):
+        """Credentials of the session, batched requests refresh them when a call is answered with 401."""
+        return getattr(self.session, "credentials", None)
+
+    def request(
+        self,
+        uri: str,
+        method: str = "GET",
+        body=None,
+        headers: dict = None,
+        redirections: int = DEFAULT_MAX_REDIRECTS,
+        connection_type=None,
+    ):
+        response = self.session.request(
+            method, uri, data=body, headers=headers, timeout=self.timeout, allow_redirects=bool(redirections)
+        )
+
+        info = {key.lower(): value for key, value in response.headers.items()}
+        info["status"] = str(response.status_code)
+        # body is already decoded by requests.
+        info.pop("content-encoding", None)
+
+        import httplib2
+
+        http_response = httplib2.Response(info)
+        http_response.reason = response.reason
+        return http_response, response.content
+
+    def close(self) -> None:
+        self.session.close()
+
+
 class GooglePlayVerifier:
     DEFAULT_AUTH_SCOPE = "https://www.googleapis.com/auth/androidpublisher"
-
-    def __init__(self, bundle_id: str, play_console_credentials: Union[str, dict], http_timeout: int = 15) -> None:
+    # seconds before the first retry of a 429 without Retry-After, doubled every retry.
+    RATE_LIMIT_BACKOFF = 1.0
+    # longer Retry-After waits are not waited for, the GoogleRateLimitError is raised straight away.
+    MAX_RETRY_AFTER = 60.0
+
+    def __init__(
+        self,
+        bundle_id: str,
+        play_console_credentials: Union[str, dict],
+        http_timeout: int = 15,
+        discovery_document: Union[str, dict] = None,
+        http=None,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        coalesce_requests: bool = False,
+        cache: CacheBackend = None,
+        cache_max_staleness: int = 3600,
+        token_cache: "TokenCache" = None,
+        instrumentation: Instrumentation = None,
+        rate_limiter: TokenBucket = None,
+        rate_limit_retries: int = 2,
+    ) -> None:
         """
         Arguments:
             bundle_id: str - Also known as Android app's package name.
             play_console_credentials - Path or dict contents of Google's Service Credentials
             http_timeout: int - HTTP connection timeout.
+            discovery_document - Optional path or dict contents of the androidpublisher v3
+                discovery document. When given, the service is built from it instead of
+                the discovery document bundled with googleapiclient.
+            http - Optional authorized httplib2 compatible transport. By default a pooled,
+                thread-safe PooledHttp over google-auth's AuthorizedSession is used.
+            pool_connections: int - Number of per-host connection pools to cache.
+            pool_maxsize: int - Maximum number of kept-alive connections per host.
+            coalesce_requests: bool - Concurrent checks of the same purchase share one upstream
+                call, see single_flight.stats() for coalesced vs upstream call counts.
+            cache: CacheBackend - Optional cache of raw purchase responses, e.g. MemoryCache.
+                Call invalidate(purchase_token) when a real-time developer notification arrives.
+            cache_max_staleness: int - Maximum seconds a response is cached, subscription
+                responses are never cached past their expiryTimeMillis, expired ones not at all.
+            token_cache: TokenCache - Where access tokens are shared, by service account and
+                scope. Defaults to a process wide in-memory cache, use a FileTokenCache to
+                share tokens between worker processes.
+            instrumentation: Instrumentation - Receives request timings, HTTP statuses, cache
+                hits and errors, e.g. a MetricsRecorder. See inapppy.instrumentation.
+            rate_limiter: TokenBucket - Optional client-side rate limit of androidpublisher calls,
+                may be shared between verifiers of the same Google Cloud project.
+            rate_limit_retries: int - Retries of calls answered with 429, after Retry-After or an
+                exponential backoff. A GoogleRateLimitError is raised once they are exhausted.
         """
         self.bundle_id = bundle_id
         self.play_console_credentials = play_console_credentials
         self.http_timeout = http_timeout
-        self.http = self._authorize()
-
-    @staticmethod
-    def _ms_timestamp_expired(ms_timestamp: str) -> bool:
-        now = datetime.datetime.utcnow()
-
-        # Return if it's 0/None, expired.
-        if not ms_timestamp:
-            return True
-
-        ms_timestamp_value = int(ms_timestamp) / 1000
-
-        # Return if it's 0, expired.
-        if not ms_timestamp_value:
-            return True
-
-        return datetime.datetime.utcfromtimestamp(ms_timestamp_value) < now
+        self.discovery_document = discovery_document
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.token_cache = token_cache
+        self.http = http if http is not None else self._authorize()
+        self.single_flight = SingleFlight() if coalesce_requests else None
+        self.cache = cache
+        self.cache_max_staleness = cache_max_staleness
+        self.instrumentation = instrumentation if instrumentation is not None else null_instrumentation
+        self.rate_limiter = rate_limiter
+        self.rate_limit_retries = rate_limit_retries
+
+        # androidpublisher service is built once on first use and shared between calls.
+        self._service = None
+        self._service_lock = threading.Lock()
+
+    def _authorize(self) -> PooledHttp:
+        from google.auth.transport.requests import AuthorizedSession
+        from requests.adapters import HTTPAdapter
+
+        from inapppy.credentials import load_service_account_info, shared_credentials
+
+        credentials = shared_credentials(
+            load_service_account_info(self.play_console_credentials), self.DEFAULT_AUTH_SCOPE, self.token_cache
+        )
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return PooledHttp(session, timeout=self.http_timeout)
 
     @staticmethod
-    def _create_credentials(play_console_credentials: Union[str, dict], scope_str: str):
+    def _load_discovery_document(discovery_document: Union[str, dict]) -> dict:
         # If str, assume it's a filepath
-        if isinstance(play_console_credentials, str):
-            if not os.path.exists(play_console_credentials):
-                raise InAppPyError(f"Google play console credentials file does not exist: {play_console_credentials}")
-            return ServiceAccountCredentials.from_json_keyfile_name(play_console_credentials, scope_str)
+        if isinstance(discovery_document, str):
+            if not os.path.exists(discovery_document):
+                raise InAppPyError(f"Discovery document file does not exist: {discovery_document}")
+            with open(discovery_document) as document:
+                return json.load(document)
         # If dict, assume parsed json
-        if isinstance(play_console_credentials, dict):
-            return ServiceAccountCredentials.from_json_keyfile_dict(play_console_credentials, scope_str)
+        if isinstance(discovery_document, dict):
+            return discovery_document
         raise InAppPyError(
-            f"Unknown play console credentials format: {repr(play_console_credentials)}, "
-            "expected 'dict' or 'str' types"
+            f"Unknown discovery document format: {repr(discovery_document)}, expected 'dict' or 'str' types"
         )
 
-    def _authorize(self):
-        http = httplib2.Http(timeout=self.http_timeout)
-        credentials = self._create_credentials(self.play_console_credentials, self.DEFAULT_AUTH_SCOPE)
-        http = credentials.authorize(http)
-        return http
+    def _build_service(self):
+        if self.discovery_document is None:
+            return build("androidpublisher", "v3", http=self.http)
+        return build_from_document(self._load_discovery_document(self.discovery_document), http=self.http)
+
+    @property
+    def service(self):
+        """androidpublisher service, built lazily once and reused by all calls."""
+        service = self._service
+        if service is None:
+            with self._service_lock:
+                if self._service is None:
+                    self._service = self._build_service()
+                service = self._service
+        return service
 
     def check_purchase_subscription(self, purchase_token: str, product_sku: str, service) -> dict:
         try:
-            purchases = service.purchases()
-            subscriptions = purchases.subscriptions()
-            subscriptions_get = subscriptions.get(
+            subscriptions_get = self._purchase_request(service, purchase_token, product_sku, True)
+            return self._execute(subscriptions_get, "subscriptions")
+        except _http_error() as e:
+            raise self._google_error(e)
+
+    def check_purchase_product(self, purchase_token: str, product_sku: str, service) -> dict:
+        try:
+            products_get = self._purchase_request(service, purchase_token, product_sku, False)
+            return self._execute(products_get, "products")
+        except _http_error() as e:
+            raise self._google_error(e)
+
+    def _purchase_request(self, service, purchase_token: str, product_sku: str, is_subscription: bool):
+        purchases = service.purchases()
+        if is_subscription:
+            return purchases.subscriptions().get(
                 packageName=self.bundle_id, subscriptionId=product_sku, token=purchase_token
             )
-            result = subscriptions_get.execute(http=self.http)
-            return result
-        except HttpError as e:
-            if e.resp.status == 400:
-                raise GoogleError(e.resp.reason, repr(e))
-            else:
-                raise e
+        return purchases.products().get(packageName=self.bundle_id, productId=product_sku, token=purchase_token)
 
-    def check_purchase_product(self, purchase_token: str, product_sku: str, service) -> dict:
+    @staticmethod
+    def _google_error(e) -> Exception:
+        """The error raised for an androidpublisher HttpError, bad requests are GoogleErrors."""
+        if e.resp.status == 400:
+            return GoogleError(e.resp.reason, repr(e))
+        if e.resp.status == 429:
+            return GoogleRateLimitError("Rate limit exceeded", repr(e))
+        return e
+
+    def _execute(self, request, kind: str) -> dict:
+        attempt = 0
+        while True:
+            wait = self._reserve_quota(kind)
+            if wait:
+                time.sleep(wait)
+            try:
+                return self._execute_request(request, kind)
+            except _http_error() as e:
+                if e.resp.status != 429:
+                    raise
+                delay = self._rate_limited(e, attempt, kind)
+
+            time.sleep(delay)
+            attempt += 1
+
+    def _reserve_quota(self, kind: str, calls: int = 1) -> float:
+        """Seconds to wait for the rate limiter before the calls, raises GoogleRateLimitError when they are shed."""
+        instrumentation = self.instrumentation
+        wait = 0.0
+        if self.rate_limiter is not None:
+            wait = self.rate_limiter.reserve(calls)
+            if wait is None:
+                instrumentation.increment("googleplay.shed", kind=kind)
+                raise GoogleRateLimitError("Rate limit budget exhausted")
+            instrumentation.timing("googleplay.throttle", wait, kind=kind)
+
+        instrumentation.increment("googleplay.quota", calls, kind=kind)
+        return wait
+
+    def _rate_limited(self, error, attempt: int, kind: str) -> float:
+        """Seconds to wait before retrying a call answered with 429, raises GoogleRateLimitError to give up."""
+        delay = parse_retry_after(error.resp.get("retry-after"))
+        if delay is None:
+            delay = self.RATE_LIMIT_BACKOFF * 2 ** attempt
+        if attempt >= self.rate_limit_retries or delay > self.MAX_RETRY_AFTER:
+            raise GoogleRateLimitError("Rate limit exceeded", repr(error))
+
+        self.instrumentation.increment("googleplay.backoff", kind=kind)
+        if self.rate_limiter is None:
+            return delay
+        # the retry and every other caller of the bucket wait for its next token.
+        self.rate_limiter.backoff(delay)
+        return 0.0
+
+    def _execute_request(self, request, kind: str) -> dict:
+        instrumentation = self.instrumentation
+        started = time.perf_counter()
         try:
-            purchases = service.purchases()
-            products = purchases.products()
-            products_get = products.get(packageName=self.bundle_id, productId=product_sku, token=purchase_token)
-            result = products_get.execute(http=self.http)
-            return result
-        except HttpError as e:
-            if e.resp.status == 400:
-                raise GoogleError(e.resp.reason, repr(e))
-            else:
-                raise e
+            result = request.execute(http=self.http)
+        except _http_error() as e:
+            instrumentation.increment("googleplay.status", kind=kind, status=e.resp.status)
+            raise
+        except Exception as e:
+            instrumentation.increment("googleplay.error", kind=kind, error=type(e).__name__)
+            raise
+        finally:
+            # googleapiclient decodes the response in execute, decoding is part of the request timing.
+            instrumentation.timing("googleplay.request", time.perf_counter() - started, kind=kind)
+
+        instrumentation.increment("googleplay.status", kind=kind, status=200)
+        return result
 
-    def verify(self, purchase_token: str, product_sku: str, is_subscription: bool = False) -> dict:
-        service = build("androidpublisher", "v3", http=self.http)
+    @classmethod
+    def _check_response(cls, result: dict, is_subscription: bool) -> dict:
+        verification_result = cls._verification_result(result, is_subscription)
 
         if is_subscription:
-            result = self.check_purchase_subscription(purchase_token, product_sku, service)
-            cancel_reason = int(result.get("cancelReason", 0))
-
-            if cancel_reason != 0:
+            if verification_result.is_canceled:
                 raise GoogleError("Subscription is canceled", result)
 
-            ms_timestamp = result.get("expiryTimeMillis", 0)
-
-            if self._ms_timestamp_expired(ms_timestamp):
+            if verification_result.is_expired:
                 raise GoogleError("Subscription expired", result)
-        else:
-            result = self.check_purchase_product(purchase_token, product_sku, service)
-            purchase_state = int(result.get("purchaseState", 1))
 
-            if purchase_state != 0:
-                raise GoogleError("Purchase cancelled", result)
+        elif verification_result.is_canceled:
+            raise GoogleError("Purchase cancelled", result)
 
         return result
 
-    def verify_with_result(
-        self, purchase_token: str, product_sku: str, is_subscription: bool = False
-    ) -> GoogleVerificationResult:
-        """Verifies by returning verification result instead of raising an error,
-        basically it's and better alternative to verify method."""
-        service = build("androidpublisher", "v3", http=self.http)
-        verification_result = GoogleVerificationResult({}, False, False)
+    @classmethod
+    def _verification_result(cls, result: dict, is_subscription: bool) -> GoogleVerificationResult:
+        return GoogleVerificationResult(result, is_subscription=is_subscription)
+
+    def _cache_key(self, purchase_token: str) -> str:
+        return f"inapppy:googleplay:{self.bundle_id}:{purchase_token}"
 
+    def _cached_response(self, purchase_token: str, product_sku: str, is_subscription: bool):
+        if self.cache is None:
+            return None
+
+        entry = self.cache.get(self._cache_key(purchase_token))
+        if entry is None or entry["product_sku"] != product_sku or entry["is_subscription"] != is_subscription:
+            self.instrumentation.increment("googleplay.cache", result="miss")
+            return None
+        self.instrumentation.increment("googleplay.cache", result="hit")
+        return entry["response"]
+
+    def _cache_response(self, purchase_token: str, product_sku: str, is_subscription: bool, result: dict) -> None:
+        if self.cache is None:
+            return
+
+        ttl = self.cache_max_staleness
         if is_subscription:
-            result = self.check_purchase_subscription(purchase_token, product_sku, service)
-            verification_result.raw_response = result
+            # expired (grace period, on hold) subscriptions may recover, they are not cached, nor are
+            # missing or malformed expiries.
+            try:
+                expiry_ms = int(result.get("expiryTimeMillis") or 0)
+            except (TypeError, ValueError):
+                return
+            ttl = min(ttl, expiry_ms / 1000 - time.time())
+            if ttl <= 0:
+                return
+
+        entry = {"product_sku": product_sku, "is_subscription": is_subscription, "response": result}
+        self.cache.set(self._cache_key(purchase_token), entry, ttl)
+
+    def invalidate(self, purchase_token: str) -> None:
+        """Drops the cached response of the purchase, e.g. on a real-time developer notification."""
+        if self.cache is not None:
+            self.cache.delete(self._cache_key(purchase_token))
+
+    def _check_purchase(self, purchase_token: str, product_sku: str, is_subscription: bool) -> dict:
+        result = self._cached_response(purchase_token, product_sku, is_subscription)
+        if result is not None:
+            return result
 
-            cancel_reason = int(result.get("cancelReason", 0))
-            if cancel_reason != 0:
-                verification_result.is_canceled = True
+        service = self.service
+        check = self.check_purchase_subscription if is_subscription else self.check_purchase_product
 
-            ms_timestamp = result.get("expiryTimeMillis", 0)
-            if self._ms_timestamp_expired(ms_timestamp):
-                verification_result.is_expired = True
+        if self.single_flight is None:
+            result = check(purchase_token, product_sku, service)
         else:
-            result = self.check_purchase_product(purchase_token, product_sku, service)
-            verification_result.raw_response = result
+            result = self.single_flight.do(
+                (purchase_token, product_sku, is_subscription), check, purchase_token, product_sku, service
+            )
+
+        self._cache_response(purchase_token, product_sku, is_subscription, result)
+        return result
+
+    def verify(self, purchase_token: str, product_sku: str, is_subscription: bool = False) -> dict:
+        result = self._check_purchase(purchase_token, product_sku, is_subscription)
+        return self._check_response(result, is_subscription)
+
+    def verify_with_result(
+        self, purchase_token: str, product_sku: str, is_subscription: bool = False
+    ) -> GoogleVerificationResult:
+        """Verifies by returning verification result instead of raising an error,
+        basically it's and better alternative to verify method."""
+        result = self._check_purchase(purchase_token, product_sku, is_subscription)
+        return self._verification_result(result, is_subscription)
+
+    def verify_batch(
+        self, purchases: Iterable[Purchase], with_result: bool = False, batch_size: int = 100
+    ) -> Iterator[BulkResult]:
+        """Verifies many purchases with batched HTTP requests, up to batch_size purchases per round trip.
+
+        Yields a BulkResult per purchase in input order. Failed purchases carry their error instead
+        of raising, e.g. the GoogleError of a canceled subscription, a failed batch request fails
+        its purchases only. Cached responses are not requested again.
+
+        :param purchases: (purchase_token, product_sku[, is_subscription]) tuples, consumed lazily.
+        :param with_result: GoogleVerificationResults, like verify_with_result, instead of raising
+            GoogleErrors for canceled or expired purchases.
+        :param batch_size: purchases per batched HTTP request, at most MAX_BATCH_SIZE.
+        """
+        if not 0 < batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+
+        index = 0
+        for chunk in _chunks(purchases, batch_size):
+            yield from self._verify_chunk(index, chunk, with_result)
+            index += len(chunk)
+
+    def _verify_chunk(self, index: int, chunk: List[Purchase], with_result: bool) -> List[BulkResult]:
+        instrumentation = self.instrumentation
+        service = self.service
+        batch = service.new_batch_http_request()
+        responses = {}
+        errors = {}
+        kinds = {}
+
+        def callback(request_id: str, response: dict, exception: Exception) -> None:
+            position = int(request_id)
+            token, sku, is_subscription = _purchase_fields(chunk[position])
+            if exception is not None:
+                instrumentation.increment("googleplay.status", kind=kinds[position], status=exception.resp.status)
+                errors[position] = self._google_error(exception)
+            else:
+                instrumentation.increment("googleplay.status", kind=kinds[position], status=200)
+                responses[position] = response
+                self._cache_response(token, sku, is_subscription, response)
+
+        for position, purchase in enumerate(chunk):
+            token, sku, is_subscription = _purchase_fields(purchase)
+            response = self._cached_response(token, sku, is_subscription)
+            if response is not None:
+                responses[position] = response
+                continue
+
+            kinds[position] = "subscriptions" if is_subscription else "products"
+            request = self._purchase_request(service, token, sku, is_subscription)
+            batch.add(request, callback=callback, request_id=str(position))
+
+        if kinds:
+            self._execute_batch(batch, kinds, errors)
+
+        return [
+            self._batch_result(index + position, purchase, responses.get(position), errors.get(position), with_result)
+            for position, purchase in enumerate(chunk)
+        ]
+
+    def _batch_result(
+        self, index: int, purchase: Purchase, response: Optional[dict], error: Optional[Exception], with_result: bool
+    ) -> BulkResult:
+        if error is not None:
+            return BulkResult(index, purchase, error=error)
+
+        is_subscription = _purchase_fields(purchase)[2]
+        try:
+            if with_result:
+                return BulkResult(index, purchase, self._verification_result(response, is_subscription))
+            return BulkResult(index, purchase, self._check_response(response, is_subscription))
+        except GoogleError as e:
+            return BulkResult(index, purchase, error=e)
+
+    def _execute_batch(self, batch, kinds: Dict[int, str], errors: Dict[int, Exception]) -> None:
+        """Executes a batched request, its failure becomes the error of every purchase in it."""
+        instrumentation = self.instrumentation
+        try:
+            wait = self._reserve_quota("batch", len(kinds))
+            if wait:
+                time.sleep(wait)
+        except GoogleRateLimitError as e:
+            errors.update(dict.fromkeys(kinds, e))
+            return
+
+        started = time.perf_counter()
+        try:
+            batch.execute(http=self.http)
+        except Exception as e:
+            if isinstance(e, _http_error()):
+                instrumentation.increment("googleplay.status", kind="batch", status=e.resp.status)
+                e = self._google_error(e)
+            else:
+                instrumentation.increment("googleplay.error", kind="batch", error=type(e).__name__)
+            for position in kinds:
+                errors.setdefault(position, e)
+        finally:
+            instrumentation.timing("googleplay.request", time.perf_counter() - started, kind="batch")
 
-            purchase_state = int(result.get("purchaseState", 1))
-            if purchase_state != 0:
-                verification_result.is_canceled = True
 
-        return verification_result
+def _purchase_fields(purchase: Purchase) -> Tuple[str, str, bool]:
+    purchase_token, product_sku, *rest = purchase
+    return purchase_token, product_sku, bool(rest and rest[0])
@@ -0,0 +1,166 @@
+"""Instrumentation hooks of the validators: timings of each phase of a call, statuses, retries, cache hits and errors.
+
+Validators take an ``instrumentation`` argument and report to it:
+
+    appstore.request     timing   verifyReceipt round trip, tags: environment
+    appstore.decode      timing   response JSON decode (part of appstore.request in streaming mode)
+    appstore.connect     timing   new connection setup, DNS, TCP and TLS (asyncio only)
+    appstore.status      counter  verifyReceipt statuses, tags: status
+    appstore.env_retry   counter  requests repeated in the other environment (21007/21008)
+    appstore.cache       counter  result cache lookups, tags: result (hit/miss)
+    appstore.error       counter  HTTP or decode errors, tags: error
+    appstore.rejected    counter  receipts rejected by local prevalidation, tags: reason
+    appstore.retry       counter  retried transient failures, tags: reason (http or the status)
+    appstore.deadline    counter  validations out of retry policy deadline
+    appstore.circuit     counter  validations failed fast by an open circuit breaker
+
+    googleplay.request   timing   androidpublisher round trip, tags: kind (products/subscriptions)
+    googleplay.decode    timing   response JSON decode (asyncio only, the sync client decodes in request)
+    googleplay.connect   timing   new connection setup (asyncio only)
+    googleplay.status    counter  androidpublisher HTTP statuses, tags: kind, status
+    googleplay.cache     counter  response cache lookups, tags: result (hit/miss)
+    googleplay.error     counter  transport errors, tags: kind, error
+    googleplay.signature timing   local receipt signature verification, tags: valid
+    googleplay.quota     counter  androidpublisher calls charged to the quota, tags: kind
+    googleplay.throttle  timing   waits for a rate limiter token, tags: kind
+    googleplay.shed      counter  calls shed by the rate limiter, tags: kind
+    googleplay.backoff   counter  calls retried after a 429, tags: kind
+
+Timings are in seconds.
+"""
+import json
+import threading
+from bisect import bisect_left
+from typing import Dict, Optional, TextIO, Tuple
+
+
+class Instrumentation:
+    """Receives timings and counters from the validators and drops them.
+
+    This is the default of every validator. Subclass it to forward metrics elsewhere, e.g. to
+    statsd or prometheus, validators call timing and increment from any thread.
+    ``enabled`` is false here, so optional work such as aiohttp connection tracing is skipped.
+    """
+
+    enabled = False
+
+    def timing(self, name: str, seconds: float, **tags) -> None:
+        pass
+
+    def increment(self, name: str, value: int = 1, **tags) -> None:
+        pass
+
+
+null_instrumentation = Instrumentation()
+
+
+class Histogram:
+    """Fixed, exponentially growing buckets from 0.1 ms to about 100 s."""
+
+    BOUNDS = tuple(0.0001 * 2 ** (i / 2) for i in range(41))
+
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        # the last bucket counts values above the last bound.
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None or value < self.min else self.min
+        self.max = value if self.max is None or value > self.max else self.max
+        self.buckets[bisect_left(self.BOUNDS, value)] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q quantile, within about 41% of the exact value."""
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                bound = self.BOUNDS[index] if index < len(self.BOUNDS) else self.max
+                return min(max(bound, self.min), self.max)
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, tags: dict) -> MetricKey:
+    return name, tuple(sorted((tag, str(value)) for tag, value in tags.items()))
+
+
+def _format_key(key: MetricKey) -> str:
+    name, tags = key
+    if not tags:
+        return name
+    return name + "{" + ",".join(f"{tag}={value}" for tag, value in tags) + "}"
+
+
+class MetricsRecorder(Instrumentation):
+    """Thread-safe in-memory histograms and counters, by name and tags.
+
+    ``snapshot()`` returns everything recorded, keyed like ``appstore.status{status=21007}``,
+    ``dump(file)`` writes it as JSON.
+    """
+
+    enabled = True
+
+    def __init__(self) -> None:
+        self._histograms: Dict[MetricKey, Histogram] = {}
+        self._counters: Dict[MetricKey, int] = {}
+        self._lock = threading.Lock()
+
+    def timing(self, name: str, seconds: float, **tags) -> None:
+        key = _key(name, tags)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name: str, value: int = 1, **tags) -> None:
+        key = _key(name, tags)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def histogram(self, name: str, **tags) -> Optional[Histogram]:
+        return self._histograms.get(_key(name, tags))
+
+    def counter(self, name: str, **tags) -> int:
+        return self._counters.get(_key(name, tags), 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "timings": {_format_key(key): histogram.as_dict() for key, histogram in self._histograms.items()},
+                "counters": {_format_key(key): count for key, count in self._counters.items()},
+            }
+
+    def dump(self, file: TextIO) -> None:
+        json.dump(self.snapshot(), file, indent=2, sort_keys=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
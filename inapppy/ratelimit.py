@@ -0,0 +1,82 @@
+"""Client-side rate limiting of androidpublisher calls, to stay within the project quota."""
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    """Token bucket refilled with rate tokens per second, holding up to burst tokens.
+
+    Calls reserve a token and wait until it is theirs, so concurrent callers queue in order.
+    When the wait would exceed max_wait the call is shed instead. Thread-safe and never blocks
+    while holding its lock, a bucket can be shared between verifiers, including the asyncio ones,
+    e.g. one bucket per Google Cloud project.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float = None,
+        max_wait: float = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        :param rate: tokens per second, the sustained calls per second.
+        :param burst: maximum tokens, calls allowed at once after an idle period. Defaults to one second of rate.
+        :param max_wait: maximum seconds a call waits for its token, longer waits are shed.
+            None queues calls whatever the wait, 0 sheds calls as soon as the bucket is empty.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.max_wait = max_wait
+        self.clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def available(self) -> float:
+        """Tokens left, negative while calls are queued."""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def reserve(self, tokens: float = 1) -> Optional[float]:
+        """Takes tokens, returns the seconds to wait before using them or None when the call is shed."""
+        with self._lock:
+            self._refill()
+            wait = max(0.0, (tokens - self._tokens) / self.rate)
+            if self.max_wait is not None and wait > self.max_wait:
+                return None
+            self._tokens -= tokens
+            return wait
+
+    def backoff(self, seconds: float) -> None:
+        """Empties the bucket for seconds, e.g. after a 429, so every caller sharing it slows down."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait of a Retry-After header, given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
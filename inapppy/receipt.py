@@ -0,0 +1,306 @@
+"""Local decoding of App Store receipts, without a round trip to verifyReceipt.
+
+A receipt is a base64 encoded PKCS#7 signedData container, its content is an ASN.1 SET of receipt
+attributes (type, version, value). Only the structure is checked, the PKCS#7 signature is not
+verified, so a decoded receipt is not proof of purchase: verifyReceipt remains the authority.
+Decoding is for rejecting receipts Apple would reject anyway and for offline analytics.
+"""
+import base64
+import binascii
+import calendar
+from typing import Iterator, List, Optional, Tuple, Union
+
+from inapppy.appstore import AppStoreTransaction, AppStoreValidationResult, _intern
+from inapppy.errors import ReceiptError
+
+SEQUENCE, SET, INTEGER, OCTET_STRING, UTF8_STRING, IA5_STRING, OID = 0x30, 0x31, 0x02, 0x04, 0x0C, 0x16, 0x06
+CONSTRUCTED_OCTET_STRING = 0x24
+CONTEXT_0 = 0xA0
+
+OID_SIGNED_DATA = bytes.fromhex("2a864886f70d010702")  # 1.2.840.113549.1.7.2
+OID_DATA = bytes.fromhex("2a864886f70d010701")  # 1.2.840.113549.1.7.1
+
+# Receipt attribute types, see "Receipt Fields" of Apple's receipt validation programming guide.
+ENVIRONMENT = 0
+BUNDLE_ID = 2
+APPLICATION_VERSION = 3
+IN_APP = 17
+ORIGINAL_APPLICATION_VERSION = 19
+CREATION_DATE = 12
+EXPIRATION_DATE = 21
+
+QUANTITY = 1701
+PRODUCT_ID = 1702
+TRANSACTION_ID = 1703
+PURCHASE_DATE = 1704
+ORIGINAL_TRANSACTION_ID = 1705
+ORIGINAL_PURCHASE_DATE = 1706
+EXPIRES_DATE = 1708
+CANCELLATION_DATE = 1712
+IS_TRIAL_PERIOD = 1713
+IS_IN_INTRO_OFFER_PERIOD = 1719
+
+SANDBOX_ENVIRONMENTS = ("ProductionSandbox", "Sandbox")
+
+# PKCS#7 and the receipt SET nest fewer than 10 elements deep, deeper input is garbage.
+MAX_DEPTH = 32
+
+
+def _tlv(data: bytes, offset: int, end: int, depth: int = 0) -> Tuple[int, int, int, int]:
+    """(tag, value start, value end, next offset) of the DER/BER element at offset.
+
+    BER indefinite lengths, used by some PKCS#7 encoders, are resolved by walking the children.
+    """
+    if offset + 2 > end:
+        raise ReceiptError("Malformed receipt")
+
+    tag = data[offset]
+    if tag & 0x1F == 0x1F:
+        raise ReceiptError("Malformed receipt")
+    length = data[offset + 1]
+    offset += 2
+
+    if length == 0x80 and tag & 0x20:
+        contents_end = _indefinite_end(data, offset, end, depth + 1)
+        return tag, offset, contents_end, contents_end + 2
+
+    if length & 0x80:
+        size = length & 0x7F
+        if not 0 < size <= 4 or offset + size > end:
+            raise ReceiptError("Malformed receipt")
+        length = int.from_bytes(data[offset : offset + size], "big")  # noqa: E203
+        offset += size
+
+    if offset + length > end:
+        raise ReceiptError("Malformed receipt")
+    return tag, offset, offset + length, offset + length
+
+
+def _indefinite_end(data: bytes, offset: int, end: int, depth: int) -> int:
+    # children up to the end of contents marker, two zero bytes.
+    if depth > MAX_DEPTH:
+        raise ReceiptError("Malformed receipt")
+    while data[offset : offset + 2] != b"\0\0":  # noqa: E203
+        offset = _tlv(data, offset, end, depth)[3]
+    return offset
+
+
+def _children(data: bytes, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+    while start < end:
+        if data[start : start + 2] == b"\0\0":  # noqa: E203
+            # end of contents of an indefinite length parent
+            return
+        tag, value_start, value_end, start = _tlv(data, start, end)
+        yield tag, value_start, value_end
+
+
+def _expect(element: Optional[Tuple[int, int, int]], tag: int) -> Tuple[int, int]:
+    if element is None or element[0] != tag:
+        raise ReceiptError("Malformed receipt")
+    return element[1], element[2]
+
+
+def _octets(data: bytes, element: Tuple[int, int, int], depth: int = 0) -> bytes:
+    tag, start, end = element
+    if tag == OCTET_STRING:
+        return data[start:end]
+    if tag == CONSTRUCTED_OCTET_STRING and depth < MAX_DEPTH:
+        # BER may split an octet string in chunks.
+        return b"".join(_octets(data, chunk, depth + 1) for chunk in _children(data, start, end))
+    raise ReceiptError("Malformed receipt")
+
+
+def receipt_payload(der: bytes) -> bytes:
+    """The receipt attributes SET, the content of the PKCS#7 signedData container."""
+    content_info = list(_children(der, 0, len(der)))
+    if len(content_info) != 1:
+        raise ReceiptError("Malformed receipt")
+    content_info = list(_children(der, *_expect(content_info[0], SEQUENCE)))
+    if len(content_info) != 2 or der[slice(*_expect(content_info[0], OID))] != OID_SIGNED_DATA:
+        raise ReceiptError("Malformed receipt")
+
+    signed_data = next(_children(der, *_expect(content_info[1], CONTEXT_0)), None)
+    # SignedData { version, digestAlgorithms, encapContentInfo, [0] certificates, [1] crls, signerInfos }
+    fields = list(_children(der, *_expect(signed_data, SEQUENCE)))
+    if len(fields) < 4:
+        raise ReceiptError("Malformed receipt")
+
+    encapsulated = list(_children(der, *_expect(fields[2], SEQUENCE)))
+    if len(encapsulated) != 2 or der[slice(*_expect(encapsulated[0], OID))] != OID_DATA:
+        raise ReceiptError("Malformed receipt")
+    content = next(_children(der, *_expect(encapsulated[1], CONTEXT_0)), None)
+    if content is None:
+        raise ReceiptError("Malformed receipt")
+    return _octets(der, content)
+
+
+def _attributes(payload: bytes) -> Iterator[Tuple[int, bytes, int, int]]:
+    """(type, payload, value start, value end) of each attribute of a receipt or in-app receipt SET."""
+    for element in _children(payload, *_expect(next(_children(payload, 0, len(payload)), None), SET)):
+        start, end = _expect(element, SEQUENCE)
+        type_tag, type_start, type_end, offset = _tlv(payload, start, end)
+        offset = _tlv(payload, offset, end)[3]  # version
+        value_tag, value_start, value_end, offset = _tlv(payload, offset, end)
+        if type_tag != INTEGER or value_tag != OCTET_STRING or offset != end:
+            raise ReceiptError("Malformed receipt")
+        yield int.from_bytes(payload[type_start:type_end], "big", signed=True), payload, value_start, value_end
+
+
+def _value(payload: bytes, start: int, end: int) -> Union[str, int, None]:
+    """The ASN.1 string or integer encoded in an attribute value, None for other types."""
+    if start == end:
+        return None
+    tag, value_start, value_end, _ = _tlv(payload, start, end)
+    value = payload[value_start:value_end]
+    if tag in (UTF8_STRING, IA5_STRING):
+        try:
+            return value.decode()
+        except UnicodeDecodeError:
+            raise ReceiptError("Malformed receipt")
+    if tag == INTEGER:
+        return int.from_bytes(value, "big", signed=True)
+    return None
+
+
+def _date_ms(value) -> Optional[int]:
+    """RFC 3339 receipt dates, e.g. 2019-03-19T12:00:00Z, to epoch milliseconds."""
+    if not value or not isinstance(value, str):
+        return None
+    # sliced rather than strptime, receipts carry a few dates per in-app purchase.
+    if len(value) < 19 or value[4] != "-" or value[10] != "T" or value[13] != ":":
+        raise ReceiptError("Malformed receipt")
+    try:
+        epoch = calendar.timegm(
+            (int(value[:4]), int(value[5:7]), int(value[8:10]), int(value[11:13]), int(value[14:16]), int(value[17:19]))
+        )
+        millis = int(value[20:23].ljust(3, "0")) if value[19:20] == "." else 0
+    except ValueError:
+        raise ReceiptError("Malformed receipt")
+    return epoch * 1000 + millis
+
+
+def _in_app_transaction(payload: bytes) -> AppStoreTransaction:
+    fields = {}
+    for attribute_type, data, start, end in _attributes(payload):
+        if QUANTITY <= attribute_type <= IS_IN_INTRO_OFFER_PERIOD:
+            fields[attribute_type] = _value(data, start, end)
+
+    return AppStoreTransaction(
+        _intern(fields.get(PRODUCT_ID)),
+        fields.get(TRANSACTION_ID),
+        _intern(fields.get(ORIGINAL_TRANSACTION_ID)),
+        fields.get(QUANTITY) or 1,
+        _date_ms(fields.get(PURCHASE_DATE)),
+        _date_ms(fields.get(ORIGINAL_PURCHASE_DATE)),
+        _date_ms(fields.get(EXPIRES_DATE)),
+        _date_ms(fields.get(CANCELLATION_DATE)),
+        bool(fields.get(IS_TRIAL_PERIOD)),
+        bool(fields.get(IS_IN_INTRO_OFFER_PERIOD)),
+    )
+
+
+class AppStoreReceipt:
+    """Fields of a locally decoded receipt, in-app purchases are AppStoreTransactions."""
+
+    __slots__ = (
+        "environment",
+        "bundle_id",
+        "application_version",
+        "original_application_version",
+        "creation_date_ms",
+        "expiration_date_ms",
+        "in_app",
+    )
+
+    def __init__(
+        self,
+        environment: str = None,
+        bundle_id: str = None,
+        application_version: str = None,
+        original_application_version: str = None,
+        creation_date_ms: int = None,
+        expiration_date_ms: int = None,
+        in_app: Tuple[AppStoreTransaction, ...] = (),
+    ):
+        self.environment = environment
+        self.bundle_id = bundle_id
+        self.application_version = application_version
+        self.original_application_version = original_application_version
+        self.creation_date_ms = creation_date_ms
+        self.expiration_date_ms = expiration_date_ms
+        self.in_app = in_app
+
+    @property
+    def sandbox(self) -> bool:
+        return self.environment in SANDBOX_ENVIRONMENTS
+
+    def validation_result(self) -> AppStoreValidationResult:
+        """The in-app purchases indexed like a verifyReceipt response, status is None."""
+        environment = None
+        if self.environment is not None:
+            environment = "Sandbox" if self.sandbox else "Production"
+        return AppStoreValidationResult(None, environment, self.bundle_id, self.in_app)
+
+    def __repr__(self):
+        return (
+            f"AppStoreReceipt("
+            f"environment={self.environment!r}, "
+            f"bundle_id={self.bundle_id!r}, "
+            f"application_version={self.application_version!r}, "
+            f"in_app={len(self.in_app)})"
+        )
+
+
+def receipt_bytes(receipt: Union[str, bytes]) -> bytes:
+    """The DER bytes of a base64 receipt, as sent to verifyReceipt."""
+    try:
+        return base64.b64decode(receipt, validate=True)
+    except (binascii.Error, ValueError):
+        pass
+    # receipts copied around may carry line breaks.
+    try:
+        if isinstance(receipt, str):
+            receipt = "".join(receipt.split())
+        else:
+            receipt = b"".join(receipt.split())
+        return base64.b64decode(receipt, validate=True)
+    except (binascii.Error, ValueError):
+        raise ReceiptError("Bad receipt encoding")
+
+
+def decode_receipt(receipt: Union[str, bytes], in_app: bool = True) -> AppStoreReceipt:
+    """Decodes a base64 receipt, raises ReceiptError when it is not a well formed receipt.
+
+    :param receipt: base64 receipt, as sent to verifyReceipt.
+    :param in_app: decode in-app purchases too, skipping them is faster when only the app fields are needed.
+    """
+    payload = receipt_payload(receipt_bytes(receipt))
+
+    fields = {}
+    transactions: List[AppStoreTransaction] = []
+    for attribute_type, data, start, end in _attributes(payload):
+        if attribute_type == IN_APP:
+            if in_app:
+                transactions.append(_in_app_transaction(data[start:end]))
+        elif attribute_type in (
+            ENVIRONMENT,
+            BUNDLE_ID,
+            APPLICATION_VERSION,
+            ORIGINAL_APPLICATION_VERSION,
+            CREATION_DATE,
+            EXPIRATION_DATE,
+        ):
+            fields[attribute_type] = _value(data, start, end)
+
+    if not isinstance(fields.get(BUNDLE_ID), str):
+        raise ReceiptError("Malformed receipt")
+
+    return AppStoreReceipt(
+        fields.get(ENVIRONMENT),
+        fields[BUNDLE_ID],
+        fields.get(APPLICATION_VERSION),
+        fields.get(ORIGINAL_APPLICATION_VERSION),
+        _date_ms(fields.get(CREATION_DATE)),
+        _date_ms(fields.get(EXPIRATION_DATE)),
+        tuple(transactions),
+    )
@@ -0,0 +1,363 @@
+"""Streaming reconciliation of exported App Store receipts and Google Play purchase tokens.
+
+Records are read lazily from a JSONL or CSV export, each routed to the validator of its store:
+
+    {"id": "42", "receipt": "MIIT..."}                                          App Store
+    {"id": "43", "purchase_token": "...", "product_sku": "...", "is_subscription": true}   Google Play
+
+The store is taken from an explicit ``store`` field (appstore / googleplay) when there is one. App Store
+records may carry their own ``shared_secret``. An outcome is written per record, as a JSON line in
+input order, with the result summary or the error. Progress is checkpointed, so an interrupted run
+resumes where it stopped:
+
+    python -m inapppy.reconcile export.csv outcomes.jsonl --checkpoint outcomes.checkpoint \\
+        --google-bundle-id com.example.app --google-credentials service-account.json
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from itertools import islice
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Union
+
+from inapppy.appstore import AppStoreValidationResult
+from inapppy.asyncio.bulk import bounded_in_order
+from inapppy.errors import InAppPyError, InAppPyValidationError
+from inapppy.ratelimit import TokenBucket
+
+APPSTORE, GOOGLEPLAY = "appstore", "googleplay"
+
+Record = Union[Dict[str, Any], str]
+
+
+def read_records(path: str, input_format: str = None) -> Iterator[Record]:
+    """Records of a JSONL or CSV export, read lazily. The format defaults to the file extension.
+
+    Lines that are not JSON objects are yielded as they are, they become "Bad record" outcomes.
+    """
+    if input_format is None:
+        input_format = "csv" if path.lower().endswith(".csv") else "jsonl"
+
+    if input_format == "csv":
+        with open(path, newline="", encoding="utf-8") as export:
+            yield from csv.DictReader(export)
+        return
+
+    with open(path, encoding="utf-8") as export:
+        for line in export:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = line
+            yield record
+
+
+def _flag(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes")
+    return bool(value)
+
+
+def record_store(record: Record) -> Optional[str]:
+    """Store a record belongs to, None when it cannot be told."""
+    if not isinstance(record, dict):
+        return None
+    store = record.get("store")
+    if store:
+        return store if store in (APPSTORE, GOOGLEPLAY) else None
+    if record.get("receipt"):
+        return APPSTORE
+    if record.get("purchase_token"):
+        return GOOGLEPLAY
+    return None
+
+
+def appstore_summary(api_response: dict, at_ms: int) -> dict:
+    result = AppStoreValidationResult.from_response(api_response)
+    expiries = [transaction.expires_date_ms for transaction in result.transactions if transaction.expires_date_ms]
+    products = {transaction.product_id for transaction in result.transactions}
+    return {
+        "status": result.status,
+        "environment": result.environment,
+        "bundle_id": result.bundle_id,
+        "active_products": sorted(
+            product_id for product_id in products if result.active_subscription(product_id, at_ms) is not None
+        ),
+        "expires_date_ms": max(expiries, default=None),
+    }
+
+
+def googleplay_summary(result) -> dict:
+    return {
+        "is_canceled": result.is_canceled,
+        "is_expired": result.is_expired,
+        "expiry_time_ms": result.expiry_time_ms,
+        "purchase_state": result.purchase_state,
+        "cancel_reason": result.cancel_reason,
+    }
+
+
+def _error(error: Exception) -> dict:
+    outcome = {"type": type(error).__name__, "message": getattr(error, "message", None) or str(error)}
+    raw_response = getattr(error, "raw_response", None)
+    if isinstance(raw_response, dict) and "status" in raw_response:
+        outcome["status"] = raw_response["status"]
+    return outcome
+
+
+class Reconciler:
+    """Validates records with the asyncio validators, with bounded concurrency and per store rate limits.
+
+    Validators are used as given, enter their sessions (async with) before reconciling.
+    """
+
+    def __init__(
+        self,
+        appstore=None,
+        googleplay=None,
+        concurrency: int = 10,
+        rate_limiters: Dict[str, TokenBucket] = None,
+        shared_secret: str = None,
+        exclude_old_transactions: bool = False,
+        raw: bool = False,
+    ) -> None:
+        """
+        :param appstore: inapppy.asyncio.AppStoreValidator of the App Store records.
+        :param googleplay: inapppy.asyncio.GooglePlayVerifier of the Google Play records.
+        :param concurrency: maximum number of records validated at the same time.
+        :param rate_limiters: token buckets by store (appstore / googleplay), calls wait for their token.
+        :param shared_secret: App Store shared secret of records without their own.
+        :param exclude_old_transactions: only the latest renewal transaction of App Store receipts.
+        :param raw: write the raw store responses along with the summaries.
+        """
+        self.validators = {APPSTORE: appstore, GOOGLEPLAY: googleplay}
+        self.concurrency = concurrency
+        self.rate_limiters = rate_limiters or {}
+        self.shared_secret = shared_secret
+        self.exclude_old_transactions = exclude_old_transactions
+        self.raw = raw
+
+    async def outcomes(self, records: Iterable[Record], start: int = 0) -> AsyncIterator[dict]:
+        """Outcome of each record, in input order. start is the index of the first record."""
+        async for result in bounded_in_order(self.reconcile, records, self.concurrency):
+            record_id = result.item.get("id") if isinstance(result.item, dict) else None
+            outcome = {"index": start + result.index, "id": record_id}
+            if result.error is None:
+                outcome.update(result.result)
+            else:
+                outcome.update(store=record_store(result.item), ok=False, error=_error(result.error))
+            yield outcome
+
+    async def reconcile(self, record: Record) -> dict:
+        store = record_store(record)
+        if store is None:
+            raise InAppPyValidationError("Bad record")
+        if self.validators[store] is None:
+            raise InAppPyValidationError(f"No {store} validator")
+
+        limiter = self.rate_limiters.get(store)
+        if limiter is not None:
+            wait = limiter.reserve()
+            if wait is None:
+                raise InAppPyValidationError("Rate limit budget exhausted")
+            if wait:
+                await asyncio.sleep(wait)
+
+        if store == APPSTORE:
+            api_response = await self.validators[APPSTORE].validate(
+                record["receipt"],
+                record.get("shared_secret") or self.shared_secret,
+                self.exclude_old_transactions,
+            )
+            outcome = {"store": store, "ok": True, "result": appstore_summary(api_response, int(time.time() * 1000))}
+        else:
+            result = await self.validators[GOOGLEPLAY].verify_with_result(
+                record["purchase_token"], record.get("product_sku"), _flag(record.get("is_subscription"))
+            )
+            api_response = result.raw_response
+            outcome = {"store": store, "ok": True, "result": googleplay_summary(result)}
+
+        if self.raw:
+            outcome["raw_response"] = api_response
+        return outcome
+
+
+def load_checkpoint(path: str) -> dict:
+    """Records done and output bytes written by the previous run, zeros without a checkpoint.
+
+    Raises InAppPyError naming the file when the checkpoint cannot be read, delete it to start over.
+    """
+    try:
+        with open(path) as checkpoint:
+            state = json.load(checkpoint)
+        return {"records": int(state["records"]), "output_bytes": int(state["output_bytes"])}
+    except FileNotFoundError:
+        return {"records": 0, "output_bytes": 0}
+    except (KeyError, TypeError, ValueError) as e:
+        raise InAppPyError(f"Corrupt checkpoint {path}, delete it to start over: {e!r}")
+
+
+def save_checkpoint(path: str, records: int, output_bytes: int) -> None:
+    # replaced atomically, a crash leaves the previous checkpoint.
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as checkpoint:
+        json.dump({"records": records, "output_bytes": output_bytes}, checkpoint)
+    os.replace(temporary, path)
+
+
+async def reconcile_file(
+    reconciler: Reconciler,
+    input_path: str,
+    output_path: str,
+    input_format: str = None,
+    checkpoint_path: str = None,
+    checkpoint_every: int = 1000,
+) -> Dict[str, int]:
+    """Reconciles an export into a JSONL file of outcomes, in constant memory.
+
+    With a checkpoint, the output is truncated to the last checkpoint and the records done are skipped,
+    so outcomes are neither lost nor duplicated by a restart. When the output is missing or shorter than
+    the checkpoint says, the run starts over from the first record. The checkpoint is saved every
+    checkpoint_every records, after the output is flushed to disk.
+
+    :return: records and failed records of this run.
+    """
+    state = load_checkpoint(checkpoint_path) if checkpoint_path else {"records": 0, "output_bytes": 0}
+    if state["output_bytes"] and _file_size(output_path) < state["output_bytes"]:
+        state = {"records": 0, "output_bytes": 0}
+    done = state["records"]
+    stats = {"records": 0, "failed": 0}
+
+    mode = "r+b" if state["output_bytes"] else "wb"
+    with open(output_path, mode) as output:
+        output.truncate(state["output_bytes"])
+        output.seek(state["output_bytes"])
+
+        records = islice(read_records(input_path, input_format), done, None)
+        async for outcome in reconciler.outcomes(records, start=done):
+            output.write(json.dumps(outcome, separators=(",", ":")).encode() + b"\n")
+            done += 1
+            stats["records"] += 1
+            stats["failed"] += not outcome["ok"]
+
+            if checkpoint_path and done % checkpoint_every == 0:
+                _checkpoint(output, checkpoint_path, done)
+
+        if checkpoint_path:
+            _checkpoint(output, checkpoint_path, done)
+    return stats
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return -1
+
+
+def _checkpoint(output, checkpoint_path: str, done: int) -> None:
+    output.flush()
+    os.fsync(output.fileno())
+    save_checkpoint(checkpoint_path, done, output.tell())
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m inapppy.reconcile", description="Validates exported receipts and purchase tokens."
+    )
+    parser.add_argument("input", help="JSONL or CSV export of records")
+    parser.add_argument("output", help="JSONL file of outcomes")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="input format, defaults to the file extension")
+    parser.add_argument("--checkpoint", help="checkpoint file, an interrupted run resumes from it")
+    parser.add_argument("--checkpoint-every", type=int, default=1000, help="records between checkpoints")
+    parser.add_argument("--concurrency", type=int, default=10, help="records validated at the same time")
+    parser.add_argument("--raw", action="store_true", help="write raw store responses too")
+    parser.add_argument("--http-timeout", type=float, default=30, help="seconds per request")
+
+    appstore = parser.add_argument_group("App Store")
+    appstore.add_argument("--shared-secret", help="App Store shared secret")
+    appstore.add_argument("--exclude-old-transactions", action="store_true")
+    appstore.add_argument("--sandbox", action="store_true", help="try the sandbox environment first")
+    appstore.add_argument("--appstore-qps", type=float, help="maximum App Store requests per second")
+    appstore.add_argument("--appstore-retries", type=int, default=2, help="retries of transient App Store errors")
+    appstore.add_argument("--appstore-production-url", help="verifyReceipt url of the production environment")
+    appstore.add_argument("--appstore-sandbox-url", help="verifyReceipt url of the sandbox environment")
+
+    google = parser.add_argument_group("Google Play")
+    google.add_argument("--google-bundle-id", help="package name, Google Play records need it")
+    google.add_argument("--google-credentials", help="service account key file")
+    google.add_argument("--googleplay-qps", type=float, help="maximum androidpublisher calls per second")
+    google.add_argument("--google-api-root", help="root url of the androidpublisher API")
+    return parser
+
+
+def _validators(args: argparse.Namespace) -> List:
+    from inapppy.asyncio import AppStoreValidator, GooglePlayVerifier
+    from inapppy.retry import RetryPolicy
+
+    appstore = AppStoreValidator(
+        sandbox=args.sandbox,
+        auto_retry_wrong_env_request=True,
+        http_timeout=args.http_timeout,
+        retry_policy=RetryPolicy(attempts=args.appstore_retries + 1),
+    )
+    if args.appstore_production_url:
+        appstore.PRODUCTION_URL = args.appstore_production_url
+    if args.appstore_sandbox_url:
+        appstore.SANDBOX_URL = args.appstore_sandbox_url
+
+    googleplay = None
+    if args.google_bundle_id and args.google_credentials:
+        options = {"api_root": args.google_api_root} if args.google_api_root else {}
+        rate_limiter = TokenBucket(args.googleplay_qps) if args.googleplay_qps else None
+        googleplay = GooglePlayVerifier(
+            args.google_bundle_id,
+            args.google_credentials,
+            http_timeout=args.http_timeout,
+            rate_limiter=rate_limiter,
+            **options,
+        )
+    return [appstore, googleplay]
+
+
+async def _main(args: argparse.Namespace) -> Dict[str, int]:
+    appstore, googleplay = _validators(args)
+    reconciler = Reconciler(
+        appstore,
+        googleplay,
+        concurrency=args.concurrency,
+        rate_limiters={APPSTORE: TokenBucket(args.appstore_qps)} if args.appstore_qps else None,
+        shared_secret=args.shared_secret,
+        exclude_old_transactions=args.exclude_old_transactions,
+        raw=args.raw,
+    )
+
+    async with appstore:
+        if googleplay is None:
+            return await reconcile_file(
+                reconciler, args.input, args.output, args.format, args.checkpoint, args.checkpoint_every
+            )
+        async with googleplay:
+            return await reconcile_file(
+                reconciler, args.input, args.output, args.format, args.checkpoint, args.checkpoint_every
+            )
+
+
+def main(argv: List[str] = None) -> int:
+    args = _parser().parse_args(argv)
+    try:
+        stats = asyncio.run(_main(args))
+    except InAppPyError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"{stats['records']} records reconciled, {stats['failed']} failed", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
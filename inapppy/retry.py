@@ -0,0 +1,103 @@
+"""Retries of transient App Store failures and a circuit breaker failing fast while Apple is down."""
+import random
+import threading
+import time
+from typing import Callable, Iterable
+
+# Server is unavailable, Internal data access error
+TRANSIENT_STATUSES = (21005, 21009)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by attempts and a per call deadline.
+
+    Transient failures are HTTP errors (connection errors, timeouts, responses that are not JSON)
+    and the retry_statuses verifyReceipt statuses. Other statuses are never retried.
+    """
+
+    def __init__(
+        self,
+        attempts: int = 3,
+        backoff: float = 0.1,
+        max_backoff: float = 2.0,
+        deadline: float = None,
+        retry_statuses: Iterable[int] = TRANSIENT_STATUSES,
+    ) -> None:
+        """
+        :param attempts: maximum requests per environment, retries included.
+        :param backoff: cap of the first delay in seconds, the cap doubles every retry.
+        :param max_backoff: maximum cap of a delay in seconds.
+        :param deadline: maximum seconds a validation may take, all requests, delays and the
+            21007/21008 environment switch included. None means no deadline.
+        :param retry_statuses: verifyReceipt statuses worth retrying.
+        """
+        if attempts < 1:
+            raise ValueError("attempts must be at least 1")
+
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.retry_statuses = frozenset(retry_statuses)
+        self._random = random.Random()
+
+    def delay(self, retry: int) -> float:
+        """Seconds to wait before the retry-th retry, counted from 0."""
+        return self._random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry))
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive transient failures and fails calls fast while open.
+
+    After reset_timeout seconds a single trial call is let through (half open), its success closes
+    the circuit, its failure opens it again. A trial recording neither, e.g. a cancelled coroutine, is
+    given up after reset_timeout seconds and another trial is let through. Thread-safe, a breaker can
+    be shared between validators, including the asyncio ones.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(
+        self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if self.clock() - self._opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead, a half open circuit lets one trial call through at a time."""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN:
+                now = self.clock()
+                if self._trial_started is None or now - self._trial_started >= self.reset_timeout:
+                    self._trial_started = now
+                    return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_started is not None or self._failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+            self._trial_started = None
@@ -0,0 +1,83 @@
+import rsa
+from rsa.pkcs1 import HASH_ASN1, HASH_METHODS
+
+from inapppy.errors import InAppPyValidationError
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives.asymmetric import padding
+    from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
+    from cryptography.hazmat.primitives.serialization import load_pem_public_key
+except ImportError:  # pragma: no cover
+    load_pem_public_key = None
+
+
+class SignatureBackend:
+    """Verifies PKCS#1 v1.5 RSA signatures against a PEM encoded public key."""
+
+    name = None
+
+    def __init__(self, pem: str) -> None:
+        self.public_key = None
+
+    def verify(self, message: bytes, signature: bytes) -> bool:
+        raise NotImplementedError
+
+
+class RsaSignatureBackend(SignatureBackend):
+    """Pure python backend using the rsa package."""
+
+    name = "rsa"
+
+    def __init__(self, pem: str) -> None:
+        try:
+            self.public_key = rsa.PublicKey.load_pkcs1_openssl_pem(pem)
+        except Exception:
+            raise InAppPyValidationError("Bad API key")
+
+    def verify(self, message: bytes, signature: bytes) -> bool:
+        if not isinstance(message, bytes):
+            # the rsa package hashes bytes or file objects only.
+            message = bytes(message)
+        try:
+            return bool(rsa.verify(message, signature, self.public_key))
+        except rsa.VerificationError:
+            return False
+
+
+class CryptographySignatureBackend(SignatureBackend):
+    """OpenSSL backed verification using the cryptography package.
+
+    Accepts exactly what rsa.verify accepts: any of the hash algorithms known to the rsa
+    package, detected from the DigestInfo embedded in the signature.
+    """
+
+    name = "cryptography"
+
+    def __init__(self, pem: str) -> None:
+        if load_pem_public_key is None:
+            raise InAppPyValidationError("cryptography package is not installed")
+
+        try:
+            self.public_key = load_pem_public_key(pem.encode())
+        except (TypeError, ValueError):
+            raise InAppPyValidationError("Bad API key")
+
+        if not isinstance(self.public_key, RSAPublicKey):
+            raise InAppPyValidationError("Bad API key")
+
+    def verify(self, message: bytes, signature: bytes) -> bool:
+        try:
+            digest_info = self.public_key.recover_data_from_signature(signature, padding.PKCS1v15(), None)
+        except (InvalidSignature, ValueError):
+            return False
+
+        for method_name, asn1_prefix in HASH_ASN1.items():
+            if digest_info.startswith(asn1_prefix):
+                return digest_info == asn1_prefix + HASH_METHODS[method_name](message).digest()
+        return False
+
+
+def default_signature_backend() -> type:
+    """Fastest available backend, cryptography when installed, rsa otherwise."""
+    return CryptographySignatureBackend if load_pem_public_key is not None else RsaSignatureBackend
@@ -0,0 +1,55 @@
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into a single call.
+
+    The first caller runs the function, callers arriving while it is in flight wait for it
+    and receive the same result or exception. ``upstream_calls`` and ``coalesced_calls`` count
+    calls that ran the function and calls that joined an in-flight one.
+    """
+
+    def __init__(self) -> None:
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        return {"upstream_calls": self.upstream_calls, "coalesced_calls": self.coalesced_calls}
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.upstream_calls += 1
+            else:
+                self.coalesced_calls += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -0,0 +1,213 @@
+"""Incremental decoding of verifyReceipt responses, so huge receipt histories are never fully loaded."""
+from typing import BinaryIO, Dict, List
+
+from inapppy.errors import InAppPyError
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover
+    ijson = None
+
+# Transaction arrays trimmed to the newest transactions of each original_transaction_id.
+TRANSACTION_ARRAYS = ("receipt.in_app", "latest_receipt_info")
+
+JSONError = ijson.JSONError if ijson is not None else ValueError
+
+
+def require_ijson() -> None:
+    if ijson is None:
+        raise InAppPyError("ijson package is not installed")
+
+
+class ResponseCompactor:
+    """Builds a verifyReceipt response from ijson parse events, keeping it small as it goes.
+
+    Only the newest ``keep_transactions`` transactions (by purchase_date_ms) of each
+    original_transaction_id are kept in the transaction arrays, which are returned newest first.
+    Everything else is kept as is.
+    """
+
+    def __init__(self, keep_transactions: int = 1) -> None:
+        if keep_transactions < 1:
+            raise ValueError("keep_transactions must be at least 1")
+
+        self.keep_transactions = keep_transactions
+        self._builder = ijson.ObjectBuilder()
+        self._transactions = {prefix: {} for prefix in TRANSACTION_ARRAYS}
+        self._item_prefixes = {f"{prefix}.item": prefix for prefix in TRANSACTION_ARRAYS}
+        self._item_builder = None
+        self._item_array = None
+
+    def feed(self, prefix: str, event: str, value) -> None:
+        if self._item_builder is not None:
+            self._item_builder.event(event, value)
+            if event == "end_map" and prefix in self._item_prefixes:
+                self._keep(self._item_array, self._item_builder.value)
+                self._item_builder = None
+            return
+
+        if event == "start_map" and prefix in self._item_prefixes:
+            self._item_array = self._item_prefixes[prefix]
+            self._item_builder = ijson.ObjectBuilder()
+            self._item_builder.event(event, value)
+            return
+
+        self._builder.event(event, value)
+
+    def _keep(self, array: str, transaction: dict) -> None:
+        original_transaction_id = transaction.get("original_transaction_id")
+        kept = self._transactions[array].setdefault(original_transaction_id, [])
+        kept.append(transaction)
+        if len(kept) > self.keep_transactions:
+            kept.sort(key=_purchase_date_ms, reverse=True)
+            del kept[self.keep_transactions :]  # noqa: E203
+
+    def result(self):
+        response = self._builder.value
+        for array, groups in self._transactions.items():
+            container = _container(response, array)
+            if container is None:
+                continue
+            key = array.rsplit(".", 1)[-1]
+            if isinstance(container.get(key), list):
+                container[key] = _newest_first(groups)
+        return response
+
+
+def _purchase_date_ms(transaction: dict) -> int:
+    try:
+        return int(transaction.get("purchase_date_ms") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _newest_first(groups: Dict[str, List[dict]]) -> List[dict]:
+    transactions = [transaction for kept in groups.values() for transaction in kept]
+    transactions.sort(key=_purchase_date_ms, reverse=True)
+    return transactions
+
+
+def _container(response, array: str):
+    for key in array.split(".")[:-1]:
+        if not isinstance(response, dict):
+            return None
+        response = response.get(key)
+    return response if isinstance(response, dict) else None
+
+
+class LatestReceiptFilter:
+    """Empties the latest_receipt string of a verifyReceipt response while it is still raw bytes.
+
+    The base64 receipt grows with the purchase history, dropping it before the parser never
+    materializes it. Bytes are fed in chunks, a key split across chunks is held back.
+    """
+
+    KEY = b'"latest_receipt"'
+    SCAN, AFTER_KEY, IN_VALUE, DONE = range(4)
+
+    def __init__(self) -> None:
+        self._state = self.SCAN
+        self._pending = b""
+
+    def feed(self, data: bytes, final: bool = False) -> bytes:
+        data = self._pending + data
+        self._pending = b""
+        output = []
+
+        while data:
+            if self._state == self.SCAN:
+                data = self._scan(data, final, output)
+            elif self._state == self.AFTER_KEY:
+                data = self._after_key(data, output)
+            elif self._state == self.IN_VALUE:
+                data = self._in_value(data)
+            else:
+                output.append(data)
+                break
+
+        return b"".join(output)
+
+    def _scan(self, data: bytes, final: bool, output: list) -> bytes:
+        index = data.find(self.KEY)
+        if index < 0:
+            split = len(data) if final else max(len(data) - len(self.KEY) + 1, 0)
+            output.append(data[:split])
+            self._pending = data[split:]
+            return b""
+
+        index += len(self.KEY)
+        output.append(data[:index])
+        self._state = self.AFTER_KEY
+        return data[index:]
+
+    def _after_key(self, data: bytes, output: list) -> bytes:
+        value = data.lstrip(b" \t\r\n:")
+        output.append(data[: len(data) - len(value)])
+        if value.startswith(b'"'):
+            output.append(b'"')
+            self._state = self.IN_VALUE
+            return value[1:]
+        if value:
+            # not the latest_receipt key, e.g. a string value
+            self._state = self.SCAN
+        return value
+
+    def _in_value(self, data: bytes) -> bytes:
+        # base64 has no quotes or escapes, the next quote closes the string.
+        index = data.find(b'"')
+        if index < 0:
+            return b""
+        self._state = self.DONE
+        return data[index:]
+
+
+class _FilteredFile:
+    def __init__(self, file: BinaryIO, value_filter: LatestReceiptFilter) -> None:
+        self.file = file
+        self.value_filter = value_filter
+
+    def read(self, size: int = -1) -> bytes:
+        # an empty read means end of file to the parser, skip chunks that were dropped entirely.
+        while True:
+            data = self.file.read(size)
+            filtered = self.value_filter.feed(data, final=not data)
+            if filtered or not data:
+                return filtered
+
+
+class _AsyncFilteredStream:
+    def __init__(self, stream, value_filter: LatestReceiptFilter) -> None:
+        self.stream = stream
+        self.value_filter = value_filter
+
+    async def read(self, size: int = -1) -> bytes:
+        while True:
+            data = await self.stream.read(size)
+            filtered = self.value_filter.feed(data, final=not data)
+            if filtered or not data:
+                return filtered
+
+
+def compact_response(file: BinaryIO, keep_transactions: int = 1, drop_latest_receipt: bool = False) -> dict:
+    """Incrementally decodes a verifyReceipt response read from a binary file object.
+
+    See ResponseCompactor, latest_receipt is emptied when drop_latest_receipt is set.
+    """
+    if drop_latest_receipt:
+        file = _FilteredFile(file, LatestReceiptFilter())
+
+    compactor = ResponseCompactor(keep_transactions)
+    for prefix, event, value in ijson.parse(file, use_float=True):
+        compactor.feed(prefix, event, value)
+    return compactor.result()
+
+
+async def compact_response_async(stream, keep_transactions: int = 1, drop_latest_receipt: bool = False) -> dict:
+    """Incrementally decodes a verifyReceipt response read from an async stream, e.g. aiohttp's response.content."""
+    if drop_latest_receipt:
+        stream = _AsyncFilteredStream(stream, LatestReceiptFilter())
+
+    compactor = ResponseCompactor(keep_transactions)
+    async for prefix, event, value in ijson.parse_async(stream, use_float=True):
+        compactor.feed(prefix, event, value)
+    return compactor.result()
@@ -11,7 +11,9 @@ setup(
     name="inapppy",
     version="2.6",
     packages=["inapppy", "inapppy.asyncio"],
-    install_requires=["aiohttp", "rsa", "requests", "google-api-python-client", "oauth2client"],
+    python_requires=">=3.7",
+    install_requires=["aiohttp", "rsa", "requests", "google-api-python-client", "google-auth"],
+    extras_require={"cryptography": ["cryptography"], "orjson": ["orjson"], "streaming": ["ijson"]},
     description="In-app purchase validation library for Apple AppStore and GooglePlay.",
     keywords="in-app store purchase googleplay appstore validation",
     author="Lukas Šalkauskas",
@@ -1,3 +1,4 @@
+import rsa
 from pytest import fixture
 
 from inapppy.asyncio import AppStoreValidator
@@ -16,3 +17,9 @@ def appstore_validator_sandbox() -> AppStoreValidator:
 @fixture
 def appstore_validator_auto_retry_on_sandbox() -> AppStoreValidator:
     return AppStoreValidator(auto_retry_wrong_env_request=True)
+
+
+@fixture(scope="session")
+def service_account_private_key() -> str:
+    _, private_key = rsa.newkeys(1024)
+    return private_key.save_pkcs1().decode()
@@ -1,9 +1,16 @@
+import asyncio
 from unittest.mock import patch
 
 import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 
 from inapppy import InAppPyValidationError
 from inapppy.asyncio import AppStoreValidator
+from inapppy.cache import MemoryCache
+from inapppy.errors import AppStoreHTTPError, CircuitOpenError, DeadlineExceededError
+from inapppy.instrumentation import MetricsRecorder
+from inapppy.retry import CircuitBreaker, RetryPolicy
 
 
 def test_appstore_validator_initiation_simple(appstore_validator: AppStoreValidator):
@@ -16,11 +23,11 @@ def test_appstore_validator_initiation_sandbox(appstore_validator_sandbox):
 
 @pytest.mark.asyncio
 async def test_appstore_validate_simple(appstore_validator: AppStoreValidator):
-    async def post_json(self, request_json):
+    async def post_json(self, request_json, sandbox=None):
         assert request_json == {"receipt-data": "test-receipt", "password": "shared-secret"}
         return {"status": 0}
 
-    async def post_json_no_secret(self, request_json):
+    async def post_json_no_secret(self, request_json, sandbox=None):
         assert request_json == {"receipt-data": "test-receipt"}
         return {"status": 0}
 
@@ -35,11 +42,11 @@ async def test_appstore_validate_simple(appstore_validator: AppStoreValidator):
 
 @pytest.mark.asyncio
 async def test_appstore_validate_sandbox(appstore_validator_sandbox: AppStoreValidator):
-    async def post_json(self, receipt):
+    async def post_json(self, receipt, sandbox=None):
         assert receipt == {"receipt-data": "test-receipt", "password": "shared-secret"}
         return {"status": 0}
 
-    async def post_json_no_secret(self, receipt):
+    async def post_json_no_secret(self, receipt, sandbox=None):
         assert receipt == {"receipt-data": "test-receipt"}
         assert receipt == {"receipt-data": "test-receipt"}
         return {"status": 0}
@@ -57,7 +64,7 @@ async def test_appstore_validate_sandbox(appstore_validator_sandbox: AppStoreVal
 async def test_appstore_validate_attach_raw_response_to_the_exception(appstore_validator: AppStoreValidator):
     raw_response = {"status": 21000, "foo": "bar"}
 
-    async def post_json(self, receipt):
+    async def post_json(self, receipt, sandbox=None):
         assert receipt == {"receipt-data": "test-receipt", "password": "shared-secret"}
         return raw_response
 
@@ -78,7 +85,7 @@ async def test_appstore_auto_retry_wrong_env_request(appstore_validator_auto_ret
 
     raw_response = {"status": 21007, "foo": "bar"}
 
-    async def post_json(self, receipt):
+    async def post_json(self, receipt, sandbox=None):
         assert receipt == {"receipt-data": "test-receipt", "password": "shared-secret"}
         return raw_response
 
@@ -90,7 +97,7 @@ async def test_appstore_auto_retry_wrong_env_request(appstore_validator_auto_ret
 
     raw_response = {"status": 21008, "foo": "bar"}
 
-    async def post_json(self, receipt):
+    async def post_json(self, receipt, sandbox=None):
         assert receipt == {"receipt-data": "test-receipt", "password": "shared-secret"}
         return raw_response
 
@@ -99,3 +106,297 @@ async def test_appstore_auto_retry_wrong_env_request(appstore_validator_auto_ret
             await validator.validate(receipt="test-receipt", shared_secret="shared-secret")
             assert validator.sandbox is False
             assert validator.url == "https://buy.itunes.apple.com/verifyReceipt"
+
+
+@pytest.mark.asyncio
+async def test_appstore_validate_stream_bounded_concurrency(appstore_validator: AppStoreValidator):
+    in_flight = 0
+    max_in_flight = 0
+    pulled = []
+
+    async def post_json(self, receipt, sandbox=None):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        if receipt["receipt-data"] == "bad":
+            return {"status": 21002}
+        return {"status": 0, "receipt": receipt["receipt-data"]}
+
+    async def receipts():
+        for i in range(20):
+            pulled.append(i)
+            # backpressure: never more than `concurrency` receipts pulled ahead of completed ones
+            assert len(pulled) - len(results) <= 3
+            yield "bad" if i == 5 else f"receipt-{i}"
+
+    results = []
+    with patch.object(AppStoreValidator, "post_json", new=post_json):
+        async for result in appstore_validator.validate_stream(receipts(), concurrency=3):
+            results.append(result)
+
+    assert max_in_flight == 3
+    assert len(results) == 20
+    failed = [result for result in results if not result.ok]
+    assert [result.index for result in failed] == [5]
+    assert isinstance(failed[0].error, InAppPyValidationError)
+    assert failed[0].error.raw_response == {"status": 21002}
+
+
+@pytest.mark.asyncio
+async def test_appstore_validate_many_keeps_input_order(appstore_validator: AppStoreValidator):
+    async def post_json(self, receipt, sandbox=None):
+        # later receipts complete first
+        await asyncio.sleep(0.001 * (5 - int(receipt["receipt-data"])))
+        return {"status": 0, "receipt": receipt["receipt-data"]}
+
+    with patch.object(AppStoreValidator, "post_json", new=post_json):
+        results = await appstore_validator.validate_many([str(i) for i in range(5)], concurrency=5)
+
+    assert [result.index for result in results] == [0, 1, 2, 3, 4]
+    assert [result.result["receipt"] for result in results] == ["0", "1", "2", "3", "4"]
+    assert all(result.ok for result in results)
+
+
+@pytest.mark.asyncio
+async def test_appstore_session_connection_limits():
+    validator = AppStoreValidator(connection_limit=50, connection_limit_per_host=8)
+    async with validator as entered:
+        assert entered is validator
+        assert validator._session.connector.limit == 50
+        assert validator._session.connector.limit_per_host == 8
+
+
+@pytest.mark.asyncio
+async def test_appstore_auto_retry_is_per_request(appstore_validator_auto_retry_on_sandbox: AppStoreValidator):
+    validator = appstore_validator_auto_retry_on_sandbox
+    environments = []
+
+    async def post_json(self, receipt, sandbox=None):
+        environments.append(sandbox)
+        await asyncio.sleep(0.001)
+        if receipt["receipt-data"].startswith("sandbox") and not sandbox:
+            return {"status": 21007}
+        return {"status": 0}
+
+    with patch.object(AppStoreValidator, "post_json", new=post_json):
+        results = await validator.validate_many(["sandbox-receipt", "production-receipt"] * 5, concurrency=10)
+
+    assert all(result.ok for result in results)
+    # only the 5 sandbox receipts needed a second round trip
+    assert len(environments) == 15
+    assert environments.count(True) == 5
+    assert validator.sandbox is False
+
+
+@pytest.mark.asyncio
+async def test_appstore_result_cache_stampede_protection():
+    validator = AppStoreValidator(cache=MemoryCache())
+    calls = []
+
+    async def post_json(self, receipt, sandbox=None):
+        calls.append(receipt)
+        await asyncio.sleep(0.01)
+        return {"status": 0}
+
+    with patch.object(AppStoreValidator, "post_json", new=post_json):
+        results = await asyncio.gather(*(validator.validate("test-receipt") for _ in range(10)))
+        assert results == [{"status": 0}] * 10
+        assert len(calls) == 1
+
+        await validator.validate("test-receipt")
+        assert len(calls) == 1
+
+        await validator.validate("other-receipt")
+        assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_appstore_result_cache_shares_errors():
+    validator = AppStoreValidator(cache=MemoryCache())
+    calls = []
+
+    async def post_json(self, receipt, sandbox=None):
+        calls.append(receipt)
+        await asyncio.sleep(0.01)
+        return {"status": 21003}
+
+    with patch.object(AppStoreValidator, "post_json", new=post_json):
+        results = await asyncio.gather(*(validator.validate("test-receipt") for _ in range(3)), return_exceptions=True)
+
+    assert len(calls) == 1
+    assert all(isinstance(result, InAppPyValidationError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_appstore_stream_response():
+    pytest.importorskip("ijson")
+    history = [{"original_transaction_id": str(i % 2), "purchase_date_ms": str(i)} for i in range(100)]
+
+    async def verify_receipt(request):
+        await request.json()
+        return web.json_response({"status": 0, "latest_receipt_info": history, "latest_receipt": "blob"})
+
+    app = web.Application()
+    app.router.add_post("/verifyReceipt", verify_receipt)
+
+    async with TestServer(app) as server:
+        validator = AppStoreValidator(stream_response=True, keep_transactions=3)
+        validator.PRODUCTION_URL = str(server.make_url("/verifyReceipt"))
+        async with validator:
+            result = await validator.validate("test-receipt")
+
+    assert result["latest_receipt_info"] == history[:-7:-1]
+    assert result["latest_receipt"] == "blob"
+
+
+@pytest.mark.asyncio
+async def test_appstore_instrumentation():
+    async def verify_receipt(request):
+        receipt = (await request.json())["receipt-data"]
+        if receipt == "broken":
+            return web.Response(body=b"<html>")
+        return web.json_response({"status": 21007 if request.path == "/production" else 0})
+
+    app = web.Application()
+    app.router.add_post("/production", verify_receipt)
+    app.router.add_post("/sandbox", verify_receipt)
+    metrics = MetricsRecorder()
+
+    async with TestServer(app) as server:
+        validator = AppStoreValidator(auto_retry_wrong_env_request=True, instrumentation=metrics)
+        validator.PRODUCTION_URL = str(server.make_url("/production"))
+        validator.SANDBOX_URL = str(server.make_url("/sandbox"))
+        async with validator:
+            await validator.validate("test-receipt")
+            with pytest.raises(InAppPyValidationError, match="HTTP error"):
+                await validator.validate("broken")
+
+    assert metrics.histogram("appstore.request", environment="production").count == 2
+    assert metrics.histogram("appstore.request", environment="sandbox").count == 1
+    # the broken response is not counted as decoded.
+    assert metrics.histogram("appstore.decode").count == 2
+    assert metrics.counter("appstore.status", status=21007) == 1
+    assert metrics.counter("appstore.status", status=0) == 1
+    assert metrics.counter("appstore.env_retry") == 1
+    assert metrics.counter("appstore.error", error="JSONDecodeError") == 1
+    # the keep-alive connection is reused after the first request.
+    assert 1 <= metrics.histogram("appstore.connect").count <= 2
+
+
+@pytest.mark.asyncio
+async def test_appstore_prevalidation(appstore_receipt):
+    requests = []
+
+    async def verify_receipt(request):
+        requests.append(request.path)
+        return web.json_response({"status": 0})
+
+    app = web.Application()
+    app.router.add_post("/production", verify_receipt)
+    app.router.add_post("/sandbox", verify_receipt)
+
+    async with TestServer(app) as server:
+        validator = AppStoreValidator(bundle_ids={"com.example.app"}, route_by_environment=True)
+        validator.PRODUCTION_URL = str(server.make_url("/production"))
+        validator.SANDBOX_URL = str(server.make_url("/sandbox"))
+        async with validator:
+            with pytest.raises(InAppPyValidationError, match="Malformed receipt"):
+                await validator.validate("bm90IGEgcmVjZWlwdA==")
+            with pytest.raises(InAppPyValidationError, match="Bundle ID mismatch"):
+                await validator.validate(appstore_receipt(bundle_id="com.example.other"))
+
+            await validator.validate(appstore_receipt(environment="ProductionSandbox"))
+            await validator.validate(appstore_receipt())
+
+    assert requests == ["/sandbox", "/production"]
+
+
+@pytest.mark.asyncio
+async def test_appstore_retry_policy():
+    # failures injected by the stub, one per request, then successes.
+    failures = ["html", 21005, "slow", 21009]
+
+    async def verify_receipt(request):
+        failure = failures.pop(0) if failures else None
+        if failure == "html":
+            return web.Response(status=503, body=b"<html>")
+        if failure == "slow":
+            await asyncio.sleep(1)
+        return web.json_response({"status": failure if isinstance(failure, int) else 0})
+
+    app = web.Application()
+    app.router.add_post("/verifyReceipt", verify_receipt)
+    metrics = MetricsRecorder()
+
+    async with TestServer(app) as server:
+        validator = AppStoreValidator(
+            http_timeout=0.2, retry_policy=RetryPolicy(attempts=5, backoff=0.01), instrumentation=metrics
+        )
+        validator.PRODUCTION_URL = str(server.make_url("/verifyReceipt"))
+        async with validator:
+            assert await validator.validate("test-receipt") == {"status": 0}
+
+    assert metrics.counter("appstore.retry", reason="http") == 2
+    assert metrics.counter("appstore.retry", reason=21005) == 1
+    assert metrics.counter("appstore.retry", reason=21009) == 1
+    assert metrics.counter("appstore.error", error="TimeoutError") == 1
+
+
+@pytest.mark.asyncio
+async def test_appstore_retry_deadline_and_circuit_breaker():
+    async def verify_receipt(request):
+        await asyncio.sleep(1)
+        return web.json_response({"status": 0})
+
+    app = web.Application()
+    app.router.add_post("/verifyReceipt", verify_receipt)
+    breaker = CircuitBreaker(failure_threshold=2)
+
+    async with TestServer(app) as server:
+        validator = AppStoreValidator(retry_policy=RetryPolicy(attempts=1, deadline=0.1), circuit_breaker=breaker)
+        validator.PRODUCTION_URL = str(server.make_url("/verifyReceipt"))
+        async with validator:
+            # the request times out with the deadline.
+            with pytest.raises(DeadlineExceededError):
+                await validator.validate("test-receipt")
+
+            validator.retry_policy = None
+            validator.http_timeout = 0.05
+            with pytest.raises(AppStoreHTTPError):
+                await validator.validate("test-receipt")
+            with pytest.raises(CircuitOpenError):
+                await validator.validate("test-receipt")
+
+
+@pytest.mark.asyncio
+async def test_appstore_circuit_breaker_cancelled_trial():
+    slow = [True]
+
+    async def verify_receipt(request):
+        if slow[0]:
+            await asyncio.sleep(1)
+        return web.json_response({"status": 0})
+
+    app = web.Application()
+    app.router.add_post("/verifyReceipt", verify_receipt)
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+
+    async with TestServer(app) as server:
+        validator = AppStoreValidator(circuit_breaker=breaker)
+        validator.PRODUCTION_URL = str(server.make_url("/verifyReceipt"))
+        async with validator:
+            # the half open trial is cancelled, it records neither success nor failure.
+            now[0] = 10.0
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(validator.validate("test-receipt"), 0.05)
+            with pytest.raises(CircuitOpenError):
+                await validator.validate("test-receipt")
+
+            slow[0] = False
+            now[0] = 20.0
+            assert await validator.validate("test-receipt") == {"status": 0}
+            assert breaker.state == CircuitBreaker.CLOSED
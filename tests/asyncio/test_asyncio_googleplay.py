@@ -0,0 +1,331 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from googleapiclient.errors import HttpError
+
+from inapppy import errors
+from inapppy.asyncio import GooglePlayVerifier
+from inapppy.asyncio.singleflight import SingleFlight
+from inapppy.cache import MemoryCache
+from inapppy.credentials import TokenCache
+from inapppy.instrumentation import MetricsRecorder
+from inapppy.ratelimit import TokenBucket
+
+
+class FakeGoogle:
+    """Local fake of the oauth2 token and androidpublisher purchases endpoints."""
+
+    def __init__(self):
+        self.token_requests = 0
+        self.purchase_requests = []
+        # purchase requests answered with 429 before the next success.
+        self.throttle = 0
+        # access tokens answered with 401, e.g. revoked ones.
+        self.revoked = set()
+
+        self.app = web.Application()
+        self.app.router.add_post("/token", self.token)
+        self.app.router.add_get(
+            "/androidpublisher/v3/applications/{package}/purchases/{kind}/{sku}/tokens/{token}", self.purchase
+        )
+
+    async def token(self, request):
+        form = await request.post()
+        assert form["grant_type"] == "urn:ietf:params:oauth:grant-type:jwt-bearer"
+        assert form["assertion"].count(".") == 2
+
+        self.token_requests += 1
+        return web.json_response({"access_token": f"token-{self.token_requests}", "expires_in": 3600})
+
+    async def purchase(self, request):
+        authorization = request.headers["Authorization"]
+        if authorization.split()[-1] in self.revoked:
+            return web.json_response({"error": {"code": 401}}, status=401)
+        assert authorization == f"Bearer token-{self.token_requests}"
+        info = request.match_info
+        self.purchase_requests.append((info["package"], info["kind"], info["sku"], info["token"]))
+
+        if self.throttle:
+            self.throttle -= 1
+            return web.json_response({"error": {"code": 429}}, status=429, headers={"Retry-After": "0"})
+
+        if info["token"] == "bad":
+            return web.json_response({"error": {"code": 400}}, status=400, reason="Bad request")
+        if info["token"] == "missing":
+            return web.json_response({"error": {"code": 404}}, status=404)
+        if info["token"] == "canceled":
+            return web.json_response({"purchaseState": 1, "cancelReason": 1})
+        if info["kind"] == "subscriptions":
+            return web.json_response({"expiryTimeMillis": str(int(time.time() * 1000) + 10 ** 7)})
+        return web.json_response({"purchaseState": 0})
+
+
+def service_account_credentials(server: TestServer, private_key: str) -> dict:
+    return {
+        "type": "service_account",
+        "client_email": "verifier@example.iam.gserviceaccount.com",
+        "private_key_id": "1",
+        "private_key": private_key,
+        "token_uri": str(server.make_url("/token")),
+    }
+
+
+@asynccontextmanager
+async def fake_google_verifier(private_key: str):
+    fake_google = FakeGoogle()
+    server = TestServer(fake_google.app)
+    await server.start_server()
+
+    credentials = service_account_credentials(server, private_key)
+    try:
+        async with GooglePlayVerifier("com.example.app", credentials, api_root=str(server.make_url("/"))) as verifier:
+            yield verifier, fake_google
+    finally:
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_verify_product(service_account_private_key):
+    async with fake_google_verifier(service_account_private_key) as (verifier, fake_google):
+        assert await verifier.verify("purchase-token", "product-sku") == {"purchaseState": 0}
+        assert fake_google.purchase_requests == [("com.example.app", "products", "product-sku", "purchase-token")]
+
+        with pytest.raises(errors.GoogleError, match="Purchase cancelled"):
+            await verifier.verify("canceled", "product-sku")
+
+
+@pytest.mark.asyncio
+async def test_verify_subscription(service_account_private_key):
+    async with fake_google_verifier(service_account_private_key) as (verifier, fake_google):
+        result = await verifier.verify("purchase-token", "subscription-sku", is_subscription=True)
+        assert "expiryTimeMillis" in result
+
+        with pytest.raises(errors.GoogleError, match="Subscription is canceled"):
+            await verifier.verify("canceled", "subscription-sku", is_subscription=True)
+
+
+@pytest.mark.asyncio
+async def test_verify_with_result(service_account_private_key):
+    async with fake_google_verifier(service_account_private_key) as (verifier, _):
+        result = await verifier.verify_with_result("canceled", "subscription-sku", is_subscription=True)
+        assert result.is_canceled
+        assert result.is_expired
+
+        result = await verifier.verify_with_result("purchase-token", "product-sku")
+        assert result.is_canceled is False
+        assert result.raw_response == {"purchaseState": 0}
+
+
+@pytest.mark.asyncio
+async def test_verify_http_errors(service_account_private_key):
+    async with fake_google_verifier(service_account_private_key) as (verifier, _):
+        with pytest.raises(errors.GoogleError, match="Bad request"):
+            await verifier.verify("bad", "product-sku")
+
+        with pytest.raises(HttpError):
+            await verifier.verify("missing", "product-sku")
+
+
+@pytest.mark.asyncio
+async def test_access_token_is_cached(service_account_private_key):
+    async with fake_google_verifier(service_account_private_key) as (verifier, fake_google):
+        results = await verifier.verify_many([("purchase-token", "product-sku")] * 10, concurrency=10)
+
+        assert all(result.ok for result in results)
+        assert fake_google.token_requests == 1
+
+
+@pytest.mark.asyncio
+async def test_rejected_access_token_is_refreshed(service_account_private_key):
+    async with fake_google_verifier(service_account_private_key) as (verifier, fake_google):
+        assert await verifier.verify("purchase-token", "product-sku") == {"purchaseState": 0}
+
+        # a revoked token is replaced once, by the first of the concurrent calls it fails.
+        fake_google.revoked.add("token-1")
+        results = await verifier.verify_many([("purchase-token", "product-sku")] * 5, concurrency=5)
+        assert all(result.ok for result in results)
+        assert fake_google.token_requests == 2
+
+        # a new token rejected as well is an error, not a loop.
+        fake_google.revoked.update(("token-2", "token-3"))
+        with pytest.raises(HttpError):
+            await verifier.verify("purchase-token", "product-sku")
+        assert fake_google.token_requests == 3
+
+
+@pytest.mark.asyncio
+async def test_verify_many(service_account_private_key):
+    purchases = [
+        ("token-0", "product-sku"),
+        ("canceled", "product-sku"),
+        ("bad", "product-sku"),
+        ("token-3", "subscription-sku", True),
+    ]
+
+    async with fake_google_verifier(service_account_private_key) as (verifier, _):
+        results = await verifier.verify_many(purchases, concurrency=2)
+        assert [result.index for result in results] == [0, 1, 2, 3]
+        assert [result.ok for result in results] == [True, False, False, True]
+        assert isinstance(results[1].error, errors.GoogleError)
+
+        results = await verifier.verify_many(purchases, concurrency=2, with_result=True)
+        assert [result.ok for result in results] == [True, True, False, True]
+        assert results[1].result.is_canceled
+
+
+@pytest.mark.asyncio
+async def test_verify_stream_ordered(service_account_private_key):
+    purchases = [
+        ("token-0", "product-sku"),
+        ("canceled", "product-sku"),
+        ("bad", "product-sku"),
+        ("token-3", "subscription-sku", True),
+    ]
+
+    async with fake_google_verifier(service_account_private_key) as (verifier, fake_google):
+        results = [result async for result in verifier.verify_stream(iter(purchases), concurrency=2, ordered=True)]
+        assert [result.index for result in results] == [0, 1, 2, 3]
+        assert [result.item for result in results] == purchases
+        assert [result.ok for result in results] == [True, False, False, True]
+        assert isinstance(results[1].error, errors.GoogleError)
+        assert len(fake_google.purchase_requests) == 4
+
+        results = [result async for result in verifier.verify_stream(purchases[:2], with_result=True, ordered=True)]
+        assert [result.ok for result in results] == [True, True]
+        assert results[1].result.is_canceled
+
+        # verify_batch only wraps verify_stream, for code shared with the sync verifier.
+        results = [result async for result in verifier.verify_batch(purchases, batch_size=2)]
+        assert [result.ok for result in results] == [True, False, False, True]
+
+        with pytest.raises(ValueError):
+            verifier.verify_batch(purchases, batch_size=1001)
+
+
+def test_bad_credentials():
+    with pytest.raises(errors.InAppPyError):
+        GooglePlayVerifier("com.example.app", "missing-credentials.json")
+
+    with pytest.raises(errors.InAppPyError):
+        GooglePlayVerifier("com.example.app", {"client_email": "verifier@example.com"})
+
+
+@pytest.mark.asyncio
+async def test_verify_coalesces_concurrent_identical_calls(service_account_private_key):
+    async with fake_google_verifier(service_account_private_key) as (verifier, fake_google):
+        verifier.single_flight = SingleFlight()
+
+        results = await asyncio.gather(
+            *(verifier.verify("purchase-token", "product-sku") for _ in range(5)),
+            verifier.verify("purchase-token", "product-sku", is_subscription=True),
+        )
+
+        assert results[:5] == [{"purchaseState": 0}] * 5
+        assert len(fake_google.purchase_requests) == 2
+        assert verifier.single_flight.stats() == {"upstream_calls": 2, "coalesced_calls": 4}
+
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_cancelled_callers():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def slow(value):
+        calls.append(value)
+        await asyncio.sleep(0.05)
+        return {"value": value}
+
+    # the first caller gives up, the others still get the result of the call.
+    leader = asyncio.ensure_future(asyncio.wait_for(single_flight.do("key", slow, 1), 0.01))
+    await asyncio.sleep(0)
+    followers = [asyncio.ensure_future(single_flight.do("key", slow, 2)) for _ in range(3)]
+
+    with pytest.raises(asyncio.TimeoutError):
+        await leader
+    assert await asyncio.gather(*followers) == [{"value": 1}] * 3
+    assert calls == [1]
+
+    # once the flight landed the next call runs again.
+    assert await single_flight.do("key", slow, 3) == {"value": 3}
+
+
+@pytest.mark.asyncio
+async def test_verify_response_cache(service_account_private_key):
+    async with fake_google_verifier(service_account_private_key) as (verifier, fake_google):
+        verifier.cache = MemoryCache()
+
+        await verifier.verify("purchase-token", "subscription-sku", is_subscription=True)
+        await verifier.verify_with_result("purchase-token", "subscription-sku", is_subscription=True)
+        assert len(fake_google.purchase_requests) == 1
+
+        verifier.invalidate("purchase-token")
+        await verifier.verify("purchase-token", "subscription-sku", is_subscription=True)
+        assert len(fake_google.purchase_requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_access_token_is_shared_between_verifiers(service_account_private_key):
+    fake_google = FakeGoogle()
+    token_cache = TokenCache()
+
+    async with TestServer(fake_google.app) as server:
+        credentials = service_account_credentials(server, service_account_private_key)
+        for _ in range(3):
+            async with GooglePlayVerifier(
+                "com.example.app", credentials, api_root=str(server.make_url("/")), token_cache=token_cache
+            ) as verifier:
+                await verifier.verify("purchase-token", "product-sku")
+
+    assert fake_google.token_requests == 1
+    assert len(fake_google.purchase_requests) == 3
+
+
+@pytest.mark.asyncio
+async def test_verifier_instrumentation(service_account_private_key):
+    fake_google = FakeGoogle()
+    metrics = MetricsRecorder()
+
+    async with TestServer(fake_google.app) as server:
+        credentials = service_account_credentials(server, service_account_private_key)
+        async with GooglePlayVerifier(
+            "com.example.app",
+            credentials,
+            api_root=str(server.make_url("/")),
+            token_cache=TokenCache(),
+            instrumentation=metrics,
+        ) as verifier:
+            await verifier.verify("purchase-token", "product-sku")
+            await verifier.verify("purchase-token", "subscription-sku", is_subscription=True)
+            with pytest.raises(errors.GoogleError):
+                await verifier.verify("bad", "product-sku")
+
+    assert metrics.histogram("googleplay.request", kind="products").count == 2
+    assert metrics.histogram("googleplay.request", kind="subscriptions").count == 1
+    assert metrics.histogram("googleplay.decode").count == 2
+    assert metrics.counter("googleplay.status", kind="products", status=200) == 1
+    assert metrics.counter("googleplay.status", kind="products", status=400) == 1
+    assert metrics.histogram("googleplay.connect").count >= 1
+
+
+@pytest.mark.asyncio
+async def test_verify_rate_limit(service_account_private_key):
+    async with fake_google_verifier(service_account_private_key) as (verifier, fake_google):
+        verifier.rate_limiter = TokenBucket(rate=100, burst=1)
+
+        fake_google.throttle = 2
+        assert await verifier.verify("purchase-token", "product-sku") == {"purchaseState": 0}
+        assert len(fake_google.purchase_requests) == 3
+
+        fake_google.throttle = 3
+        with pytest.raises(errors.GoogleRateLimitError, match="Rate limit exceeded"):
+            await verifier.verify("purchase-token", "product-sku")
+
+        # calls queue for their token instead of bursting.
+        started = time.perf_counter()
+        results = await verifier.verify_many([("purchase-token", "product-sku")] * 5, concurrency=5)
+        assert all(result.error is None for result in results)
+        assert time.perf_counter() - started >= 0.03
@@ -0,0 +1,274 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from inapppy.asyncio import AppStoreValidator, GooglePlayVerifier
+from inapppy.asyncio.bulk import bounded_in_order
+from inapppy.credentials import TokenCache
+from inapppy.errors import InAppPyError
+from inapppy.reconcile import Reconciler, load_checkpoint, main, read_records, reconcile_file
+
+
+class FakeStores:
+    """Local fake of verifyReceipt (production and sandbox), the oauth2 token and androidpublisher endpoints."""
+
+    def __init__(self):
+        self.expiry_ms = int(time.time() * 1000) + 10 ** 7
+        self.app = web.Application()
+        self.app.router.add_post("/production", self.verify_receipt)
+        self.app.router.add_post("/sandbox", self.verify_receipt)
+        self.app.router.add_post("/token", self.token)
+        self.app.router.add_get(
+            "/androidpublisher/v3/applications/{package}/purchases/{kind}/{sku}/tokens/{token}", self.purchase
+        )
+
+    async def verify_receipt(self, request):
+        receipt = (await request.json())["receipt-data"]
+        # responses arrive out of order.
+        await asyncio.sleep(0.01 * (hash(receipt) % 3))
+
+        if receipt == "sandbox-receipt" and request.path == "/production":
+            return web.json_response({"status": 21007})
+        if receipt == "deleted-receipt":
+            return web.json_response({"status": 21010})
+
+        transaction = {
+            "product_id": "monthly",
+            "original_transaction_id": "1000",
+            "purchase_date_ms": "1000",
+            "expires_date_ms": str(self.expiry_ms),
+        }
+        environment = "Sandbox" if request.path == "/sandbox" else "Production"
+        return web.json_response({"status": 0, "environment": environment, "latest_receipt_info": [transaction]})
+
+    async def token(self, request):
+        return web.json_response({"access_token": "token", "expires_in": 3600})
+
+    async def purchase(self, request):
+        if request.match_info["token"] == "canceled-token":
+            return web.json_response({"expiryTimeMillis": str(self.expiry_ms), "cancelReason": 1})
+        return web.json_response({"purchaseState": 0})
+
+
+def write_lines(path, lines):
+    path.write_text("".join(line + "\n" for line in lines))
+
+
+def read_outcomes(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+@pytest.mark.asyncio
+async def test_reconcile_file(tmp_path, service_account_private_key):
+    export = tmp_path / "export.jsonl"
+    write_lines(
+        export,
+        [
+            json.dumps({"id": "1", "receipt": "receipt"}),
+            json.dumps({"id": "2", "receipt": "sandbox-receipt"}),
+            json.dumps({"id": "3", "purchase_token": "token", "product_sku": "coins"}),
+            json.dumps({"id": "4", "purchase_token": "canceled-token", "product_sku": "monthly", "is_subscription": 1}),
+            json.dumps({"id": "5", "receipt": "deleted-receipt"}),
+            "not json",
+            json.dumps({"id": "7", "store": "amazon"}),
+        ],
+    )
+    output = tmp_path / "outcomes.jsonl"
+    fake_stores = FakeStores()
+
+    async with TestServer(fake_stores.app) as server:
+        appstore = AppStoreValidator(auto_retry_wrong_env_request=True)
+        appstore.PRODUCTION_URL = str(server.make_url("/production"))
+        appstore.SANDBOX_URL = str(server.make_url("/sandbox"))
+        credentials = {
+            "client_email": "verifier@example.iam.gserviceaccount.com",
+            "private_key": service_account_private_key,
+            "token_uri": str(server.make_url("/token")),
+        }
+        googleplay = GooglePlayVerifier(
+            "com.example.app", credentials, api_root=str(server.make_url("/")), token_cache=TokenCache()
+        )
+
+        async with appstore, googleplay:
+            reconciler = Reconciler(appstore, googleplay, concurrency=3)
+            stats = await reconcile_file(reconciler, str(export), str(output))
+
+    assert stats == {"records": 7, "failed": 3}
+    outcomes = read_outcomes(output)
+    assert [outcome["index"] for outcome in outcomes] == list(range(7))
+    assert [outcome["id"] for outcome in outcomes] == ["1", "2", "3", "4", "5", None, "7"]
+    stores = ["appstore", "appstore", "googleplay", "googleplay", "appstore", None, None]
+    assert [outcome["store"] for outcome in outcomes] == stores
+
+    assert outcomes[0]["result"] == {
+        "status": 0,
+        "environment": "Production",
+        "bundle_id": None,
+        "active_products": ["monthly"],
+        "expires_date_ms": fake_stores.expiry_ms,
+    }
+    assert outcomes[1]["result"]["environment"] == "Sandbox"
+    assert outcomes[2]["result"]["is_canceled"] is False
+    assert outcomes[3]["result"]["is_canceled"] is True
+    assert outcomes[4]["error"] == {
+        "type": "InAppPyValidationError",
+        "message": "The user account cannot be found or has been deleted",
+        "status": 21010,
+    }
+    assert outcomes[5]["error"]["message"] == "Bad record"
+    assert outcomes[6]["error"]["message"] == "Bad record"
+
+
+class Crash(BaseException):
+    """Stands for the process being killed."""
+
+
+class FakeAppStore:
+    def __init__(self, crash_on: str = None):
+        self.crash_on = crash_on
+        self.receipts = []
+
+    async def validate(self, receipt, shared_secret=None, exclude_old_transactions=False):
+        self.receipts.append(receipt)
+        await asyncio.sleep(0.001 * (len(self.receipts) % 3))
+        if receipt == self.crash_on:
+            raise Crash()
+        return {"status": 0}
+
+
+@pytest.mark.asyncio
+async def test_reconcile_file_resumes_from_checkpoint(tmp_path):
+    export = tmp_path / "export.jsonl"
+    write_lines(export, [json.dumps({"id": str(i), "receipt": f"receipt-{i}"}) for i in range(10)])
+    output = tmp_path / "outcomes.jsonl"
+    checkpoint = tmp_path / "outcomes.checkpoint"
+
+    reconciler = Reconciler(FakeAppStore(crash_on="receipt-7"), concurrency=2)
+    with pytest.raises(Crash):
+        await reconcile_file(reconciler, str(export), str(output), checkpoint_path=str(checkpoint), checkpoint_every=3)
+    assert load_checkpoint(str(checkpoint)) == {
+        "records": 6,
+        "output_bytes": sum(len(line) + 1 for line in output.read_text().splitlines()[:6]),
+    }
+
+    appstore = FakeAppStore()
+    reconciler = Reconciler(appstore, concurrency=2)
+    stats = await reconcile_file(reconciler, str(export), str(output), checkpoint_path=str(checkpoint))
+
+    assert stats == {"records": 4, "failed": 0}
+    assert appstore.receipts == ["receipt-6", "receipt-7", "receipt-8", "receipt-9"]
+    assert [outcome["id"] for outcome in read_outcomes(output)] == [str(i) for i in range(10)]
+    assert load_checkpoint(str(checkpoint))["records"] == 10
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("outcomes", [None, b'{"index":0}\n'])
+async def test_reconcile_file_restarts_without_checkpointed_output(tmp_path, outcomes):
+    export = tmp_path / "export.jsonl"
+    write_lines(export, [json.dumps({"id": str(i), "receipt": f"receipt-{i}"}) for i in range(3)])
+    output = tmp_path / "outcomes.jsonl"
+    if outcomes is not None:
+        output.write_bytes(outcomes)
+    checkpoint = tmp_path / "outcomes.checkpoint"
+    checkpoint.write_text(json.dumps({"records": 2, "output_bytes": 40}))
+
+    appstore = FakeAppStore()
+    stats = await reconcile_file(Reconciler(appstore), str(export), str(output), checkpoint_path=str(checkpoint))
+
+    # the output disagrees with the checkpoint, every record is reconciled again.
+    assert stats == {"records": 3, "failed": 0}
+    assert appstore.receipts == ["receipt-0", "receipt-1", "receipt-2"]
+    assert not output.read_bytes().startswith(b"\0")
+    assert [outcome["id"] for outcome in read_outcomes(output)] == ["0", "1", "2"]
+
+
+@pytest.mark.parametrize(
+    "content", ['{"records": 6, "output_by', '{"records": 6}', "[]", '{"records": "six", "output_bytes": 0}']
+)
+def test_corrupt_checkpoint(tmp_path, capsys, content):
+    export = tmp_path / "export.jsonl"
+    write_lines(export, [json.dumps({"id": "1", "receipt": "receipt"})])
+    checkpoint = tmp_path / "outcomes.checkpoint"
+    checkpoint.write_text(content)
+
+    with pytest.raises(InAppPyError, match="Corrupt checkpoint .*outcomes.checkpoint"):
+        load_checkpoint(str(checkpoint))
+
+    output = tmp_path / "outcomes.jsonl"
+    assert main([str(export), str(output), "--checkpoint", str(checkpoint)]) == 1
+    assert "Corrupt checkpoint" in capsys.readouterr().err
+    assert checkpoint.read_text() == content
+
+
+@pytest.mark.asyncio
+async def test_bounded_in_order():
+    running = []
+    peak = []
+
+    async def work(item):
+        running.append(item)
+        peak.append(len(running))
+        await asyncio.sleep(0.001 * (item % 4))
+        running.remove(item)
+        if item == 5:
+            raise ValueError(item)
+        return item * 2
+
+    results = [result async for result in bounded_in_order(work, range(20), concurrency=3)]
+
+    assert [result.index for result in results] == list(range(20))
+    assert [result.result for result in results if result.ok] == [item * 2 for item in range(20) if item != 5]
+    assert isinstance(results[5].error, ValueError)
+    assert max(peak) == 3
+
+
+class VerifyReceiptHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        body = json.dumps({"status": 21002 if request["receipt-data"] == "bad" else 0}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_reconcile_command_line(tmp_path, capsys):
+    export = tmp_path / "export.csv"
+    write_lines(export, ["id,receipt,purchase_token,product_sku", "1,receipt,,", "2,bad,,", "3,,token,coins"])
+    output = tmp_path / "outcomes.jsonl"
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), VerifyReceiptHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/verifyReceipt"
+        exit_code = main([str(export), str(output), "--appstore-production-url", url, "--appstore-qps", "100"])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert exit_code == 0
+    assert "3 records reconciled, 2 failed" in capsys.readouterr().err
+    outcomes = read_outcomes(output)
+    assert [outcome["ok"] for outcome in outcomes] == [True, False, False]
+    assert outcomes[1]["error"]["message"] == "Bad data"
+    assert outcomes[2]["error"]["message"] == "No googleplay validator"
+
+
+def test_read_records(tmp_path):
+    export = tmp_path / "export.txt"
+    write_lines(export, ['{"receipt": "a"}', "", "{broken"])
+    assert list(read_records(str(export))) == [{"receipt": "a"}, "{broken\n"]
+
+    write_lines(export, ["purchase_token,is_subscription", "token,true"])
+    assert list(read_records(str(export), "csv")) == [{"purchase_token": "token", "is_subscription": "true"}]
@@ -1,3 +1,6 @@
+import base64
+
+import rsa
 from pytest import fixture
 
 from inapppy import AppStoreValidator
@@ -26,3 +29,99 @@ def appstore_validator_sandbox() -> AppStoreValidator:
 @fixture
 def appstore_validator_auto_retry_on_sandbox() -> AppStoreValidator:
     return AppStoreValidator(auto_retry_wrong_env_request=True)
+
+
+def _der(tag: int, content: bytes) -> bytes:
+    length = len(content)
+    if length < 0x80:
+        return bytes([tag, length]) + content
+    length_bytes = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes([tag, 0x80 | len(length_bytes)]) + length_bytes + content
+
+
+def _google_play_keys() -> tuple:
+    public_key, private_key = rsa.newkeys(1024)
+    # SubjectPublicKeyInfo { AlgorithmIdentifier { rsaEncryption, NULL }, BIT STRING { RSAPublicKey } }
+    algorithm = _der(0x30, _der(0x06, bytes.fromhex("2a864886f70d010101")) + _der(0x05, b""))
+    subject_public_key_info = _der(0x30, algorithm + _der(0x03, b"\x00" + public_key.save_pkcs1("DER")))
+    return base64.standard_b64encode(subject_public_key_info).decode(), private_key
+
+
+@fixture(scope="session")
+def google_play_keys() -> tuple:
+    """Google Play style base64 X.509 public key (api_key) and the matching rsa private key."""
+    return _google_play_keys()
+
+
+@fixture(scope="session")
+def other_google_play_keys() -> tuple:
+    """A second, unrelated google_play_keys pair."""
+    return _google_play_keys()
+
+
+def _der_integer(value: int) -> bytes:
+    return _der(0x02, value.to_bytes(value.bit_length() // 8 + 1, "big", signed=True))
+
+
+def _receipt_attributes(attributes: list) -> bytes:
+    """SET of ReceiptAttribute { type INTEGER, version INTEGER, value OCTET STRING }"""
+    encoded = b"".join(
+        _der(0x30, _der_integer(attribute_type) + _der_integer(1) + _der(0x04, value))
+        for attribute_type, value in attributes
+    )
+    return _der(0x31, encoded)
+
+
+def _receipt_value(value) -> bytes:
+    if isinstance(value, bool) or isinstance(value, int):
+        return _der_integer(int(value))
+    if isinstance(value, bytes):
+        return value
+    # dates are IA5Strings, everything else UTF8String
+    return _der(0x16 if value[:2] == "20" and value.endswith("Z") else 0x0C, value.encode())
+
+
+def make_appstore_receipt(
+    bundle_id: str = "com.example.app",
+    environment: str = "Production",
+    in_app: list = (),
+    ber: bool = False,
+    **fields,
+) -> str:
+    """Base64 PKCS#7 receipt, with the receipt fields of inapppy.receipt, unsigned.
+
+    ber uses indefinite lengths and a chunked octet string, like some PKCS#7 encoders do.
+    """
+    attributes = [(0, environment), (2, bundle_id), (3, fields.pop("application_version", "1.0"))]
+    attributes += [(19, fields.pop("original_application_version", "1.0"))]
+    attributes += [(12, fields.pop("creation_date", "2019-03-19T12:00:00Z"))]
+    attributes += [(attribute_type, value) for attribute_type, value in fields.pop("extra", [])]
+    for purchase in in_app:
+        in_app_attributes = [(attribute_type, _receipt_value(value)) for attribute_type, value in purchase.items()]
+        attributes.append((17, _receipt_attributes(in_app_attributes)))
+    payload = _receipt_attributes([(attribute_type, _receipt_value(value)) for attribute_type, value in attributes])
+
+    def constructed(tag: int, content: bytes) -> bytes:
+        return bytes([tag, 0x80]) + content + b"\0\0" if ber else _der(tag, content)
+
+    if ber:
+        middle = len(payload) // 2
+        content = constructed(0x24, _der(0x04, payload[:middle]) + _der(0x04, payload[middle:]))
+    else:
+        content = _der(0x04, payload)
+
+    sha256 = _der(0x30, _der(0x06, bytes.fromhex("608648016503040201")) + _der(0x05, b""))
+    encapsulated = constructed(0x30, _der(0x06, bytes.fromhex("2a864886f70d010701")) + constructed(0xA0, content))
+    # certificates and signer infos are not looked at.
+    certificates, signer_infos = _der(0xA0, _der(0x30, b"")), _der(0x31, b"")
+    signed_data = constructed(
+        0x30, b"".join((_der_integer(1), _der(0x31, sha256), encapsulated, certificates, signer_infos))
+    )
+    content_info = constructed(0x30, _der(0x06, bytes.fromhex("2a864886f70d010702")) + constructed(0xA0, signed_data))
+    return base64.standard_b64encode(content_info).decode()
+
+
+@fixture(scope="session")
+def appstore_receipt():
+    """make_appstore_receipt, builds base64 App Store receipts."""
+    return make_appstore_receipt
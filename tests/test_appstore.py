@@ -1,8 +1,19 @@
-from unittest.mock import patch
+import base64
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
 
 import pytest
+import requests
 
 from inapppy import AppStoreValidator, InAppPyValidationError
+from inapppy.appstore import AppStoreTransaction, AppStoreValidationResult, api_result_errors
+from inapppy.cache import MemoryCache
+from inapppy.errors import AppStoreHTTPError, CircuitOpenError, DeadlineExceededError, ReceiptError
+from inapppy.instrumentation import MetricsRecorder
+from inapppy.retry import CircuitBreaker, RetryPolicy
 
 
 def test_appstore_validator_initiation_simple(appstore_validator: AppStoreValidator):
@@ -91,3 +102,424 @@ def test_appstore_auto_retry_wrong_env_request(appstore_validator_auto_retry_on_
             assert mock_method.call_count == 1
             assert validator.url == "https://buy.itunes.apple.com/verifyReceipt"
             assert mock_method.call_args[0][0] == {"receipt-data": "test-receipt", "password": "shared-secret"}
+
+
+def test_appstore_post_json_reuses_session():
+    session = Mock()
+    session.post.return_value.json.return_value = {"status": 0}
+    validator = AppStoreValidator(http_session=session)
+
+    validator.validate(receipt="test-receipt")
+    validator.validate(receipt="test-receipt")
+
+    assert session.post.call_count == 2
+    assert session.post.call_args[0][0] == "https://buy.itunes.apple.com/verifyReceipt"
+    assert session.post.call_args[1] == {"json": {"receipt-data": "test-receipt"}, "timeout": None}
+
+
+def test_appstore_post_json_http_error():
+    session = Mock()
+    session.post.side_effect = requests.ConnectionError()
+    validator = AppStoreValidator(http_session=session)
+
+    with pytest.raises(InAppPyValidationError, match="HTTP error"):
+        validator.validate(receipt="test-receipt")
+
+
+def test_appstore_instrumentation():
+    session = Mock()
+    session.post.return_value.json.side_effect = [{"status": 21007}, {"status": 0}, {"status": 0}]
+    metrics = MetricsRecorder()
+    validator = AppStoreValidator(
+        auto_retry_wrong_env_request=True, http_session=session, cache=MemoryCache(), instrumentation=metrics
+    )
+
+    validator.validate(receipt="test-receipt")
+    validator.validate(receipt="test-receipt")
+    validator.validate(receipt="other-receipt")
+
+    assert metrics.histogram("appstore.request", environment="production").count == 2
+    assert metrics.histogram("appstore.request", environment="sandbox").count == 1
+    assert metrics.histogram("appstore.decode").count == 3
+    assert metrics.counter("appstore.status", status=21007) == 1
+    assert metrics.counter("appstore.status", status=0) == 2
+    assert metrics.counter("appstore.env_retry") == 1
+    assert metrics.counter("appstore.cache", result="hit") == 1
+    assert metrics.counter("appstore.cache", result="miss") == 2
+
+    session.post.side_effect = requests.ConnectionError()
+    with pytest.raises(InAppPyValidationError, match="HTTP error"):
+        validator.validate(receipt="failing-receipt")
+    assert metrics.counter("appstore.error", error="ConnectionError") == 1
+
+
+def test_appstore_prevalidation(appstore_receipt):
+    session = Mock()
+    session.post.return_value.json.return_value = {"status": 0}
+    metrics = MetricsRecorder()
+    validator = AppStoreValidator(http_session=session, bundle_ids=["com.example.app"], instrumentation=metrics)
+    assert validator.prevalidate
+
+    with pytest.raises(ReceiptError, match="Bad receipt encoding"):
+        validator.validate("not a receipt")
+    with pytest.raises(ReceiptError, match="Bundle ID mismatch"):
+        validator.validate(appstore_receipt(bundle_id="com.example.other"))
+    with pytest.raises(ReceiptError, match="Malformed receipt"):
+        validator.validate(base64.b64encode(b"\x30\x80" * 3000).decode())
+    assert session.post.call_count == 0
+    assert metrics.counter("appstore.rejected", reason="Bad receipt encoding") == 1
+    assert metrics.counter("appstore.rejected", reason="Bundle ID mismatch") == 1
+
+    validator.validate(appstore_receipt())
+    assert session.post.call_count == 1
+
+
+def test_appstore_route_by_environment(appstore_receipt):
+    session = Mock()
+    session.post.return_value.json.return_value = {"status": 0}
+    validator = AppStoreValidator(http_session=session, route_by_environment=True)
+
+    validator.validate(appstore_receipt(environment="ProductionSandbox"))
+    assert session.post.call_args[0][0] == AppStoreValidator.SANDBOX_URL
+
+    validator.validate(appstore_receipt(environment="Production"))
+    assert session.post.call_args[0][0] == AppStoreValidator.PRODUCTION_URL
+
+
+def _json_response(api_response: dict) -> Mock:
+    response = Mock()
+    response.json.return_value = api_response
+    return response
+
+
+def test_appstore_retry_policy():
+    session = Mock()
+    session.post.side_effect = [
+        requests.ConnectionError(),
+        _json_response({"status": 21005}),
+        _json_response({"status": 0}),
+    ]
+    metrics = MetricsRecorder()
+    validator = AppStoreValidator(http_session=session, retry_policy=RetryPolicy(backoff=0), instrumentation=metrics)
+
+    assert validator.validate(receipt="test-receipt") == {"status": 0}
+    assert session.post.call_count == 3
+    assert metrics.counter("appstore.retry", reason="http") == 1
+    assert metrics.counter("appstore.retry", reason=21005) == 1
+    assert metrics.counter("appstore.status", status=0) == 1
+
+    # permanent errors are not retried.
+    session.post.side_effect = None
+    session.post.return_value = _json_response({"status": 21002})
+    with pytest.raises(InAppPyValidationError, match="Bad data"):
+        validator.validate(receipt="test-receipt")
+    assert session.post.call_count == 4
+
+
+def test_appstore_retry_policy_gives_up():
+    session = Mock()
+    session.post.return_value = _json_response({"status": 21009})
+    validator = AppStoreValidator(http_session=session, retry_policy=RetryPolicy(attempts=2, backoff=0))
+
+    with pytest.raises(InAppPyValidationError, match="Internal data access error") as ex:
+        validator.validate(receipt="test-receipt")
+    assert ex.value.raw_response == {"status": 21009}
+    assert session.post.call_count == 2
+
+    session.post.side_effect = requests.Timeout()
+    with pytest.raises(AppStoreHTTPError, match="HTTP error"):
+        validator.validate(receipt="test-receipt")
+    assert session.post.call_count == 4
+
+
+def test_appstore_retry_deadline_covers_environment_switch():
+    def post(url, json, timeout):
+        time.sleep(0.06)
+        return _json_response({"status": 21007 if url == AppStoreValidator.PRODUCTION_URL else 21005})
+
+    session = Mock()
+    session.post.side_effect = post
+    metrics = MetricsRecorder()
+    validator = AppStoreValidator(
+        auto_retry_wrong_env_request=True,
+        http_timeout=10,
+        http_session=session,
+        retry_policy=RetryPolicy(backoff=0, deadline=0.1),
+        instrumentation=metrics,
+    )
+
+    with pytest.raises(DeadlineExceededError) as ex:
+        validator.validate(receipt="test-receipt")
+    assert ex.value.raw_response == {"status": 21005}
+    assert session.post.call_count == 2
+    # the sandbox request only gets what is left of the deadline.
+    assert session.post.call_args_list[0][1]["timeout"] <= 0.1
+    assert session.post.call_args_list[1][1]["timeout"] <= 0.04
+    assert metrics.counter("appstore.deadline") == 1
+
+
+def test_appstore_circuit_breaker():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=lambda: now[0])
+    session = Mock()
+    session.post.side_effect = requests.ConnectionError()
+    validator = AppStoreValidator(http_session=session, circuit_breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(AppStoreHTTPError):
+            validator.validate(receipt="test-receipt")
+    with pytest.raises(CircuitOpenError):
+        validator.validate(receipt="test-receipt")
+    assert session.post.call_count == 2
+
+    # after the reset timeout a trial request closes the circuit again.
+    now[0] = 30.0
+    session.post.side_effect = None
+    session.post.return_value = _json_response({"status": 0})
+    assert validator.validate(receipt="test-receipt") == {"status": 0}
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_appstore_injected_session_is_not_closed():
+    session = Mock()
+    with AppStoreValidator(http_session=session) as validator:
+        assert validator.http_session is session
+
+    session.close.assert_not_called()
+
+
+def test_appstore_owned_session_lifecycle():
+    with AppStoreValidator(pool_connections=2, pool_maxsize=20, max_retries=3) as validator:
+        session = validator.http_session
+        assert validator.http_session is session
+
+        adapter = session.get_adapter(validator.url)
+        assert adapter._pool_connections == 2
+        assert adapter._pool_maxsize == 20
+        assert adapter.max_retries.total == 3
+
+        with patch.object(session, "close") as close_mock:
+            validator.close()
+            close_mock.assert_called_once_with()
+
+    assert validator.http_session is not session
+
+
+def test_appstore_auto_retry_is_per_request(appstore_validator_auto_retry_on_sandbox: AppStoreValidator):
+    validator = appstore_validator_auto_retry_on_sandbox
+    responses = {False: {"status": 21007}, True: {"status": 0}}
+
+    with patch.object(AppStoreValidator, "post_json", side_effect=lambda _, sandbox: responses[sandbox]) as mock_method:
+        assert validator.validate(receipt="sandbox-receipt") == {"status": 0}
+        assert [call[0][1] for call in mock_method.call_args_list] == [False, True]
+
+    # shared state is untouched, the next receipt starts in production again.
+    assert validator.sandbox is False
+    assert validator.url == "https://buy.itunes.apple.com/verifyReceipt"
+
+
+def test_appstore_post_json_uses_requested_environment():
+    session = Mock()
+    session.post.return_value.json.return_value = {"status": 0}
+    validator = AppStoreValidator(http_session=session)
+
+    validator.post_json({"receipt-data": "test-receipt"}, sandbox=True)
+    assert session.post.call_args[0][0] == "https://sandbox.itunes.apple.com/verifyReceipt"
+
+    validator.post_json({"receipt-data": "test-receipt"})
+    assert session.post.call_args[0][0] == "https://buy.itunes.apple.com/verifyReceipt"
+
+
+def test_appstore_sticky_environment_learning():
+    validator = AppStoreValidator(auto_retry_wrong_env_request=True, environment_cache_size=2)
+    responses = {False: {"status": 21007}, True: {"status": 0}}
+
+    with patch.object(AppStoreValidator, "post_json", side_effect=lambda _, sandbox: responses[sandbox]) as mock_method:
+        validator.validate(receipt="sandbox-receipt")
+        assert mock_method.call_count == 2
+
+        # learned environment skips the wasted production round trip.
+        validator.validate(receipt="sandbox-receipt")
+        assert mock_method.call_count == 3
+        assert mock_method.call_args[0][1] is True
+
+        # other receipts still start in the configured environment.
+        validator.validate(receipt="other-receipt")
+        assert mock_method.call_args_list[3][0][1] is False
+
+    assert len(validator.environment_cache) == 2
+    assert validator.sandbox is False
+
+
+def test_appstore_errors_are_not_shared(appstore_validator: AppStoreValidator):
+    raised = []
+    for raw_response in ({"status": 21002, "request": 1}, {"status": 21002, "request": 2}):
+        with patch.object(AppStoreValidator, "post_json", return_value=raw_response):
+            with pytest.raises(InAppPyValidationError, match="Bad data") as ex:
+                appstore_validator.validate(receipt="test-receipt")
+            raised.append(ex.value)
+
+    assert raised[0] is not raised[1]
+    assert raised[0].raw_response == {"status": 21002, "request": 1}
+    assert raised[1].raw_response == {"status": 21002, "request": 2}
+    assert api_result_errors[21002].raw_response is None
+
+
+def test_appstore_result_cache():
+    validator = AppStoreValidator(cache=MemoryCache())
+
+    with patch.object(AppStoreValidator, "post_json", return_value={"status": 0}) as mock_method:
+        assert validator.validate(receipt="test-receipt", shared_secret="secret") == {"status": 0}
+        assert validator.validate(receipt="test-receipt", shared_secret="secret") == {"status": 0}
+        assert mock_method.call_count == 1
+
+        # shared secret and exclude_old_transactions are part of the key.
+        validator.validate(receipt="test-receipt", shared_secret="other-secret")
+        validator.validate(receipt="test-receipt", shared_secret="secret", exclude_old_transactions=True)
+        assert mock_method.call_count == 3
+
+
+def test_appstore_result_cache_skips_errors():
+    validator = AppStoreValidator(cache=MemoryCache())
+
+    with patch.object(AppStoreValidator, "post_json", return_value={"status": 21002}) as mock_method:
+        for _ in range(2):
+            with pytest.raises(InAppPyValidationError):
+                validator.validate(receipt="test-receipt")
+        assert mock_method.call_count == 2
+
+
+def test_appstore_result_cache_ttl_follows_expiry():
+    validator = AppStoreValidator(cache_ttl=300)
+    now_ms = time.time() * 1000
+
+    assert validator._result_ttl({"status": 0}) == 300
+
+    response = {
+        "status": 0,
+        "latest_receipt_info": [
+            {"expires_date_ms": str(int(now_ms - 10 ** 6))},
+            {"expires_date_ms": str(int(now_ms + 60 * 1000))},
+            {"expires_date_ms": str(int(now_ms + 10 ** 7))},
+            {"product_id": "consumable"},
+        ],
+    }
+    assert 55 < validator._result_ttl(response) <= 60
+
+    response["latest_receipt_info"] = [{"expires_date_ms": str(int(now_ms - 10 ** 6))}]
+    assert validator._result_ttl(response) == 300
+
+    # entries without a usable expiry are skipped, the others still bound the ttl.
+    response["latest_receipt_info"] = [
+        {"expires_date_ms": "not a number"},
+        {"expires_date_ms": None},
+        "not a transaction",
+        {"expires_date_ms": str(int(now_ms + 60 * 1000))},
+    ]
+    assert 55 < validator._result_ttl(response) <= 60
+
+
+def test_appstore_result_cache_stampede_protection():
+    validator = AppStoreValidator(cache=MemoryCache())
+    calls = []
+
+    def post_json(request_json, sandbox):
+        calls.append(request_json)
+        time.sleep(0.05)
+        return {"status": 0}
+
+    with patch.object(validator, "post_json", side_effect=post_json):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: validator.validate(receipt="test-receipt"), range(8)))
+
+    assert len(calls) == 1
+    assert results == [{"status": 0}] * 8
+
+
+def test_appstore_stream_response():
+    pytest.importorskip("ijson")
+    history = [
+        {"original_transaction_id": "1000", "transaction_id": str(i), "purchase_date_ms": str(i)} for i in range(100)
+    ]
+    body = {"status": 0, "receipt": {"in_app": history}, "latest_receipt_info": history, "latest_receipt": "blob"}
+
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = io.BytesIO(json.dumps(body).encode())
+    session = Mock()
+    session.post.return_value = response
+
+    validator = AppStoreValidator(http_session=session, stream_response=True, drop_latest_receipt=True)
+    result = validator.validate(receipt="test-receipt")
+
+    assert session.post.call_args[1]["stream"] is True
+    assert result["latest_receipt_info"] == [history[-1]]
+    assert result["receipt"]["in_app"] == [history[-1]]
+    assert result["latest_receipt"] == ""
+
+    response = requests.Response()
+    response.raw = io.BytesIO(b'{"status": 0, "receipt": {"in_app": [')
+    session.post.return_value = response
+    with pytest.raises(InAppPyValidationError, match="HTTP error"):
+        validator.validate(receipt="test-receipt")
+
+
+def test_appstore_validation_result():
+    hour = 3600 * 1000
+
+    def transaction(product_id, transaction_id, original_transaction_id, purchase_ms, expires_ms, **fields):
+        transaction = {
+            "product_id": product_id,
+            "transaction_id": transaction_id,
+            "original_transaction_id": original_transaction_id,
+            "purchase_date_ms": str(purchase_ms),
+            "expires_date_ms": str(expires_ms),
+            "is_trial_period": "false",
+        }
+        transaction.update(fields)
+        return transaction
+
+    response = {
+        "status": 0,
+        "environment": "Sandbox",
+        "receipt": {"bundle_id": "com.example.app", "in_app": []},
+        "latest_receipt_info": [
+            transaction("monthly", "3", "1", 2 * hour, 3 * hour),
+            transaction("monthly", "1", "1", 0, hour, is_trial_period="true"),
+            transaction("monthly", "2", "1", hour, 2 * hour),
+            transaction("yearly", "5", "5", 0, 10 * hour, cancellation_date_ms=str(5 * hour)),
+        ],
+    }
+    result = AppStoreValidationResult.from_response(response)
+
+    assert result.status == 0
+    assert result.environment == "Sandbox"
+    assert result.bundle_id == "com.example.app"
+    assert len(result.transactions) == 4
+
+    monthly = result.product_transactions("monthly")
+    assert [t.transaction_id for t in monthly] == ["1", "2", "3"]
+    assert monthly[0].is_trial_period is True
+    assert monthly[0].expires_date_ms == hour
+    assert [t.transaction_id for t in result.original_transactions("1")] == ["3", "1", "2"]
+    assert result.product_transactions("missing") == ()
+
+    assert result.active_subscription("monthly", at_ms=0).transaction_id == "1"
+    assert result.active_subscription("monthly", at_ms=hour + 1).transaction_id == "2"
+    assert result.active_subscription("monthly", at_ms=3 * hour) is None
+    assert result.active_subscription("monthly") is None
+    assert result.active_subscription("yearly", at_ms=4 * hour).transaction_id == "5"
+    assert result.active_subscription("yearly", at_ms=5 * hour) is None
+    assert result.active_subscription("missing", at_ms=0) is None
+
+
+def test_appstore_validation_result_from_in_app():
+    response = {"status": 0, "receipt": {"in_app": [{"product_id": "coins", "quantity": "3", "transaction_id": "7"}]}}
+    result = AppStoreValidationResult.from_response(response)
+
+    (transaction,) = result.transactions
+    assert isinstance(transaction, AppStoreTransaction)
+    assert transaction.quantity == 3
+    assert transaction.expires_date_ms is None
+    assert result.active_subscription("coins", at_ms=0) is None
+    assert not hasattr(transaction, "__dict__")
@@ -0,0 +1,78 @@
+import pytest
+
+from inapppy.cache import LRUCache, MemoryCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("b", "default") == "default"
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_lru_cache_delete_and_clear():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.delete("a")
+    cache.delete("missing")
+    assert cache.get("a") is None
+
+    cache.set("b", 2)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_lru_cache_bad_size():
+    with pytest.raises(ValueError):
+        LRUCache(maxsize=0)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_memory_cache_ttl():
+    clock = FakeClock()
+    cache = MemoryCache(maxsize=10, clock=clock)
+    cache.set("a", {"status": 0}, ttl=10)
+
+    clock.now += 9
+    assert cache.get("a") == {"status": 0}
+
+    clock.now += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_memory_cache_non_positive_ttl_is_not_stored():
+    cache = MemoryCache()
+    cache.set("a", 1, ttl=10)
+    cache.set("a", 2, ttl=0)
+    assert cache.get("a") is None
+
+
+def test_memory_cache_lru_eviction():
+    cache = MemoryCache(maxsize=2)
+    cache.set("a", 1, ttl=10)
+    cache.set("b", 2, ttl=10)
+    cache.get("a")
+    cache.set("c", 3, ttl=10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    cache.delete("a")
+    assert cache.get("a") is None
@@ -0,0 +1,141 @@
+import datetime
+import json
+import os
+import time
+
+import pytest
+
+from inapppy.credentials import (
+    REFRESH_MARGIN,
+    FileTokenCache,
+    SharedTokenCredentials,
+    TokenCache,
+    load_service_account_info,
+    shared_credentials,
+)
+from inapppy.errors import InAppPyError
+
+
+class FakeCredentials:
+    """Mints token-1, token-2, ... valid for lifetime seconds."""
+
+    def __init__(self, lifetime: int = 3600):
+        self.lifetime = lifetime
+        self.refreshes = 0
+        self.token = None
+        self.expiry = None
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.token = f"token-{self.refreshes}"
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.lifetime)
+
+
+def service_account_info(private_key) -> dict:
+    return {
+        "type": "service_account",
+        "client_email": "verifier@example.iam.gserviceaccount.com",
+        "private_key_id": "1",
+        "private_key": private_key.save_pkcs1().decode(),
+        "token_uri": "https://oauth2.example.com/token",
+    }
+
+
+def test_load_service_account_info(tmp_path):
+    keyfile = tmp_path / "credentials.json"
+    keyfile.write_text(json.dumps({"client_email": "first@example.com"}))
+
+    info = load_service_account_info(str(keyfile))
+    assert info == {"client_email": "first@example.com"}
+    assert load_service_account_info(str(keyfile)) is info
+
+    keyfile.write_text(json.dumps({"client_email": "second-account@example.com"}))
+    assert load_service_account_info(str(keyfile)) == {"client_email": "second-account@example.com"}
+
+    assert load_service_account_info(info) is info
+
+    with pytest.raises(InAppPyError, match="does not exist"):
+        load_service_account_info(str(tmp_path / "missing.json"))
+
+    with pytest.raises(InAppPyError, match="Unknown play console credentials format"):
+        load_service_account_info(42)
+
+
+def test_file_token_cache(tmp_path):
+    FileTokenCache(str(tmp_path)).set("key", "token", time.time() + 3600)
+
+    # another process
+    cache = FileTokenCache(str(tmp_path))
+    assert cache.get("key")[0] == "token"
+    assert cache.get("missing") is None
+
+    cache.delete("key")
+    assert FileTokenCache(str(tmp_path)).get("key") is None
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX permissions")
+def test_file_token_cache_permissions(tmp_path):
+    # an existing directory readable by everyone
+    tmp_path.chmod(0o755)
+    cache = FileTokenCache(str(tmp_path))
+    cache.set("key", "token", time.time() + 3600)
+
+    assert (tmp_path.stat().st_mode & 0o777) == 0o755
+    assert [path.stat().st_mode & 0o777 for path in tmp_path.iterdir()] == [0o600]
+
+
+def test_shared_token_credentials():
+    cache = TokenCache()
+    credentials = SharedTokenCredentials(FakeCredentials, "key", cache)
+    other = SharedTokenCredentials(FakeCredentials, "key", cache)
+
+    headers = {}
+    credentials.before_request(None, "GET", "https://example.com", headers)
+    assert headers == {"authorization": "Bearer token-1"}
+
+    # the second instance reuses the cached token
+    assert other.get_token(None) == "token-1"
+    assert other._credentials is None
+
+    # a rejected token is always refreshed
+    credentials.refresh(None)
+    assert cache.get("key")[0] == "token-2"
+    assert other.get_token(None) == "token-2"
+
+
+def test_shared_token_credentials_background_refresh():
+    cache = TokenCache()
+    credentials = SharedTokenCredentials(FakeCredentials, "key", cache)
+
+    # close to expiry, the current token is used while a new one is minted
+    cache.set("key", "old-token", time.time() + REFRESH_MARGIN - 10)
+    assert credentials.get_token(None) == "old-token"
+
+    deadline = time.time() + 5
+    while cache.get("key")[0] == "old-token" and time.time() < deadline:
+        time.sleep(0.01)
+    assert credentials.get_token(None) == "token-1"
+
+    # too close to expiry to be used
+    cache.set("key", "old-token", time.time() + 1)
+    assert credentials.get_token(None) == "token-2"
+
+
+def test_shared_credentials(google_play_keys, other_google_play_keys):
+    info = service_account_info(google_play_keys[1])
+    cache = TokenCache()
+
+    credentials = shared_credentials(info, "scope", cache)
+    assert shared_credentials(dict(info), "scope", cache) is credentials
+    assert shared_credentials(info, "other-scope", cache) is not credentials
+    assert shared_credentials(info, "scope", TokenCache()) is not credentials
+    # a rotated key
+    rotated = service_account_info(other_google_play_keys[1])
+    assert shared_credentials(rotated, "scope", cache) is not credentials
+
+    with pytest.raises(InAppPyError, match="Bad play console credentials"):
+        shared_credentials({"client_email": "verifier@example.com"}, "scope")
+    with pytest.raises(InAppPyError, match="Bad play console credentials"):
+        shared_credentials({"token_uri": "https://oauth2.example.com/token"}, "scope")
+    with pytest.raises(InAppPyError, match="Bad play console credentials"):
+        shared_credentials(dict(info, private_key="bad key"), "scope").credentials
@@ -0,0 +1,272 @@
+import base64
+import json
+
+import pytest
+import rsa
+
+from inapppy import GooglePlayValidator, GooglePlayValidatorRegistry, InAppPyValidationError, fastjson, signature
+from inapppy.googleplay import make_pem
+from inapppy.instrumentation import MetricsRecorder
+from inapppy.signature import CryptographySignatureBackend, RsaSignatureBackend, default_signature_backend
+
+requires_cryptography = pytest.mark.skipif(
+    signature.load_pem_public_key is None, reason="cryptography package is not installed"
+)
+BACKENDS = [RsaSignatureBackend, pytest.param(CryptographySignatureBackend, marks=requires_cryptography)]
+
+
+def sign(receipt: str, private_key: rsa.PrivateKey, hash_method: str = "SHA-1") -> str:
+    return base64.standard_b64encode(rsa.sign(receipt.encode(), private_key, hash_method)).decode()
+
+
+def make_receipt(**fields) -> str:
+    receipt = {
+        "orderId": "GPA.1234-5678-9012-34567",
+        "packageName": "com.example.app",
+        "productId": "com.example.app.coins",
+        "purchaseTime": 1553000000000,
+        "purchaseState": 0,
+        "purchaseToken": "purchase-token",
+    }
+    receipt.update(fields)
+    return json.dumps(receipt)
+
+
+@requires_cryptography
+def test_default_signature_backend():
+    assert default_signature_backend() is CryptographySignatureBackend
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_validate(google_play_keys, backend):
+    api_key, private_key = google_play_keys
+    validator = GooglePlayValidator("com.example.app", api_key, signature_backend=backend)
+    receipt = make_receipt()
+
+    assert validator.validate(receipt, sign(receipt, private_key)) == json.loads(receipt)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_public_key_type(google_play_keys, backend):
+    api_key, private_key = google_play_keys
+    validator = GooglePlayValidator("com.example.app", api_key, signature_backend=backend)
+
+    assert isinstance(validator.public_key, rsa.PublicKey)
+    assert validator.public_key == rsa.PublicKey(private_key.n, private_key.e)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_validate_rejects_bad_signatures(google_play_keys, backend):
+    api_key, private_key = google_play_keys
+    validator = GooglePlayValidator("com.example.app", api_key, signature_backend=backend)
+    receipt = make_receipt()
+    signature = sign(receipt, private_key)
+    _, other_private_key = rsa.newkeys(512)
+
+    for receipt_, signature_ in (
+        (make_receipt(purchaseToken="tampered"), signature),
+        (receipt, sign(receipt, other_private_key)),
+        (receipt, signature[:-8] + "AAAAAAA="),
+        (receipt, "not base64 !"),
+        (receipt, ""),
+    ):
+        with pytest.raises(InAppPyValidationError, match="Bad signature"):
+            validator.validate(receipt_, signature_)
+
+
+@requires_cryptography
+@pytest.mark.parametrize("hash_method", ["MD5", "SHA-1", "SHA-256", "SHA-512"])
+def test_backends_accept_the_same_signatures(google_play_keys, hash_method):
+    api_key, private_key = google_play_keys
+    receipt = make_receipt()
+    sig = base64.standard_b64decode(sign(receipt, private_key, hash_method))
+    backends = [backend(make_pem(api_key)) for backend in (RsaSignatureBackend, CryptographySignatureBackend)]
+
+    assert [backend.verify(receipt.encode(), sig) for backend in backends] == [True, True]
+    assert [backend.verify(b"other", sig) for backend in backends] == [False, False]
+    assert [backend.verify(receipt.encode(), sig[:-1]) for backend in backends] == [False, False]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_validate_receipt_checks(google_play_keys, backend):
+    api_key, private_key = google_play_keys
+    validator = GooglePlayValidator("com.example.app", api_key, signature_backend=backend)
+
+    for receipt, message in (
+        (make_receipt(packageName="com.example.other"), "Bundle ID"),
+        (make_receipt(purchaseState=1), "Item is not purchased"),
+        ("not json", "Bad receipt"),
+        (json.dumps({"purchaseState": 0}), "Bad receipt"),
+    ):
+        with pytest.raises(InAppPyValidationError, match=message):
+            validator.validate(receipt, sign(receipt, private_key))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_bad_api_key(backend):
+    for api_key in ("abc", "MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEA", "!!!!"):
+        with pytest.raises(InAppPyValidationError, match="Bad API key"):
+            GooglePlayValidator("com.example.app", api_key, signature_backend=backend)
+
+
+def test_empty_arguments():
+    with pytest.raises(InAppPyValidationError):
+        GooglePlayValidator("", "api-key")
+
+    with pytest.raises(InAppPyValidationError):
+        GooglePlayValidator("com.example.app", "")
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_validate_batch(google_play_keys, ordered):
+    api_key, private_key = google_play_keys
+    validator = GooglePlayValidator("com.example.app", api_key)
+
+    receipts = []
+    for i in range(25):
+        receipt = make_receipt(purchaseToken=f"token-{i}")
+        receipts.append((receipt, sign(receipt, private_key) if i % 5 else "bad-signature"))
+
+    results = list(validator.validate_batch(iter(receipts), workers=2, chunksize=4, ordered=ordered))
+
+    assert len(results) == 25
+    if ordered:
+        assert [result.index for result in results] == list(range(25))
+
+    for result in results:
+        assert result.item == receipts[result.index]
+        if result.index % 5:
+            assert result.ok
+            assert result.result["purchaseToken"] == f"token-{result.index}"
+        else:
+            assert isinstance(result.error, InAppPyValidationError)
+            assert result.error.message == "Bad signature"
+
+
+class FailingValidator(GooglePlayValidator):
+    """Raises an unexpected error for receipts without a purchase token."""
+
+    def validate(self, receipt, signature):
+        if "purchaseToken" not in receipt:
+            raise RuntimeError("unexpected")
+        return super().validate(receipt, signature)
+
+
+def test_validate_batch_unexpected_errors(google_play_keys):
+    api_key, private_key = google_play_keys
+    validator = FailingValidator("com.example.app", api_key)
+    receipts = [make_receipt(purchaseToken=f"token-{i}") for i in range(3)]
+    receipts.insert(1, json.dumps({"packageName": "com.example.app"}))
+
+    results = list(validator.validate_batch([(receipt, sign(receipt, private_key)) for receipt in receipts], workers=1))
+
+    # only the failing receipt of the chunk gets the error
+    assert [result.ok for result in results] == [True, False, True, True]
+    assert isinstance(results[1].error, RuntimeError)
+
+
+def test_registry_routes_by_package_name(google_play_keys, other_google_play_keys):
+    registry = GooglePlayValidatorRegistry(
+        {"com.example.app": google_play_keys[0], "com.example.other": other_google_play_keys[0]}
+    )
+    assert len(registry) == 2
+
+    for bundle_id, (_, private_key) in (
+        ("com.example.app", google_play_keys),
+        ("com.example.other", other_google_play_keys),
+    ):
+        receipt = make_receipt(packageName=bundle_id)
+        assert registry.validate(receipt, sign(receipt, private_key))["packageName"] == bundle_id
+
+    # signed with the key of another app
+    receipt = make_receipt(packageName="com.example.other")
+    with pytest.raises(InAppPyValidationError, match="Bad signature"):
+        registry.validate(receipt, sign(receipt, google_play_keys[1]))
+
+    receipt = make_receipt(packageName="com.example.unknown")
+    with pytest.raises(InAppPyValidationError, match="Unknown bundle ID"):
+        registry.validate(receipt, sign(receipt, google_play_keys[1]))
+
+    for receipt in ("not json", "[]", json.dumps({"purchaseState": 0})):
+        with pytest.raises(InAppPyValidationError, match="Bad receipt"):
+            registry.validate(receipt, sign(receipt, google_play_keys[1]))
+
+    receipt = make_receipt(purchaseState=1)
+    with pytest.raises(InAppPyValidationError, match="Item is not purchased"):
+        registry.validate(receipt, sign(receipt, google_play_keys[1]))
+
+
+def test_registry_key_rotation(google_play_keys, other_google_play_keys):
+    registry = GooglePlayValidatorRegistry({"com.example.app": google_play_keys[0]})
+    receipt = make_receipt()
+    old_signature = sign(receipt, google_play_keys[1])
+    new_signature = sign(receipt, other_google_play_keys[1])
+
+    registry.validate(receipt, old_signature)
+
+    registry.add_key("com.example.app", other_google_play_keys[0])
+    assert registry.api_keys == {"com.example.app": other_google_play_keys[0]}
+    registry.validate(receipt, new_signature)
+    with pytest.raises(InAppPyValidationError, match="Bad signature"):
+        registry.validate(receipt, old_signature)
+
+    registry.remove_key("com.example.app")
+    assert "com.example.app" not in registry
+    with pytest.raises(InAppPyValidationError, match="Unknown bundle ID"):
+        registry.validate(receipt, new_signature)
+
+
+def test_registry_validate_batch(google_play_keys, other_google_play_keys):
+    keys = {"com.example.app": google_play_keys, "com.example.other": other_google_play_keys}
+    registry = GooglePlayValidatorRegistry({bundle_id: key[0] for bundle_id, key in keys.items()})
+
+    receipts = []
+    for i in range(20):
+        bundle_id = "com.example.app" if i % 2 else "com.example.other"
+        receipt = make_receipt(packageName=bundle_id, purchaseToken=f"token-{i}")
+        receipts.append((receipt, sign(receipt, keys[bundle_id][1])))
+    receipts.append((make_receipt(packageName="com.example.unknown"), "signature"))
+
+    results = list(registry.validate_batch(receipts, workers=2, chunksize=3))
+
+    assert [result.ok for result in results] == [True] * 20 + [False]
+    assert [result.result["purchaseToken"] for result in results[:20]] == [f"token-{i}" for i in range(20)]
+    assert results[20].error.message == "Unknown bundle ID: com.example.unknown"
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_validate_accepts_bytes(google_play_keys, backend, use_orjson, monkeypatch):
+    if not use_orjson:
+        monkeypatch.setattr(fastjson, "orjson", None)
+
+    api_key, private_key = google_play_keys
+    validator = GooglePlayValidator("com.example.app", api_key, signature_backend=backend)
+    receipt = make_receipt()
+    signature = sign(receipt, private_key)
+
+    for data in (receipt.encode(), bytearray(receipt.encode()), memoryview(receipt.encode())):
+        assert validator.validate(data, signature) == json.loads(receipt)
+
+    with pytest.raises(InAppPyValidationError, match="Bad signature"):
+        validator.validate(memoryview(receipt.encode())[1:], signature)
+
+
+def test_registry_package_name_fallback(google_play_keys):
+    registry = GooglePlayValidatorRegistry({"com.example.app": google_play_keys[0]})
+    # escaped characters are not handled by the fast path
+    receipt = make_receipt().replace('"com.example.app"', '"com.example\\u002eapp"')
+    assert registry.validate(receipt, sign(receipt, google_play_keys[1]))["packageName"] == "com.example.app"
+
+
+def test_registry_instrumentation(google_play_keys):
+    metrics = MetricsRecorder()
+    registry = GooglePlayValidatorRegistry({"com.example.app": google_play_keys[0]}, instrumentation=metrics)
+    receipt = make_receipt()
+
+    registry.validate(receipt, sign(receipt, google_play_keys[1]))
+    with pytest.raises(InAppPyValidationError, match="Bad signature"):
+        registry.validate(receipt, "bad-signature")
+
+    assert metrics.histogram("googleplay.signature", valid=True).count == 1
+    assert metrics.histogram("googleplay.signature", valid=False).count == 1
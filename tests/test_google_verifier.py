@@ -1,12 +1,19 @@
 import datetime
 import os
-from unittest.mock import patch
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
 
 import httplib2
 import pytest
-from googleapiclient.http import HttpMock, RequestMockBuilder
+import requests
+from googleapiclient.http import HttpMock, HttpMockSequence, RequestMockBuilder
 
 from inapppy import GooglePlayVerifier, errors, googleplay
+from inapppy.cache import MemoryCache
+from inapppy.credentials import SharedTokenCredentials, TokenCache
+from inapppy.instrumentation import MetricsRecorder
+from inapppy.ratelimit import TokenBucket
 
 
 def test_google_verify_subscription():
@@ -163,3 +170,458 @@ def test_bad_request_product():
         with patch.object(googleplay, "build", return_value=build_mock_result):
             with pytest.raises(errors.GoogleError, match="Bad request"):
                 verifier.verify("broken_purchase_token", "product_scu")
+
+
+def test_service_is_built_once():
+    with patch.object(googleplay.GooglePlayVerifier, "_authorize", return_value=None):
+        verifier = GooglePlayVerifier("bundle_id", "private_key_path")
+
+        with patch.object(googleplay, "build", return_value=object()) as build_mock:
+            with patch.object(verifier, "check_purchase_product", return_value={"purchaseState": 0}):
+                verifier.verify("test-token", "test-product")
+                verifier.verify_with_result("test-token", "test-product")
+
+            assert build_mock.call_count == 1
+            assert verifier.service is build_mock.return_value
+
+
+def test_service_built_once_under_concurrent_use():
+    with patch.object(googleplay.GooglePlayVerifier, "_authorize", return_value=None):
+        verifier = GooglePlayVerifier("bundle_id", "private_key_path")
+
+        with patch.object(googleplay, "build", return_value=object()) as build_mock:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                services = list(executor.map(lambda _: verifier.service, range(32)))
+
+            assert build_mock.call_count == 1
+            assert all(service is build_mock.return_value for service in services)
+
+
+def test_service_from_discovery_document():
+    with patch.object(googleplay.GooglePlayVerifier, "_authorize", return_value=None):
+        verifier = GooglePlayVerifier(
+            "bundle_id", "private_key_path", discovery_document=datafile("androidpublisher.json")
+        )
+
+        with patch.object(googleplay, "build") as build_mock:
+            service = verifier.service
+            assert build_mock.call_count == 0
+
+        assert service.purchases().products().get is not None
+
+
+def test_service_from_missing_discovery_document():
+    with patch.object(googleplay.GooglePlayVerifier, "_authorize", return_value=None):
+        verifier = GooglePlayVerifier("bundle_id", "private_key_path", discovery_document="missing.json")
+
+        with pytest.raises(errors.InAppPyError):
+            verifier.service
+
+
+def make_requests_response(
+    status_code: int, content: bytes, reason: str = "OK", content_type: str = "application/json"
+) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = reason
+    response._content = content
+    response.headers["Content-Type"] = content_type
+    response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def test_pooled_http_request():
+    session = Mock()
+    session.request.return_value = make_requests_response(200, b'{"purchaseState": 0}')
+    http = googleplay.PooledHttp(session, timeout=5)
+
+    response, content = http.request("https://example.com/path", "POST", body="{}", headers={"x-foo": "bar"})
+
+    session.request.assert_called_once_with(
+        "POST", "https://example.com/path", data="{}", headers={"x-foo": "bar"}, timeout=5, allow_redirects=True
+    )
+    assert response.status == 200
+    assert response.reason == "OK"
+    assert response["content-type"] == "application/json"
+    assert "content-encoding" not in response
+    assert content == b'{"purchaseState": 0}'
+
+
+def test_verify_over_pooled_http():
+    session = Mock()
+    session.request.return_value = make_requests_response(200, b'{"purchaseState": 0, "orderId": "GPA.1"}')
+    verifier = GooglePlayVerifier(
+        "bundle_id",
+        "private_key_path",
+        discovery_document=datafile("androidpublisher.json"),
+        http=googleplay.PooledHttp(session),
+    )
+
+    assert verifier.verify("purchase_token", "product_sku") == {"purchaseState": 0, "orderId": "GPA.1"}
+    method, uri = session.request.call_args[0]
+    assert method == "GET"
+    assert "/bundle_id/purchases/products/product_sku/tokens/purchase_token" in uri
+
+
+def test_bad_request_over_pooled_http():
+    session = Mock()
+    session.request.return_value = make_requests_response(400, b'{"reason": "Bad request"}', reason="Bad request")
+    verifier = GooglePlayVerifier(
+        "bundle_id",
+        "private_key_path",
+        discovery_document=datafile("androidpublisher.json"),
+        http=googleplay.PooledHttp(session),
+    )
+
+    with pytest.raises(errors.GoogleError, match="Bad request"):
+        verifier.verify("broken_purchase_token", "product_sku", is_subscription=True)
+
+
+def test_verifier_instrumentation():
+    session = Mock()
+    session.request.side_effect = [
+        make_requests_response(200, b'{"purchaseState": 0}'),
+        make_requests_response(400, b'{"reason": "Bad request"}', reason="Bad request"),
+        make_requests_response(404, b"{}", reason="Not found"),
+        requests.ConnectionError(),
+    ]
+    metrics = MetricsRecorder()
+    verifier = GooglePlayVerifier(
+        "bundle_id",
+        "private_key_path",
+        discovery_document=datafile("androidpublisher.json"),
+        http=googleplay.PooledHttp(session),
+        cache=MemoryCache(),
+        instrumentation=metrics,
+    )
+
+    verifier.verify("purchase_token", "product_sku")
+    verifier.verify("purchase_token", "product_sku")
+    with pytest.raises(errors.GoogleError):
+        verifier.verify("broken_purchase_token", "subscription_sku", is_subscription=True)
+    with pytest.raises(googleplay._http_error()):
+        verifier.verify("missing_purchase_token", "product_sku")
+    with pytest.raises(requests.ConnectionError):
+        verifier.verify("other_purchase_token", "product_sku")
+
+    assert metrics.histogram("googleplay.request", kind="products").count == 3
+    assert metrics.histogram("googleplay.request", kind="subscriptions").count == 1
+    assert metrics.counter("googleplay.status", kind="products", status=200) == 1
+    assert metrics.counter("googleplay.status", kind="subscriptions", status=400) == 1
+    assert metrics.counter("googleplay.status", kind="products", status=404) == 1
+    assert metrics.counter("googleplay.error", kind="products", error="ConnectionError") == 1
+    assert metrics.counter("googleplay.cache", result="hit") == 1
+    assert metrics.counter("googleplay.cache", result="miss") == 4
+
+
+def test_verify_rate_limit_retries():
+    throttled = make_requests_response(429, b'{"error": {"code": 429}}', reason="Too many requests")
+    throttled.headers["Retry-After"] = "0"
+    session = Mock()
+    session.request.side_effect = [throttled, make_requests_response(200, b'{"purchaseState": 0}')]
+    metrics = MetricsRecorder()
+    verifier = GooglePlayVerifier(
+        "bundle_id",
+        "private_key_path",
+        discovery_document=datafile("androidpublisher.json"),
+        http=googleplay.PooledHttp(session),
+        instrumentation=metrics,
+    )
+
+    assert verifier.verify("purchase_token", "product_sku") == {"purchaseState": 0}
+    assert metrics.counter("googleplay.backoff", kind="products") == 1
+    assert metrics.counter("googleplay.quota", kind="products") == 2
+
+    session.request.side_effect = None
+    session.request.return_value = throttled
+    with pytest.raises(errors.GoogleRateLimitError, match="Rate limit exceeded"):
+        verifier.verify("purchase_token", "product_sku")
+    assert session.request.call_count == 5
+
+    # Retry-After beyond MAX_RETRY_AFTER is not waited for.
+    throttled.headers["Retry-After"] = "3600"
+    with pytest.raises(errors.GoogleRateLimitError):
+        verifier.verify("purchase_token", "product_sku")
+    assert session.request.call_count == 6
+
+
+def test_verify_rate_limiter():
+    session = Mock()
+    session.request.return_value = make_requests_response(200, b'{"purchaseState": 0}')
+    metrics = MetricsRecorder()
+    verifier = GooglePlayVerifier(
+        "bundle_id",
+        "private_key_path",
+        discovery_document=datafile("androidpublisher.json"),
+        http=googleplay.PooledHttp(session),
+        instrumentation=metrics,
+        rate_limiter=TokenBucket(rate=20, burst=2, max_wait=0.1),
+    )
+
+    started = time.perf_counter()
+    for _ in range(3):
+        verifier.verify("purchase_token", "product_sku")
+    # the third call waited for a token.
+    assert time.perf_counter() - started >= 0.04
+    assert metrics.histogram("googleplay.throttle", kind="products").count == 3
+
+    verifier.rate_limiter = TokenBucket(rate=1, burst=1, max_wait=0)
+    verifier.verify("purchase_token", "product_sku")
+    with pytest.raises(errors.GoogleRateLimitError, match="Rate limit budget exhausted"):
+        verifier.verify("purchase_token", "product_sku")
+    assert session.request.call_count == 4
+    assert metrics.counter("googleplay.shed", kind="products") == 1
+
+
+def batch_response(*parts: tuple) -> tuple:
+    """HttpMockSequence entry of a multipart batch response, parts are (status line, json body)."""
+    body = ""
+    for request_id, (status, content) in parts:
+        body += (
+            "--batch_boundary\n"
+            "Content-Type: application/http\n"
+            "Content-Transfer-Encoding: binary\n"
+            f"Content-ID: <response-batch + {request_id}>\n\n"
+            f"HTTP/1.1 {status}\n"
+            "Content-Type: application/json\r\n\r\n"
+            f"{content}\n\n"
+        )
+    body += "--batch_boundary--"
+    return {"status": "200", "content-type": 'multipart/mixed; boundary="batch_boundary"'}, body.encode()
+
+
+def batch_requests_response(*parts: tuple) -> tuple:
+    """make_requests_response arguments of a multipart batch response."""
+    headers, body = batch_response(*parts)
+    return 200, body, "OK", headers["content-type"]
+
+
+def test_verify_batch():
+    expiry = int(time.time() * 1000) + 10 ** 7
+    http = HttpMockSequence(
+        [
+            batch_response(
+                (0, ("200 OK", '{"purchaseState": 0}')),
+                (1, ("200 OK", f'{{"expiryTimeMillis": "{expiry}", "cancelReason": 1}}')),
+                (2, ("400 Bad request", '{"error": {"code": 400}}')),
+            ),
+            batch_response((0, ("404 Not found", '{"error": {"code": 404}}'))),
+        ]
+    )
+    metrics = MetricsRecorder()
+    verifier = GooglePlayVerifier(
+        "bundle_id",
+        "private_key_path",
+        discovery_document=datafile("androidpublisher.json"),
+        http=http,
+        cache=MemoryCache(),
+        instrumentation=metrics,
+    )
+    purchases = [
+        ("purchase_token", "product_sku"),
+        ("canceled_token", "subscription_sku", True),
+        ("bad_token", "product_sku", False),
+        ("missing_token", "product_sku"),
+    ]
+
+    results = list(verifier.verify_batch(iter(purchases), batch_size=3))
+
+    assert [result.index for result in results] == [0, 1, 2, 3]
+    assert [result.item for result in results] == purchases
+    assert results[0].result == {"purchaseState": 0}
+    assert isinstance(results[1].error, errors.GoogleError)
+    assert results[1].error.message == "Subscription is canceled"
+    assert results[2].error.message == "Bad request"
+    assert isinstance(results[3].error, googleplay._http_error())
+    assert metrics.histogram("googleplay.request", kind="batch").count == 2
+    assert metrics.counter("googleplay.quota", kind="batch") == 4
+    assert metrics.counter("googleplay.status", kind="subscriptions", status=200) == 1
+    assert metrics.counter("googleplay.status", kind="products", status=404) == 1
+
+    # successful responses are cached, no batch request is made for them.
+    results = list(verifier.verify_batch(purchases[:2], with_result=True))
+    assert results[0].result.is_canceled is False
+    assert results[1].result.is_canceled is True
+    assert metrics.histogram("googleplay.request", kind="batch").count == 2
+
+    with pytest.raises(ValueError):
+        next(verifier.verify_batch(purchases, batch_size=1001))
+
+
+def test_verify_batch_request_failure():
+    session = Mock()
+    session.request.side_effect = requests.ConnectionError()
+    verifier = GooglePlayVerifier(
+        "bundle_id",
+        "private_key_path",
+        discovery_document=datafile("androidpublisher.json"),
+        http=googleplay.PooledHttp(session),
+    )
+
+    results = list(verifier.verify_batch([("purchase_token", "product_sku")] * 3, batch_size=2))
+
+    assert session.request.call_count == 2
+    assert session.request.call_args[0][:2] == ("POST", "https://www.googleapis.com/batch/androidpublisher/v3")
+    assert all(isinstance(result.error, requests.ConnectionError) for result in results)
+
+
+class FakeCredentials:
+    """Mints token-1, token-2, ..."""
+
+    def __init__(self):
+        self.refreshes = 0
+        self.token = None
+        self.expiry = None
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.token = f"token-{self.refreshes}"
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+
+def test_verify_batch_refreshes_rejected_token():
+    fake_credentials = FakeCredentials()
+    credentials = SharedTokenCredentials(lambda: fake_credentials, "key", TokenCache())
+    credentials.refresh(None)
+
+    session = Mock(credentials=credentials)
+    session.request.side_effect = [
+        make_requests_response(
+            *batch_requests_response((0, ("200 OK", '{"purchaseState": 0}')), (1, ("401 Unauthorized", "{}")))
+        ),
+        make_requests_response(*batch_requests_response((1, ("200 OK", '{"purchaseState": 0}')))),
+    ]
+    verifier = GooglePlayVerifier(
+        "bundle_id",
+        "private_key_path",
+        discovery_document=datafile("androidpublisher.json"),
+        http=googleplay.PooledHttp(session),
+    )
+
+    results = list(verifier.verify_batch([("token-a", "product_sku"), ("token-b", "product_sku")]))
+
+    assert [result.ok for result in results] == [True, True]
+    assert fake_credentials.refreshes == 2
+    # only the rejected call is sent again, with the new token.
+    first, retry = (call[1]["data"] for call in session.request.call_args_list)
+    assert first.count("Bearer token-1") == 2
+    assert retry.count("Bearer token-2") == 1 and "token-a" not in retry
+
+
+def test_verify_coalesces_concurrent_identical_calls():
+    with patch.object(googleplay.GooglePlayVerifier, "_authorize", return_value=None):
+        verifier = GooglePlayVerifier("bundle_id", "private_key_path", coalesce_requests=True)
+
+    def check_purchase_product(purchase_token, product_sku, service):
+        time.sleep(0.05)
+        return {"purchaseState": 0, "token": purchase_token}
+
+    with patch.object(googleplay, "build", return_value=None):
+        with patch.object(verifier, "check_purchase_product", side_effect=check_purchase_product) as check_mock:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(lambda _: verifier.verify("token", "sku"), range(8)))
+                other = verifier.verify_with_result("other-token", "sku")
+
+    assert results == [{"purchaseState": 0, "token": "token"}] * 8
+    assert other.raw_response == {"purchaseState": 0, "token": "other-token"}
+    assert check_mock.call_count == 2
+    assert verifier.single_flight.stats() == {"upstream_calls": 2, "coalesced_calls": 7}
+
+
+def test_verify_without_coalescing():
+    with patch.object(googleplay.GooglePlayVerifier, "_authorize", return_value=None):
+        verifier = GooglePlayVerifier("bundle_id", "private_key_path")
+
+    assert verifier.single_flight is None
+    with patch.object(googleplay, "build", return_value=None):
+        with patch.object(verifier, "check_purchase_product", return_value={"purchaseState": 0}) as check_mock:
+            verifier.verify("token", "sku")
+            verifier.verify("token", "sku")
+
+    assert check_mock.call_count == 2
+
+
+def test_verify_response_cache():
+    with patch.object(googleplay.GooglePlayVerifier, "_authorize", return_value=None):
+        verifier = GooglePlayVerifier("bundle_id", "private_key_path", cache=MemoryCache())
+
+    with patch.object(googleplay, "build", return_value=None):
+        with patch.object(verifier, "check_purchase_product", return_value={"purchaseState": 0}) as check_mock:
+            verifier.verify("token", "sku")
+            verifier.verify_with_result("token", "sku")
+            assert check_mock.call_count == 1
+
+            # a different sku for the same token is a miss.
+            verifier.verify("token", "other-sku")
+            assert check_mock.call_count == 2
+
+            verifier.invalidate("token")
+            verifier.verify("token", "sku")
+            assert check_mock.call_count == 3
+
+
+def test_verify_response_cache_ttl():
+    cache = Mock()
+    cache.get.return_value = None
+    with patch.object(googleplay.GooglePlayVerifier, "_authorize", return_value=None):
+        verifier = GooglePlayVerifier("bundle_id", "private_key_path", cache=cache, cache_max_staleness=600)
+
+    expiry = int(time.time() * 1000) + 60 * 1000
+    with patch.object(googleplay, "build", return_value=None):
+        with patch.object(verifier, "check_purchase_subscription", return_value={"expiryTimeMillis": str(expiry)}):
+            verifier.verify("token", "sku", is_subscription=True)
+
+        key, entry, ttl = cache.set.call_args[0]
+        assert key == "inapppy:googleplay:bundle_id:token"
+        assert entry == {"product_sku": "sku", "is_subscription": True, "response": {"expiryTimeMillis": str(expiry)}}
+        assert 55 < ttl <= 60
+
+        with patch.object(verifier, "check_purchase_product", return_value={"purchaseState": 0}):
+            verifier.verify("token", "sku")
+        assert cache.set.call_args[0][2] == 600
+
+        # expired subscriptions may recover, missing or malformed expiries are not trusted, none is cached.
+        cache.set.reset_mock()
+        expired = str(int(time.time() * 1000) - 1000)
+        for response in ({"expiryTimeMillis": expired}, {}, {"expiryTimeMillis": "soon"}):
+            with patch.object(verifier, "check_purchase_subscription", return_value=response):
+                with pytest.raises(errors.GoogleError, match="Subscription expired"):
+                    verifier.verify("token", "sku", is_subscription=True)
+        assert cache.set.call_count == 0
+
+
+def test_google_verification_result():
+    response = {"expiryTimeMillis": "5000", "autoRenewing": True, "paymentState": 1}
+    now_ms = 4999
+
+    result = googleplay.GoogleVerificationResult(response, is_subscription=True, clock=lambda: now_ms)
+    assert not hasattr(result, "__dict__")
+    assert result.expiry_time_ms == 5000
+    assert result.auto_renewing is True
+    assert result.payment_state == 1
+    assert result.is_canceled is False
+    assert result.is_expired is False
+
+    # evaluated against the clock when read
+    now_ms = 5001
+    assert result.is_expired is True
+
+    result.is_expired = False
+    result.is_canceled = True
+    assert repr(result) == (
+        "GoogleVerificationResult(raw_response="
+        "{'expiryTimeMillis': '5000', 'autoRenewing': True, 'paymentState': 1}, "
+        "is_expired=False, is_canceled=True)"
+    )
+
+    result = googleplay.GoogleVerificationResult({}, True, False)
+    assert result.is_expired is True
+    assert result.is_canceled is False
+    assert result.expiry_time_ms is None
+    assert result.auto_renewing is None
+    assert result.payment_state is None
+
+    # products never expire, a missing purchase state is not a purchase
+    assert googleplay.GoogleVerificationResult({}).is_expired is False
+    assert googleplay.GoogleVerificationResult({}).is_canceled is True
+    assert googleplay.GoogleVerificationResult({"purchaseState": 0}).is_canceled is False
@@ -0,0 +1,57 @@
+import subprocess
+import sys
+
+import pytest
+
+import inapppy
+import inapppy.asyncio
+
+HEAVY_MODULES = ("aiohttp", "cryptography", "google", "googleapiclient", "httplib2", "ijson", "requests", "rsa")
+
+
+def import_times(statement: str) -> dict:
+    """Cumulative import time in microseconds, by top level module, of a fresh interpreter running statement."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True, check=True
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        module = module.strip()
+        if module.startswith(("inapppy", *HEAVY_MODULES)) and "." not in module:
+            times[module] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "import inapppy",
+        "import inapppy.asyncio",
+        "from inapppy import InAppPyValidationError",
+        "from inapppy import AppStoreValidator",
+        "from inapppy import GooglePlayValidator, GooglePlayValidatorRegistry, GooglePlayVerifier",
+    ],
+)
+def test_heavy_dependencies_are_imported_lazily(statement):
+    assert not set(import_times(statement)) & set(HEAVY_MODULES)
+
+
+def test_import_time_budget():
+    # generous, the eager imports took more than half a second, the lazy package takes a few milliseconds.
+    assert import_times("import inapppy")["inapppy"] < 100_000
+
+
+def test_lazy_attributes():
+    from inapppy.appstore import AppStoreValidator
+    from inapppy.asyncio.googleplay import GooglePlayVerifier
+
+    assert inapppy.AppStoreValidator is AppStoreValidator
+    assert inapppy.asyncio.GooglePlayVerifier is GooglePlayVerifier
+    assert set(inapppy.__all__) <= set(dir(inapppy))
+
+    with pytest.raises(AttributeError):
+        inapppy.MissingValidator
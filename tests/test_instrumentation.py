@@ -0,0 +1,80 @@
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from inapppy.instrumentation import Histogram, Instrumentation, MetricsRecorder, null_instrumentation
+
+
+def test_null_instrumentation():
+    assert isinstance(null_instrumentation, Instrumentation)
+    assert not null_instrumentation.enabled
+
+    null_instrumentation.timing("appstore.request", 0.1, environment="production")
+    null_instrumentation.increment("appstore.status", status=0)
+
+
+def test_histogram():
+    histogram = Histogram()
+    assert histogram.quantile(0.5) is None
+
+    for millis in range(1, 101):
+        histogram.observe(millis / 1000)
+
+    assert histogram.count == 100
+    assert histogram.min == 0.001
+    assert histogram.max == 0.1
+    assert abs(histogram.total - 5.05) < 1e-9
+    # quantiles are bucket upper bounds, never more than ~41% above the exact value.
+    assert 0.05 <= histogram.quantile(0.5) <= 0.05 * 1.42
+    assert 0.099 <= histogram.quantile(0.99) <= 0.1
+    assert histogram.quantile(1) == 0.1
+
+    histogram.observe(1000)
+    assert histogram.quantile(1) == 1000
+
+
+def test_metrics_recorder():
+    metrics = MetricsRecorder()
+
+    metrics.timing("appstore.request", 0.2, environment="production")
+    metrics.timing("appstore.request", 0.4, environment="production")
+    metrics.timing("appstore.request", 0.1, environment="sandbox")
+    metrics.increment("appstore.status", status=21007)
+    metrics.increment("appstore.status", status=21007)
+    metrics.increment("appstore.env_retry")
+
+    assert metrics.histogram("appstore.request", environment="production").count == 2
+    assert metrics.histogram("appstore.request") is None
+    assert metrics.counter("appstore.status", status=21007) == 2
+    assert metrics.counter("appstore.status", status="21007") == 2
+    assert metrics.counter("appstore.status", status=0) == 0
+
+    snapshot = metrics.snapshot()
+    assert set(snapshot["timings"]) == {
+        "appstore.request{environment=production}",
+        "appstore.request{environment=sandbox}",
+    }
+    assert snapshot["timings"]["appstore.request{environment=production}"]["max"] == 0.4
+    assert snapshot["counters"] == {"appstore.status{status=21007}": 2, "appstore.env_retry": 1}
+
+    file = io.StringIO()
+    metrics.dump(file)
+    assert json.loads(file.getvalue()) == json.loads(json.dumps(snapshot))
+
+    metrics.reset()
+    assert metrics.snapshot() == {"timings": {}, "counters": {}}
+
+
+def test_metrics_recorder_is_thread_safe():
+    metrics = MetricsRecorder()
+
+    def record(_):
+        for _ in range(1000):
+            metrics.increment("googleplay.status", kind="products", status=200)
+            metrics.timing("googleplay.request", 0.01, kind="products")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(record, range(8)))
+
+    assert metrics.counter("googleplay.status", kind="products", status=200) == 8000
+    assert metrics.histogram("googleplay.request", kind="products").count == 8000
@@ -0,0 +1,56 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+
+import pytest
+
+from inapppy.ratelimit import TokenBucket, parse_retry_after
+
+
+def test_token_bucket():
+    now = [0.0]
+    bucket = TokenBucket(rate=2, burst=3, clock=lambda: now[0])
+
+    # the burst goes through at once, later calls queue behind it.
+    assert [bucket.reserve() for _ in range(5)] == [0, 0, 0, 0.5, 1.0]
+    assert bucket.available == -2
+
+    now[0] = 10.0
+    assert bucket.available == 3
+
+    bucket.backoff(2)
+    assert bucket.reserve() == pytest.approx(2.5)
+
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_token_bucket_sheds_load():
+    now = [0.0]
+    bucket = TokenBucket(rate=1, burst=1, max_wait=0.5, clock=lambda: now[0])
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() is None
+    now[0] = 0.5
+    assert bucket.reserve() == 0.5
+    assert bucket.reserve() is None
+
+
+def test_token_bucket_is_shared_between_threads():
+    bucket = TokenBucket(rate=1000, burst=1)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        waits = sorted(executor.map(lambda _: bucket.reserve(), range(100)))
+
+    # every call got its own slot, a millisecond apart.
+    assert waits[0] == 0
+    assert 0.05 < waits[-1] <= 0.099
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("") is None
+    assert parse_retry_after("3") == 3
+    assert parse_retry_after("-1") == 0
+    assert 8 < parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert parse_retry_after("later") is None
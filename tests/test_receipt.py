@@ -0,0 +1,125 @@
+import base64
+import os
+
+import pytest
+
+from inapppy.errors import InAppPyValidationError, ReceiptError
+from inapppy.receipt import decode_receipt, receipt_bytes
+
+
+def datafile(filename):
+    return os.path.join(os.path.dirname(__file__), "data", filename)
+
+
+def sample_receipt(name: str) -> str:
+    with open(datafile(name)) as file:
+        return file.read()
+
+
+def test_decode_sandbox_receipt():
+    receipt = decode_receipt(sample_receipt("appstore_receipt_sandbox.b64"))
+
+    assert receipt.environment == "ProductionSandbox"
+    assert receipt.sandbox
+    assert receipt.bundle_id == "com.example.app"
+    assert receipt.application_version == "2.1"
+    assert receipt.original_application_version == "1.0"
+    assert receipt.creation_date_ms == 1559347200000
+    assert receipt.expiration_date_ms is None
+
+    assert [transaction.product_id for transaction in receipt.in_app] == ["com.example.app.monthly"] * 3 + [
+        "com.example.app.coins"
+    ]
+    first, *_, coins = receipt.in_app
+    assert first.transaction_id == "1000000000"
+    assert first.original_transaction_id == "1000000000"
+    assert first.purchase_date_ms == 1552996800000
+    assert first.expires_date_ms == 1555675200000
+    assert first.is_trial_period
+    assert not first.is_in_intro_offer_period
+
+    assert coins.quantity == 5
+    assert coins.expires_date_ms is None
+    assert coins.purchase_date_ms == 1556699400250
+
+
+def test_decode_ber_receipt():
+    # indefinite lengths and a chunked octet string
+    receipt = decode_receipt(sample_receipt("appstore_receipt_production.b64"))
+
+    assert receipt.environment == "Production"
+    assert not receipt.sandbox
+    assert receipt.application_version == "3.0"
+    assert receipt.original_application_version == "1.2"
+    assert [transaction.product_id for transaction in receipt.in_app] == ["com.example.app.lifetime"]
+
+
+def test_decode_without_in_app():
+    receipt = decode_receipt(sample_receipt("appstore_receipt_sandbox.b64"), in_app=False)
+
+    assert receipt.bundle_id == "com.example.app"
+    assert receipt.in_app == ()
+
+
+def test_validation_result():
+    result = decode_receipt(sample_receipt("appstore_receipt_sandbox.b64")).validation_result()
+
+    assert result.status is None
+    assert result.environment == "Sandbox"
+    assert result.bundle_id == "com.example.app"
+    assert len(result.product_transactions("com.example.app.monthly")) == 3
+    assert result.active_subscription("com.example.app.monthly", at_ms=1559347200000 + 1).transaction_id == (
+        "1000000002"
+    )
+
+
+def test_decode_receipt_bytes(appstore_receipt):
+    receipt = appstore_receipt(bundle_id="com.example.other")
+
+    assert decode_receipt(receipt.encode()).bundle_id == "com.example.other"
+    assert receipt_bytes(receipt[:40] + "\n" + receipt[40:]) == base64.b64decode(receipt)
+
+
+@pytest.mark.parametrize(
+    "receipt, message",
+    [
+        ("not base64!", "Bad receipt encoding"),
+        ("", "Malformed receipt"),
+        (base64.b64encode(b"garbage").decode(), "Malformed receipt"),
+        # a DER SEQUENCE, but not a PKCS#7 signedData
+        (base64.b64encode(bytes.fromhex("3003020101")).decode(), "Malformed receipt"),
+    ],
+)
+def test_decode_rejects_malformed_receipts(receipt, message):
+    with pytest.raises(ReceiptError, match=message):
+        decode_receipt(receipt)
+
+
+def test_decode_rejects_truncated_receipts():
+    der = base64.b64decode(sample_receipt("appstore_receipt_sandbox.b64"))
+
+    for size in (1, 2, 10, len(der) // 2, len(der) - 1):
+        with pytest.raises(ReceiptError, match="Malformed receipt"):
+            decode_receipt(base64.b64encode(der[:size]))
+
+
+def test_decode_rejects_deeply_nested_receipts():
+    # indefinite length SEQUENCEs nested inside each other, deeper than the recursion limit
+    with pytest.raises(ReceiptError, match="Malformed receipt"):
+        decode_receipt(base64.b64encode(b"\x30\x80" * 3000))
+
+
+def test_decode_rejects_receipts_without_bundle_id(appstore_receipt):
+    with pytest.raises(ReceiptError, match="Malformed receipt"):
+        decode_receipt(appstore_receipt(bundle_id=b"\x02\x01\x01"))
+
+
+def test_decode_rejects_bad_dates(appstore_receipt):
+    with pytest.raises(ReceiptError, match="Malformed receipt"):
+        decode_receipt(appstore_receipt(creation_date="2019-03-19 12:00:00"))
+    with pytest.raises(ReceiptError, match="Malformed receipt"):
+        decode_receipt(appstore_receipt(creation_date="2019-03-19Txx:00:00Z"))
+
+
+def test_receipt_error_is_a_validation_error():
+    assert issubclass(ReceiptError, InAppPyValidationError)
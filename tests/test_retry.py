@@ -0,0 +1,52 @@
+import pytest
+
+from inapppy.retry import CircuitBreaker, RetryPolicy
+
+
+def test_retry_policy_backoff():
+    policy = RetryPolicy(attempts=5, backoff=0.1, max_backoff=0.3)
+
+    for retry, cap in enumerate((0.1, 0.2, 0.3, 0.3)):
+        delays = [policy.delay(retry) for _ in range(100)]
+        assert all(0 <= delay <= cap for delay in delays)
+        # full jitter spreads the retries of concurrent callers.
+        assert len(set(delays)) > 1
+
+    with pytest.raises(ValueError):
+        RetryPolicy(attempts=0)
+
+
+def test_circuit_breaker():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=lambda: now[0])
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    # half open lets a single trial call through, its failure opens the circuit again.
+    now[0] = 10.0
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # a trial that never records its outcome is given up after reset_timeout.
+    now[0] = 20.0
+    assert breaker.allow()
+    now[0] = 29.0
+    assert not breaker.allow()
+    now[0] = 30.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
@@ -0,0 +1,56 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from inapppy.singleflight import SingleFlight
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow(value):
+        calls.append(value)
+        started.set()
+        time.sleep(0.05)
+        return {"value": value}
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        leader = executor.submit(single_flight.do, "key", slow, 1)
+        started.wait()
+        followers = [executor.submit(single_flight.do, "key", slow, 2) for _ in range(7)]
+        results = [leader.result()] + [follower.result() for follower in followers]
+
+    assert calls == [1]
+    assert all(result is results[0] for result in results)
+
+    # once the flight landed the next call runs again.
+    assert single_flight.do("key", slow, 3) == {"value": 3}
+
+
+def test_single_flight_shares_exceptions():
+    single_flight = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.05)
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(single_flight.do, "key", failing)
+        started.wait()
+        follower = executor.submit(single_flight.do, "key", failing)
+
+        for future in (leader, follower):
+            with pytest.raises(ValueError, match="boom"):
+                future.result()
+
+
+def test_single_flight_different_keys_do_not_coalesce():
+    single_flight = SingleFlight()
+    assert single_flight.do("a", lambda: 1) == 1
+    assert single_flight.do("b", lambda: 2) == 2
@@ -0,0 +1,76 @@
+import io
+import json
+
+import pytest
+
+from inapppy import streaming
+from inapppy.streaming import LatestReceiptFilter, ResponseCompactor, compact_response
+
+requires_ijson = pytest.mark.skipif(streaming.ijson is None, reason="ijson package is not installed")
+
+
+def transaction(original_transaction_id: str, purchase_date_ms: int) -> dict:
+    return {
+        "original_transaction_id": original_transaction_id,
+        "transaction_id": f"{original_transaction_id}-{purchase_date_ms}",
+        "purchase_date_ms": str(purchase_date_ms),
+    }
+
+
+def make_response(renewals: int) -> dict:
+    history = [transaction(otid, day) for day in range(renewals) for otid in ("1000", "2000")]
+    return {
+        "status": 0,
+        "environment": "Production",
+        "receipt": {"bundle_id": "com.example.app", "in_app": history},
+        "latest_receipt_info": history,
+        "latest_receipt": "x" * 1000,
+        "pending_renewal_info": [{"original_transaction_id": "1000", "auto_renew_status": "1"}],
+    }
+
+
+def compact(response: dict, **kwargs) -> dict:
+    return compact_response(io.BytesIO(json.dumps(response).encode()), **kwargs)
+
+
+@requires_ijson
+def test_keeps_newest_transactions_per_original_transaction():
+    response = make_response(renewals=50)
+    result = compact(response, keep_transactions=2)
+
+    newest = [transaction("1000", 49), transaction("2000", 49), transaction("1000", 48), transaction("2000", 48)]
+    assert result["latest_receipt_info"] == newest
+    assert result["receipt"]["in_app"] == newest
+    assert result["receipt"]["bundle_id"] == "com.example.app"
+    assert result["pending_renewal_info"] == response["pending_renewal_info"]
+    assert result["latest_receipt"] == response["latest_receipt"]
+
+
+@requires_ijson
+def test_drop_latest_receipt():
+    result = compact(make_response(renewals=3), drop_latest_receipt=True)
+    assert result["latest_receipt"] == ""
+    assert len(result["latest_receipt_info"]) == 2
+
+
+@requires_ijson
+def test_unchanged_without_transaction_arrays():
+    for response in ({"status": 21002}, {"status": 0, "receipt": {"in_app": []}}, {"status": 0, "receipt": None}):
+        assert compact(response) == response
+
+
+def test_keep_transactions_must_be_positive():
+    with pytest.raises(ValueError):
+        ResponseCompactor(keep_transactions=0)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 4096])
+def test_latest_receipt_filter(chunk_size):
+    response = {"note": "latest_receipt", "latest_receipt_info": [], "latest_receipt": "QUJD" * 100, "status": 0}
+    body = json.dumps(response).encode()
+
+    value_filter = LatestReceiptFilter()
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]  # noqa: E203
+    filtered = b"".join(value_filter.feed(chunk) for chunk in chunks) + value_filter.feed(b"", final=True)
+
+    assert json.loads(filtered) == dict(response, latest_receipt="")